@@ -0,0 +1,113 @@
+from app.config import settings
+from app import metrics
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class AdmissionController:
+    # Limita las decisiones concurrentes y encola las siguientes hasta un máximo;
+    # más allá se responde 429 para que la latencia de las admitidas se mantenga estable
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float, retry_after: int):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.queue: "deque[tuple[int, asyncio.Future]]" = deque()
+        self.queued_weight = 0
+        self.rejected = 0
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        metrics.ADMISSION_REJECTED.labels(reason=reason).inc()
+        logger.warning(f"Transacción rechazada por sobrecarga ({reason}): activas={self.active} en cola={self.queued_weight}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many transactions in progress, retry later",
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+    def check_capacity(self, weight: int = 1):
+        # Para el modo asíncrono: rechazar en el envío si la cola ya está llena
+        weight = min(weight, self.max_concurrent)
+        if self.active + weight > self.max_concurrent and self.queued_weight + weight > self.max_queue:
+            self._reject("queue_full")
+
+    async def acquire(self, weight: int = 1) -> int:
+        weight = min(weight, self.max_concurrent)
+        if not self.queue and self.active + weight <= self.max_concurrent:
+            self.active += weight
+            metrics.ADMISSION_QUEUE_WAIT_SECONDS.observe(0)
+            return weight
+
+        if self.queued_weight + weight > self.max_queue:
+            self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (weight, future)
+        self.queue.append(entry)
+        self.queued_weight += weight
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(entry)
+            self._reject("queue_timeout")
+        except asyncio.CancelledError:
+            self._abandon(entry)
+            raise
+        metrics.ADMISSION_QUEUE_WAIT_SECONDS.observe(time.monotonic() - started)
+        return weight
+
+    def _abandon(self, entry):
+        weight, future = entry
+        if future.done() and not future.cancelled():
+            # El hueco ya se nos había concedido: lo devolvemos
+            self.release(weight)
+            return
+        future.cancel()
+        try:
+            self.queue.remove(entry)
+            self.queued_weight -= weight
+        except ValueError:
+            pass
+
+    def release(self, weight: int = 1):
+        self.active -= weight
+        # FIFO: se despierta a los primeros de la cola mientras quepan
+        while self.queue and self.active + self.queue[0][0] <= self.max_concurrent:
+            next_weight, future = self.queue.popleft()
+            self.queued_weight -= next_weight
+            if future.cancelled():
+                continue
+            self.active += next_weight
+            future.set_result(True)
+
+    @asynccontextmanager
+    async def slot(self, weight: int = 1):
+        granted = await self.acquire(weight)
+        try:
+            yield
+        finally:
+            self.release(granted)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self.queued_weight,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected
+        }
+
+admission = AdmissionController(
+    settings.ADMISSION_MAX_CONCURRENT,
+    settings.ADMISSION_MAX_QUEUE,
+    settings.ADMISSION_QUEUE_TIMEOUT,
+    settings.ADMISSION_RETRY_AFTER
+)
@@ -0,0 +1,134 @@
+from app.config import settings
+from app import metrics
+from fastapi import WebSocket
+from typing import Awaitable, Callable, Optional, Union
+import asyncio
+import json
+import logging
+import time
+import zlib
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa json de la stdlib
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Codificaciones que un bot puede pedir al conectar (/ws/bot?encoding=zlib)
+ENCODINGS = ("json", "zlib")
+
+def encode_json(message: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(message)
+    return json.dumps(message, separators=(",", ":")).encode()
+
+class OutboundFrame:
+    # Mensaje codificado una sola vez y compartido por todas las conexiones
+    __slots__ = ("raw", "_text", "_compressed")
+
+    def __init__(self, message: dict):
+        self.raw = encode_json(message)
+        self._text: Optional[str] = None
+        self._compressed: Optional[bytes] = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.raw.decode()
+        return self._text
+
+    def for_encoding(self, encoding: str) -> Union[str, bytes]:
+        # Los payloads pequeños no compensan la compresión: van como texto también a los bots zlib
+        if encoding == "zlib" and len(self.raw) >= settings.WS_COMPRESS_MIN_BYTES:
+            if self._compressed is None:
+                self._compressed = zlib.compress(self.raw, settings.WS_COMPRESS_LEVEL)
+            return self._compressed
+        return self.text
+
+class BotConnection:
+    # Conexión de un bot con su propia cola de salida y tarea escritora:
+    # un bot lento solo se retrasa a sí mismo, no al resto ni al broadcast
+    def __init__(self, websocket: WebSocket, conn_id: str, on_evict: Callable[["BotConnection", str], Awaitable[None]], encoding: str = "json"):
+        self.websocket = websocket
+        self.conn_id = conn_id
+        self.encoding = encoding
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.degraded = False
+        self.closed = False
+        # Heartbeat: last_seen se actualiza con cualquier mensaje del bot; heartbeat indica que contesta pings
+        self.last_seen = time.monotonic()
+        self.heartbeat = False
+        self.ping_sent_at: Optional[float] = None
+        self.rtt: Optional[float] = None
+        self._on_evict = on_evict
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, frame: OutboundFrame) -> bool:
+        # Devuelve True si el bot recibirá el mensaje y se debe esperar su veredicto
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self._on_overflow()
+            return False
+        return not self.degraded
+
+    def _on_overflow(self):
+        if settings.WS_SLOW_CONSUMER_POLICY == "evict":
+            asyncio.create_task(self.evict("queue_overflow"))
+            return
+        # "degrade": el bot sigue conectado pero no se cuenta para el quorum hasta vaciar su cola
+        if not self.degraded:
+            logger.warning(f"Bot {self.conn_id} degradado: cola de salida llena")
+            metrics.WS_SLOW_CONSUMERS.labels(action="degraded").inc()
+        self.degraded = True
+
+    async def _write_loop(self):
+        while True:
+            frame = await self.queue.get()
+            payload = frame.for_encoding(self.encoding)
+            try:
+                if isinstance(payload, bytes):
+                    send = self.websocket.send_bytes(payload)
+                else:
+                    send = self.websocket.send_text(payload)
+                await asyncio.wait_for(send, timeout=settings.WS_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                # Un envío cancelado a medias deja el stream inutilizable: se expulsa al bot
+                await self.evict("send_timeout")
+                return
+            except Exception as e:
+                logger.error(f"Error en broadcast: {e}")
+                await self.evict("send_error")
+                return
+            if self.degraded and self.queue.qsize() <= self.queue.maxsize // 2:
+                logger.info(f"Bot {self.conn_id} recuperado tras vaciar su cola")
+                self.degraded = False
+
+    def mark_alive(self):
+        self.last_seen = time.monotonic()
+
+    def record_pong(self):
+        self.heartbeat = True
+        if self.ping_sent_at is not None:
+            self.rtt = time.monotonic() - self.ping_sent_at
+
+    async def evict(self, reason: str):
+        if self.closed:
+            return
+        logger.warning(f"Expulsando bot {self.conn_id} ({reason})")
+        metrics.WS_SLOW_CONSUMERS.labels(action=reason).inc()
+        await self._on_evict(self, reason)
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
@@ -0,0 +1,76 @@
+from app.config import settings
+from typing import Dict, Iterable
+import bisect
+
+# Límites superiores (segundos) de los buckets del histograma de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS, window: int = 1000):
+        self.buckets = buckets
+        self.counts = [0.0] * (len(buckets) + 1)  # el último bucket es +Inf
+        self.count = 0.0
+        self.sum = 0.0
+        self.window = window
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        # Decaimiento: al superar la ventana se reduce el peso del historial a la mitad
+        # para que el histograma siga los cambios de comportamiento del bot
+        if self.count > self.window:
+            self.counts = [c / 2 for c in self.counts]
+            self.count /= 2
+            self.sum /= 2
+
+    def percentile(self, p: float) -> float:
+        if self.count == 0:
+            return float("inf")
+        target = p * self.count
+        cumulative = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+    def summary(self) -> dict:
+        return {
+            "count": round(self.count, 1),
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99)
+        }
+
+class BotLatencyTracker:
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+    def observe(self, bot: str, seconds: float):
+        histogram = self.histograms.get(bot)
+        if histogram is None:
+            histogram = self.histograms[bot] = LatencyHistogram(window=settings.BOT_LATENCY_WINDOW)
+        histogram.observe(seconds)
+
+    def forget(self, bot: str):
+        self.histograms.pop(bot, None)
+
+    def deadline_for(self, bots: Iterable[str]) -> float:
+        # Espera = percentil configurado del bot más lento esperado, con margen, suelo y techo
+        ceiling = settings.BOT_RESPONSE_TIMEOUT
+        if not settings.ADAPTIVE_BOT_DEADLINES:
+            return ceiling
+
+        deadline = settings.BOT_DEADLINE_FLOOR
+        for bot in bots:
+            histogram = self.histograms.get(bot)
+            if histogram is None or histogram.count < settings.BOT_DEADLINE_MIN_SAMPLES:
+                # Sin historial suficiente no arriesgamos: se espera el máximo
+                return ceiling
+            deadline = max(deadline, histogram.percentile(settings.BOT_DEADLINE_PERCENTILE) * settings.BOT_DEADLINE_MARGIN)
+        return min(deadline, ceiling)
+
+    def stats(self) -> dict:
+        return {bot: histogram.summary() for bot, histogram in self.histograms.items()}
@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cadenas que sabemos distinguir por el formato de la dirección
+CHAINS = ("evm", "multiversx")
+
+def detect_chain(address: str) -> Optional[str]:
+    address = (address or "").strip().lower()
+    if address.startswith("erd1"):
+        return "multiversx"
+    if address.startswith("0x"):
+        return "evm"
+    return None
+
+def parse_value(value) -> int:
+    # Valores en wei / unidades mínimas, en decimal o hexadecimal
+    try:
+        return int(str(value).strip(), 0)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return 0
+
+def normalize_data(data: str) -> str:
+    data = (data or "").strip().lower()
+    return data[2:] if data.startswith("0x") else data
+
+@dataclass(frozen=True)
+class BotCapabilities:
+    # None en chains = cualquier cadena; prefixes vacío = cualquier calldata
+    chains: Optional[FrozenSet[str]] = None
+    prefixes: Tuple[str, ...] = ()
+    min_value: int = 0
+
+    @classmethod
+    def from_manifest(cls, manifest: dict) -> "BotCapabilities":
+        chains = {str(c).strip().lower() for c in manifest.get("chains") or []}
+        unknown = chains.difference(CHAINS)
+        if unknown:
+            # Una cadena mal escrita dejaría al bot sin transacciones: se ignora y, si no queda
+            # ninguna válida, el bot lo recibe todo como uno sin manifiesto
+            logger.warning(f"Cadenas desconocidas en el manifiesto de {manifest.get('bot')}: {sorted(unknown)}")
+            chains -= unknown
+        prefixes = manifest.get("prefixes") or manifest.get("selectors") or []
+        return cls(
+            chains=frozenset(chains) if chains else None,
+            prefixes=tuple(normalize_data(p) for p in prefixes if p),
+            min_value=parse_value(manifest.get("min_value", 0))
+        )
+
+    def matches(self, chain: Optional[str], data: str, value: int) -> bool:
+        # Una cadena desconocida se envía a todos: mejor un veredicto de más que uno de menos
+        if self.chains is not None and chain is not None and chain not in self.chains:
+            return False
+        if self.prefixes and not data.startswith(self.prefixes):
+            return False
+        return value >= self.min_value
+
+class RoutingIndex:
+    # Índice de manifiestos por cadena para decidir qué bots reciben cada transacción.
+    # Los bots que no han enviado manifiesto lo reciben todo, como antes
+    def __init__(self):
+        self.capabilities: Dict[str, BotCapabilities] = {}
+        self.by_chain: Dict[str, Set[str]] = {}
+        self.any_chain: Set[str] = set()
+
+    def register(self, conn_id: str, capabilities: BotCapabilities):
+        self.remove(conn_id)
+        self.capabilities[conn_id] = capabilities
+        if capabilities.chains is None:
+            self.any_chain.add(conn_id)
+        else:
+            for chain in capabilities.chains:
+                self.by_chain.setdefault(chain, set()).add(conn_id)
+
+    def remove(self, conn_id: str):
+        capabilities = self.capabilities.pop(conn_id, None)
+        if capabilities is None:
+            return
+        self.any_chain.discard(conn_id)
+        for chain in capabilities.chains or ():
+            bots = self.by_chain.get(chain)
+            if bots is not None:
+                bots.discard(conn_id)
+                if not bots:
+                    del self.by_chain[chain]
+
+    def route(self, payload: dict, conn_ids: Iterable[str]) -> Set[str]:
+        # payload es el de build_bot_payload: transactions, hash, safewallet
+        # Solo se eligen bots de conn_ids, tengan manifiesto o no
+        conn_ids = set(conn_ids)
+        targets = {conn_id for conn_id in conn_ids if conn_id not in self.capabilities}
+        default_chain = detect_chain(payload.get("safewallet", ""))
+        for tx in payload.get("transactions", []):
+            chain = detect_chain(tx.get("to", "")) or default_chain
+            if chain is None:
+                candidates = conn_ids & self.capabilities.keys()
+            else:
+                candidates = conn_ids & (self.any_chain | self.by_chain.get(chain, set()))
+            data = normalize_data(tx.get("data", ""))
+            value = parse_value(tx.get("value", 0))
+            for conn_id in candidates:
+                if conn_id not in targets and self.capabilities[conn_id].matches(chain, data, value):
+                    targets.add(conn_id)
+        return targets
+
+    def stats(self) -> dict:
+        return {
+            "bots_with_manifest": len(self.capabilities),
+            "any_chain": len(self.any_chain),
+            "by_chain": {chain: len(bots) for chain, bots in self.by_chain.items()}
+        }
@@ -4,5 +4,50 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "FastAPI Simple API"
     DATABASE_URL: str = "sqlite:///./test.db"
     #TX_AGENT_URL: str = "https://agent-llrl.onrender.com/api/v1/analyze-transaction"  # URL del servicio txAgent
+    TX_AGENT_MODE: str = "remote"  # "remote" (HTTP a TX_AGENT_URL) o "embedded" (pipeline de txAgent en este proceso)
     TX_AGENT_URL: str = "http://localhost:8001/"  # URL del servicio txAgent
+    TX_AGENT_TIMEOUT: float = 20.0
+    TX_AGENT_POOL_SIZE: int = 100  # Conexiones simultáneas máximas hacia txAgent
+    TX_AGENT_POOL_KEEPALIVE: int = 20  # Conexiones keep-alive que se mantienen abiertas
+    TX_AGENT_KEEPALIVE_EXPIRY: float = 30.0
+    TX_AGENT_POOL_TIMEOUT: float = 5.0  # Espera máxima por una conexión libre del pool
+    TX_AGENT_HTTP2: bool = False  # Requiere el paquete 'h2'
+    BOT_RESPONSE_TIMEOUT: float = 10.0  # Máximo de espera por los veredictos de los bots
+    WARNING_GRACE_PERIOD: float = 0.5  # Ventana tras el primer warning para recoger los del resto de bots
+    PENDING_TIMER_TICK: float = 0.005  # Resolución de la rueda de timers de las esperas de veredictos
+    PENDING_TIMER_SLOTS: int = 512  # Slots de la rueda (una vuelta = TICK * SLOTS segundos)
+    ADAPTIVE_BOT_DEADLINES: bool = True  # Plazo de espera según la latencia observada de cada bot
+    BOT_DEADLINE_PERCENTILE: float = 0.99
+    BOT_DEADLINE_MARGIN: float = 1.5  # Multiplicador sobre el percentil
+    BOT_DEADLINE_FLOOR: float = 0.05  # Espera mínima en segundos
+    BOT_DEADLINE_MIN_SAMPLES: int = 20  # Por debajo de esto se espera BOT_RESPONSE_TIMEOUT
+    BOT_LATENCY_WINDOW: int = 1000  # Muestras tras las que el histograma empieza a decaer
+    WS_SEND_QUEUE_SIZE: int = 1000  # Mensajes pendientes por bot antes de considerarlo lento
+    WS_SEND_TIMEOUT: float = 5.0  # Plazo de cada envío a un bot; si se supera se le expulsa
+    WS_SLOW_CONSUMER_POLICY: str = "degrade"  # "degrade" (no cuenta para el quorum) o "evict" (se le desconecta)
+    WS_COMPRESS_MIN_BYTES: int = 4096  # Tamaño a partir del cual se comprime para los bots con ?encoding=zlib
+    WS_COMPRESS_LEVEL: int = 1  # Nivel zlib: prioriza CPU sobre ratio
+    BOT_SHARDING: str = "least_outstanding"  # Reparto entre réplicas del mismo bot: "least_outstanding", "consistent_hash" u "off"
+    WS_PING_INTERVAL: float = 15.0  # Cada cuánto se envía un ping de aplicación a los bots
+    WS_PING_TIMEOUT: float = 45.0  # Silencio tras el que se expulsa a un bot que contesta pings
+    WARNING_STORE_SIZE: int = 10000  # Hashes con warnings retenidos como máximo
+    WARNING_STORE_TTL: float = 60.0  # Segundos que se conservan los warnings no consumidos
+    VERDICT_CACHE_TTL: float = 300.0  # Segundos que se reutiliza un veredicto para el mismo hash (0 = sin cache)
+    VERDICT_CACHE_SIZE: int = 10000
+    BATCH_MAX_SIZE: int = 100  # Transacciones máximas por petición a /agent/transactions/batch
+    ADMISSION_MAX_CONCURRENT: int = 200  # Decisiones (broadcast + espera + txAgent) en paralelo
+    ADMISSION_MAX_QUEUE: int = 1000  # Decisiones en espera antes de responder 429
+    ADMISSION_QUEUE_TIMEOUT: float = 10.0  # Máximo en cola antes de responder 429
+    ADMISSION_RETRY_AFTER: int = 1  # Valor de la cabecera Retry-After en segundos
+    DECISION_STORE_TTL: float = 3600.0  # Tiempo que se conservan las decisiones del modo asíncrono
+    DECISION_STORE_SIZE: int = 50000
+    DECISION_MAX_WAIT: float = 30.0  # Máximo long-polling en GET /agent/transaction/{hash}
+    DECISION_CALLBACK_TIMEOUT: float = 10.0
+    DECISION_CALLBACK_ALLOWED_HOSTS: str = ""  # Hosts permitidos para callback_url separados por comas ("*.dominio" para subdominios); vacío = sin webhooks
+    DECISION_CALLBACK_ALLOW_HTTP: bool = False  # Por defecto solo https
+    DECISION_CALLBACK_POOL_SIZE: int = 20  # Conexiones simultáneas máximas para enviar webhooks
+    SSE_KEEPALIVE_INTERVAL: float = 15.0
+    STATE_BACKEND_URL: str = "memory://"  # redis://host:6379/0 para compartir estado entre workers
+    WORKER_HEARTBEAT_INTERVAL: float = 2.0
+    WORKER_TTL: float = 6.0  # Un worker sin heartbeat durante este tiempo deja de contar para el quorum
 settings = Settings() 
\ No newline at end of file
@@ -0,0 +1,168 @@
+from app.config import settings
+from app.verdict_cache import TTLCache
+from app.state_backend import DECISIONS_CHANNEL, InMemoryStateBackend, StateBackend
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import asyncio
+import httpx
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+def callback_url_error(callback_url: str) -> Optional[str]:
+    # callback_url lo elige el cliente: solo se admiten hosts configurados, para no hacer
+    # peticiones a servicios internos o a endpoints de metadatos
+    try:
+        parts = urlsplit(callback_url)
+        host = (parts.hostname or "").lower()
+    except ValueError:
+        return "invalid callback_url"
+    schemes = ("https", "http") if settings.DECISION_CALLBACK_ALLOW_HTTP else ("https",)
+    if parts.scheme not in schemes:
+        return f"callback_url scheme must be {' or '.join(schemes)}"
+    if parts.username or parts.password:
+        return "callback_url must not contain credentials"
+    for allowed in settings.DECISION_CALLBACK_ALLOWED_HOSTS.split(","):
+        allowed = allowed.strip().lower()
+        if allowed and (host == allowed or (allowed.startswith("*.") and host.endswith(allowed[1:]))):
+            return None
+    return f"callback_url host {host or '(empty)'} is not allowed"
+
+class DecisionStore:
+    # Decisiones de transacciones enviadas en modo asíncrono, consultables por hash
+    def __init__(self, maxsize: int, ttl: float):
+        self.records = TTLCache(maxsize, ttl)
+        self.waiters: Dict[str, asyncio.Event] = {}
+        self.waiting: Dict[str, int] = {}  # Peticiones de long-polling por hash
+        self.backend: StateBackend = InMemoryStateBackend()
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        # Un único pool para todos los webhooks
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=settings.DECISION_CALLBACK_POOL_SIZE),
+                timeout=settings.DECISION_CALLBACK_TIMEOUT,
+                follow_redirects=False
+            )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def attach_backend(self, backend: StateBackend):
+        # Con varios workers las decisiones se comparten: cualquier worker puede responder al polling
+        self.backend = backend
+        if backend.distributed:
+            await backend.subscribe(DECISIONS_CHANNEL, self._on_remote_decision)
+
+    @staticmethod
+    def _key(transaction_hash: str) -> str:
+        return f"baiby:decision:{transaction_hash}"
+
+    async def _share(self, record: dict):
+        if self.backend.distributed:
+            await self.backend.set(self._key(record["transaction_hash"]), record, settings.DECISION_STORE_TTL)
+
+    async def _on_remote_decision(self, record: dict):
+        transaction_hash = record["transaction_hash"]
+        event = self.waiters.pop(transaction_hash, None)
+        if event:
+            self.records.set(transaction_hash, record)
+            event.set()
+
+    async def create(self, transaction_hash: str, callback_url: Optional[str] = None) -> dict:
+        record = self.records.peek(transaction_hash)
+        if record is not None and record["state"] != "error":
+            # Reenvío de una transacción ya conocida: se reutiliza el registro existente
+            if callback_url:
+                record["callback_urls"].append(callback_url)
+                await self._share(record)
+            return record
+
+        record = {
+            "transaction_hash": transaction_hash,
+            "state": "pending",
+            "created_at": time.time(),
+            "completed_at": None,
+            "decision": None,
+            "callback_urls": [callback_url] if callback_url else []
+        }
+        self.records.set(transaction_hash, record)
+        self.waiters.setdefault(transaction_hash, asyncio.Event())
+        await self._share(record)
+        return record
+
+    def get(self, transaction_hash: str) -> Optional[dict]:
+        return self.records.peek(transaction_hash)
+
+    async def fetch(self, transaction_hash: str) -> Optional[dict]:
+        # Local primero; si no, el registro puede pertenecer a otro worker
+        record = self.records.peek(transaction_hash)
+        if record is None and self.backend.distributed:
+            record = await self.backend.get(self._key(transaction_hash))
+        return record
+
+    async def complete(self, transaction_hash: str, decision: dict, state: str = "completed"):
+        record = self.records.peek(transaction_hash)
+        if record is None:
+            logger.warning(f"Decisión para {transaction_hash} descartada: el registro ya fue desalojado")
+        else:
+            record["state"] = state
+            record["decision"] = decision
+            record["completed_at"] = time.time()
+            # Tras completarse, el registro vive DECISION_STORE_TTL desde ahora
+            self.records.set(transaction_hash, record)
+            await self._share(record)
+            if self.backend.distributed:
+                await self.backend.publish(DECISIONS_CHANNEL, record)
+
+        event = self.waiters.pop(transaction_hash, None)
+        if event:
+            event.set()
+
+        if record is not None:
+            for callback_url in record["callback_urls"]:
+                await self.send_callback(callback_url, record)
+
+    async def wait(self, transaction_hash: str, timeout: float) -> Optional[dict]:
+        record = await self.fetch(transaction_hash)
+        if record is None or record["state"] != "pending":
+            return record
+        event = self.waiters.setdefault(transaction_hash, asyncio.Event())
+        self.waiting[transaction_hash] = self.waiting.get(transaction_hash, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # El último en esperar retira el Event si la decisión no llegó
+            remaining = self.waiting.pop(transaction_hash) - 1
+            if remaining:
+                self.waiting[transaction_hash] = remaining
+            elif self.waiters.get(transaction_hash) is event:
+                del self.waiters[transaction_hash]
+        return await self.fetch(transaction_hash)
+
+    async def send_callback(self, callback_url: str, record: dict):
+        error = callback_url_error(callback_url)
+        if error:
+            # Registros compartidos por otro worker o cambios en la lista de hosts permitidos
+            logger.error(f"Webhook a {callback_url} descartado: {error}")
+            return
+        payload = {key: value for key, value in record.items() if key != "callback_urls"}
+        try:
+            if self.client is None:
+                # Uso fuera del lifespan (scripts, tests): pool bajo demanda
+                await self.start()
+            await self.client.post(callback_url, json=payload)
+            logger.info(f"Webhook de decisión enviado a {callback_url}")
+        except Exception as e:
+            logger.error(f"Error enviando webhook a {callback_url}: {e}")
+
+    def stats(self) -> dict:
+        return {**self.records.stats(), "waiters": len(self.waiters)}
+
+decision_store = DecisionStore(settings.DECISION_STORE_SIZE, settings.DECISION_STORE_TTL)
@@ -1,17 +1,45 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import router
 from app.config import settings
 from app.websocket_manager import ws_manager
+from app.tx_agent_client import tx_agent_client
+from app.decision_store import decision_store
+from app.admission import admission
+from app.pending_decisions import pending_decisions
+from app.state_backend import create_state_backend
+from app import metrics
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from contextlib import asynccontextmanager
 import logging
 import asyncio
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un único pool de conexiones hacia txAgent compartido por todas las peticiones,
+    # o el pipeline de txAgent cargado en este proceso con TX_AGENT_MODE=embedded
+    await tx_agent_client.start()
+    # Estado compartido entre workers: bots y peticiones HTTP pueden vivir en procesos distintos
+    backend = create_state_backend(settings.STATE_BACKEND_URL)
+    await backend.start()
+    await ws_manager.attach_backend(backend)
+    await decision_store.attach_backend(backend)
+    await decision_store.start()
+    ws_manager.start_heartbeat()
+    yield
+    await ws_manager.stop_heartbeat()
+    await pending_decisions.wheel.stop()
+    await backend.close()
+    await tx_agent_client.close()
+    await decision_store.close()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configuración CORS
@@ -33,8 +61,15 @@ async def websocket_endpoint(websocket: WebSocket):
         while True:
             try:
                 message = await websocket.receive_json()
+                ws_manager.mark_alive(websocket)
                 if message.get("type") == "warning":
-                    await ws_manager.process_warning(message)
+                    await ws_manager.process_warning(message, websocket)
+                elif message.get("type") == "clean":
+                    await ws_manager.process_clean(message, websocket)
+                elif message.get("type") == "pong":
+                    ws_manager.process_pong(websocket)
+                elif message.get("type") == "capabilities":
+                    ws_manager.register_capabilities(message, websocket)
             except Exception as e:
                 logger.error(f"Error procesando mensaje: {e}")
                 break
@@ -44,6 +79,12 @@ async def websocket_endpoint(websocket: WebSocket):
     finally:
         await ws_manager.disconnect(websocket)
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+metrics.bind_state_gauges(pending_decisions, ws_manager, tx_agent_client, admission)
+
 # Incluir rutas
 app.include_router(router)
 
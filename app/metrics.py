@@ -0,0 +1,145 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Métricas del camino crítico de /agent/transaction/ expuestas en /metrics
+
+REQUEST_PARSE_SECONDS = Histogram(
+    "baiby_request_parse_seconds",
+    "Serialización y hash de la transacción recibida",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+)
+
+BROADCAST_SECONDS = Histogram(
+    "baiby_broadcast_seconds",
+    "Duración de ws_manager.broadcast",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+BROADCAST_FANOUT = Histogram(
+    "baiby_broadcast_fanout",
+    "Bots que recibieron cada broadcast",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+)
+
+BOT_WAIT_SECONDS = Histogram(
+    "baiby_bot_wait_seconds",
+    "Espera de veredictos de los bots por resultado",
+    ["outcome"],  # warning | no_warning | no_bots | timeout
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+TX_AGENT_SECONDS = Histogram(
+    "baiby_tx_agent_seconds",
+    "Latencia de send_to_tx_agent",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+)
+
+TX_AGENT_ERRORS = Counter(
+    "baiby_tx_agent_errors_total",
+    "Errores al llamar a txAgent",
+    ["reason"]  # timeout | connect | other
+)
+
+ACTIVE_TRANSACTIONS = Gauge(
+    "baiby_active_transactions",
+    "Transacciones esperando veredicto de los bots"
+)
+
+PENDING_WARNINGS = Gauge(
+    "baiby_pending_warnings",
+    "Hashes con warnings recibidos pendientes de procesar"
+)
+
+TX_AGENT_POOL_IN_FLIGHT = Gauge(
+    "baiby_tx_agent_pool_in_flight",
+    "Peticiones en curso en el pool de conexiones a txAgent"
+)
+
+TX_AGENT_POOL_SATURATED = Counter(
+    "baiby_tx_agent_pool_saturated",
+    "Peticiones que encontraron el pool a txAgent lleno"
+)
+
+VERDICT_CACHE_HITS = Counter(
+    "baiby_verdict_cache_hits",
+    "Veredictos servidos desde la cache"
+)
+
+VERDICT_CACHE_COALESCED = Counter(
+    "baiby_verdict_cache_coalesced",
+    "Peticiones idénticas unidas a una decisión en curso"
+)
+
+ADMISSION_ACTIVE = Gauge(
+    "baiby_admission_active",
+    "Decisiones admitidas en curso"
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "baiby_admission_queue_depth",
+    "Decisiones esperando hueco en el control de admisión"
+)
+
+ADMISSION_REJECTED = Counter(
+    "baiby_admission_rejected_total",
+    "Peticiones rechazadas con 429",
+    ["reason"]  # queue_full | queue_timeout
+)
+
+ADMISSION_QUEUE_WAIT_SECONDS = Histogram(
+    "baiby_admission_queue_wait_seconds",
+    "Tiempo en la cola de admisión",
+    buckets=(0, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+WS_SLOW_CONSUMERS = Counter(
+    "baiby_ws_slow_consumers_total",
+    "Bots degradados o expulsados por no consumir a tiempo",
+    ["action"]  # degraded | queue_overflow | send_timeout | send_error | heartbeat_timeout
+)
+
+WS_SEND_QUEUE_DEPTH = Gauge(
+    "baiby_ws_send_queue_depth",
+    "Mensajes pendientes en las colas de salida de los bots"
+)
+
+WS_DEGRADED_BOTS = Gauge(
+    "baiby_ws_degraded_bots",
+    "Bots conectados en estado degradado"
+)
+
+BOT_REDELIVERIES = Counter(
+    "baiby_bot_redeliveries_total",
+    "Transacciones reenviadas a otra réplica porque la asignada se desconectó sin responder"
+)
+
+WS_CONNECTIONS = Gauge(
+    "baiby_ws_connections",
+    "Bots conectados a /ws/bot en este worker"
+)
+
+WARNING_STORE_EVICTED = Counter(
+    "baiby_warning_store_evicted",
+    "Warnings descartados del almacén por tamaño o caducidad"
+)
+
+WARNING_STORE_ORPHANED = Counter(
+    "baiby_warning_store_orphaned",
+    "Warnings recibidos para hashes que no se estaban esperando"
+)
+
+PENDING_TIMERS = Gauge(
+    "baiby_pending_timers",
+    "Plazos de espera programados en la rueda de timers"
+)
+
+def bind_state_gauges(pending_decisions, ws_manager, tx_agent_client, admission):
+    # Los gauges leen el estado en el momento del scrape
+    ACTIVE_TRANSACTIONS.set_function(lambda: len(pending_decisions))
+    PENDING_TIMERS.set_function(lambda: len(pending_decisions.wheel))
+    PENDING_WARNINGS.set_function(lambda: len(ws_manager.warnings))
+    TX_AGENT_POOL_IN_FLIGHT.set_function(lambda: tx_agent_client.in_flight)
+    ADMISSION_ACTIVE.set_function(lambda: admission.active)
+    ADMISSION_QUEUE_DEPTH.set_function(lambda: admission.queued_weight)
+    WS_CONNECTIONS.set_function(lambda: len(ws_manager.connections))
+    WS_SEND_QUEUE_DEPTH.set_function(lambda: sum(c.queue.qsize() for c in ws_manager.connections.values()))
+    WS_DEGRADED_BOTS.set_function(lambda: sum(1 for c in ws_manager.connections.values() if c.degraded))
@@ -0,0 +1,148 @@
+from app.config import settings
+from typing import Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class HashedTimerWheel:
+    # Una única tarea vence todos los plazos: cada timer cae en el slot (deadline / tick) % slots
+    # y en cada tick solo se revisa ese slot. Sustituye a un asyncio.wait_for por petición
+    def __init__(self, tick: float, slots: int):
+        self.tick = tick
+        self.slots: List[Dict[object, tuple]] = [{} for _ in range(slots)]
+        self.timers: Dict[object, int] = {}  # clave -> slot
+        self._current_tick = int(time.monotonic() / tick)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.fired = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def schedule(self, key: object, deadline: float, callback: Callable[[], None]):
+        self.cancel(key)
+        # Se redondea hacia arriba: al procesar su slot el plazo ya ha vencido seguro.
+        # Un plazo ya vencido va al siguiente tick, nunca a una vuelta completa más tarde
+        tick = max(int(deadline / self.tick) + 1, self._current_tick + 1)
+        slot = tick % len(self.slots)
+        self.slots[slot][key] = (deadline, callback)
+        self.timers[key] = slot
+        self._wakeup.set()
+        self.start()
+
+    def cancel(self, key: object):
+        slot = self.timers.pop(key, None)
+        if slot is not None:
+            self.slots[slot].pop(key, None)
+
+    def _advance(self, now: float):
+        target = int(now / self.tick)
+        # Tras un parón basta con una vuelta completa para revisar todos los slots
+        start = max(self._current_tick + 1, target - len(self.slots) + 1)
+        for tick in range(start, target + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            if not bucket:
+                continue
+            expired = [key for key, (deadline, _) in bucket.items() if deadline <= now]
+            for key in expired:
+                _, callback = bucket.pop(key)
+                self.timers.pop(key, None)
+                self.fired += 1
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"Error en callback de la rueda de timers: {e}")
+        self._current_tick = target
+
+    async def _run(self):
+        while True:
+            if not self.timers:
+                # Sin timers pendientes la rueda no gira
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                self._current_tick = int(time.monotonic() / self.tick) - 1
+            await asyncio.sleep(self.tick)
+            self._advance(time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+class PendingDecisionRegistry:
+    # Transacciones esperando veredictos de los bots. Cada espera es un future que se
+    # completa con True cuando llega un veredicto (notify) o con False al vencer su plazo
+    def __init__(self, wheel: HashedTimerWheel):
+        self.wheel = wheel
+        self.registered: Set[str] = set()
+        self.waiters: Dict[str, List[asyncio.Future]] = {}
+        self.notified = 0
+        self.expired = 0
+
+    def register(self, transaction_hash: str):
+        # Antes del broadcast, para no perder veredictos rápidos
+        self.registered.add(transaction_hash)
+
+    def release(self, transaction_hash: str):
+        self.registered.discard(transaction_hash)
+        self.cancel(transaction_hash)
+
+    def cancel(self, transaction_hash: str):
+        for future in self.waiters.pop(transaction_hash, []):
+            self.wheel.cancel(future)
+            future.cancel()
+
+    def notify(self, transaction_hash: str):
+        for future in self.waiters.pop(transaction_hash, []):
+            self.wheel.cancel(future)
+            if not future.done():
+                future.set_result(True)
+                self.notified += 1
+
+    def _expire(self, transaction_hash: str, future: asyncio.Future):
+        waiters = self.waiters.get(transaction_hash)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self.waiters[transaction_hash]
+        if not future.done():
+            future.set_result(False)
+            self.expired += 1
+
+    async def wait(self, transaction_hash: str, deadline: float) -> bool:
+        # deadline en time.monotonic(); devuelve False si venció sin ningún veredicto nuevo
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(transaction_hash, []).append(future)
+        self.wheel.schedule(future, deadline, lambda: self._expire(transaction_hash, future))
+        try:
+            return await future
+        finally:
+            # También si la petición se cancela: no queda ni el timer ni el future
+            self.wheel.cancel(future)
+            waiters = self.waiters.get(transaction_hash)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self.waiters[transaction_hash]
+
+    def __len__(self) -> int:
+        return len(self.registered)
+
+    def stats(self) -> dict:
+        return {
+            "registered": len(self.registered),
+            "waiting": sum(len(waiters) for waiters in self.waiters.values()),
+            "timers": len(self.wheel),
+            "notified": self.notified,
+            "expired": self.expired
+        }
+
+pending_decisions = PendingDecisionRegistry(
+    HashedTimerWheel(settings.PENDING_TIMER_TICK, settings.PENDING_TIMER_SLOTS)
+)
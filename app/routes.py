@@ -1,19 +1,27 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from app.schemas import TransactionRequest, TransactionResponse
 from app.websocket_manager import ws_manager
+from app.tx_agent_client import tx_agent_client
+from app.verdict_cache import verdict_cache
+from app.decision_store import callback_url_error, decision_store
+from app.admission import admission
+from app.pending_decisions import pending_decisions
 from app.config import settings
+from app import metrics
 import hashlib
 import asyncio
 import httpx
 import logging
 import json
-from typing import Dict
+import time
+from typing import Dict, List, Optional
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Diccionario para mantener el seguimiento de las transacciones activas
-active_transactions: Dict[str, asyncio.Event] = {}
+# Decisiones en segundo plano del modo asíncrono (referencia para que no las recoja el GC)
+background_decisions: Dict[str, asyncio.Task] = {}
 
 def serialize_transaction(tx_request: TransactionRequest) -> dict:
     return {
@@ -41,102 +49,407 @@ async def send_to_tx_agent(transaction_data: dict, warning: str = None):
             status = "approved"
             warning = "nada"
 
-        async with httpx.AsyncClient() as client:
-            data = {
-                "safeAddress": transaction_data["safeAddress"],
-                "erc20TokenAddress": transaction_data["erc20TokenAddress"],
-                "reason": transaction_data["reason"],
-                "transactions": transaction_data["transactions"],
-                'bot_reason': bot_reason,
-                'status': status,
-                "warning": warning
-            }
-            logger.info(f"Enviando a txAgent: {data}")
-            response = await client.post(
-                f"{settings.TX_AGENT_URL}", 
-                json=data,
-                timeout=20.0  # Aumentamos el timeout a 20 segundos
-            )
-            return response.json()
+        data = {
+            "safeAddress": transaction_data["safeAddress"],
+            "erc20TokenAddress": transaction_data["erc20TokenAddress"],
+            "reason": transaction_data["reason"],
+            "transactions": transaction_data["transactions"],
+            'bot_reason': bot_reason,
+            'status': status,
+            "warning": warning
+        }
+        logger.info(f"Enviando a txAgent: {data}")
+        # Pool HTTP compartido o pipeline embebido según TX_AGENT_MODE (ver lifespan en main.py)
+        with metrics.TX_AGENT_SECONDS.time():
+            return await tx_agent_client.decide(data)
         
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        metrics.TX_AGENT_ERRORS.labels(reason="timeout").inc()
+        logger.error(f"Timeout esperando a txAgent ({settings.TX_AGENT_MODE})")
+        return {"status": "error", "message": "txAgent timeout"}
     except httpx.ConnectError:
+        metrics.TX_AGENT_ERRORS.labels(reason="connect").inc()
         logger.error(f"No se pudo conectar a txAgent en {settings.TX_AGENT_URL}")
         return {"status": "error", "message": "txAgent no disponible"}
     except Exception as e:
+        metrics.TX_AGENT_ERRORS.labels(reason="other").inc()
         logger.error(f"Error al enviar a txAgent: {str(e)}")
         return {"status": "error", "message": str(e)}
 
 async def process_transaction_with_timeout(tx_data: dict, transaction_hash: str):
     try:
-        event = asyncio.Event()
-        active_transactions[transaction_hash] = event
-        
-        try:
-            logger.info(f"Esperando warnings para {transaction_hash}...")
-            await asyncio.wait_for(event.wait(), timeout=10.0)
-            warning = ws_manager.get_warning(transaction_hash)
-            
-            if warning:
-                logger.info(f"Warning recibido para {transaction_hash}: {warning}")
-                warning_data = json.dumps(warning)
-                return await send_to_tx_agent(tx_data, warning_data)
-            else:
-                logger.info(f"No se recibió warning para {transaction_hash}, procediendo con aprobación")
-                return {
-                    "status": "success",
-                    "message": "Transaction APPROVED - No warnings detected",
-                    "approval_status": "APPROVED",
-                    "llm_response": "No warnings detected"
-                }
-        except asyncio.TimeoutError:
+        pending_decisions.register(transaction_hash)
+
+        # Plazo derivado de la latencia observada de los bots esperados (techo: BOT_RESPONSE_TIMEOUT)
+        ws_manager.mark_dispatched(transaction_hash)
+        wait_started = time.monotonic()
+        deadline = ws_manager.response_deadline(transaction_hash)
+        grace_deadline = None
+        logger.info(f"Esperando veredictos para {transaction_hash} ({max(deadline - time.monotonic(), 0):.3f}s)...")
+
+        # Esperamos al quorum; tras el primer warning solo damos una ventana corta al resto
+        while not ws_manager.quorum_reached(transaction_hash):
+            if grace_deadline is None and ws_manager.get_warnings(transaction_hash):
+                grace_deadline = min(deadline, time.monotonic() + settings.WARNING_GRACE_PERIOD)
+            remaining = (grace_deadline or deadline) - time.monotonic()
+            if remaining <= 0:
+                break
+            await pending_decisions.wait(transaction_hash, time.monotonic() + remaining)
+
+        warning = ws_manager.get_warning(transaction_hash)
+        if warning:
+            outcome = "warning"
+        elif ws_manager.quorum_reached(transaction_hash):
+            # Sin bots conectados o enrutados el quorum se cumple sin que nadie revise la transacción
+            outcome = "no_warning" if ws_manager.expected_bots.get(transaction_hash) else "no_bots"
+        else:
+            outcome = "timeout"
+        metrics.BOT_WAIT_SECONDS.labels(outcome=outcome).observe(time.monotonic() - wait_started)
+
+        if warning:
+            logger.info(f"{len(warning['warnings'])} warning(s) recibidos para {transaction_hash}: {warning}")
+            warning_data = json.dumps(warning)
+            return await send_to_tx_agent(tx_data, warning_data)
+        elif outcome == "no_warning":
+            logger.info(f"No se recibió warning para {transaction_hash}, procediendo con aprobación")
+            return {
+                "status": "success",
+                "message": "Transaction APPROVED - No warnings detected",
+                "approval_status": "APPROVED",
+                "llm_response": "No warnings detected",
+                "bots_checked": len(ws_manager.expected_bots.get(transaction_hash, ()))
+            }
+        elif outcome == "no_bots":
+            logger.warning(f"Ningún bot revisó {transaction_hash}, procediendo con aprobación por defecto")
+            return {
+                "status": "success",
+                "message": "Transaction APPROVED - No bots checked this transaction",
+                "approval_status": "APPROVED",
+                "llm_response": "No bots checked this transaction",
+                "bots_checked": 0
+            }
+        else:
             logger.info(f"Timeout alcanzado para {transaction_hash}, procediendo con aprobación por defecto")
             return {
                 "status": "success",
                 "message": "Transaction APPROVED - Timeout waiting for warnings",
                 "approval_status": "APPROVED",
-                "llm_response": "Timeout waiting for warnings"
+                "llm_response": "Timeout waiting for warnings",
+                "timed_out": True
             }
-            
+
     finally:
-        active_transactions.pop(transaction_hash, None)
-        ws_manager.warnings.pop(transaction_hash, None)
+        pending_decisions.release(transaction_hash)
+        ws_manager.clear_transaction(transaction_hash)
 
-@router.post("/agent/transaction/", response_model=TransactionResponse)
-async def process_agent_transaction(transaction: TransactionRequest):
+@router.get("/stats/tx-agent-pool")
+async def tx_agent_pool_stats():
+    return tx_agent_client.stats()
+
+def hash_transaction(tx_data: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(tx_data, sort_keys=True).encode()
+    ).hexdigest()
+
+def build_bot_payload(tx_data: dict, transaction_hash: str) -> dict:
+    return {
+        "transactions": tx_data["transactions"],
+        "hash": transaction_hash,
+        "safewallet": tx_data["safeAddress"]
+    }
+
+def register_pending(transaction_hashes: List[str]):
+    # Registrar la espera antes del broadcast para no perder veredictos rápidos
+    for transaction_hash in transaction_hashes:
+        pending_decisions.register(transaction_hash)
+        ws_manager.mark_dispatched(transaction_hash)
+
+def release_pending(transaction_hashes: List[str]):
+    for transaction_hash in transaction_hashes:
+        pending_decisions.release(transaction_hash)
+        ws_manager.clear_transaction(transaction_hash)
+
+async def broadcast_and_decide(tx_data: dict, transaction_hash: str) -> dict:
+    # Preparar mensaje para los bots
+    tx_message = {
+        "type": "transaction",
+        "data": build_bot_payload(tx_data, transaction_hash)
+    }
+
+    register_pending([transaction_hash])
     try:
-        # Serializar la transacción
-        tx_data = serialize_transaction(transaction)
-        
-        # Generar hash
-        transaction_hash = hashlib.sha256(
-            json.dumps(tx_data, sort_keys=True).encode()
-        ).hexdigest()
-        
-        # Preparar mensaje para los bots
-        tx_message = {
-            "type": "transaction",
-            "data": {
-                "transactions": tx_data["transactions"],
-                "hash": transaction_hash,
-                "safewallet": tx_data["safeAddress"]
-            }
+        # Broadcast a los bots y registrar de quiénes esperamos veredicto
+        delivered = await ws_manager.broadcast(tx_message)
+        ws_manager.expect_verdicts(transaction_hash, delivered.get(transaction_hash, set()))
+    except Exception:
+        release_pending([transaction_hash])
+        raise
+
+    # Esperar el resultado del procesamiento y obtener la respuesta
+    return await process_transaction_with_timeout(tx_data, transaction_hash)
+
+def is_cacheable_verdict(tx_agent_response: dict) -> bool:
+    # No guardamos errores de txAgent, aprobaciones por timeout ni aprobaciones sin bots conectados:
+    # el próximo intento debe reevaluarse
+    return (
+        tx_agent_response.get("status") != "error"
+        and not tx_agent_response.get("timed_out")
+        and tx_agent_response.get("bots_checked", 1) > 0
+    )
+
+@router.get("/stats/verdict-cache")
+async def verdict_cache_stats():
+    return verdict_cache.stats()
+
+def build_transaction_response(transaction_hash: str, tx_agent_response: dict) -> TransactionResponse:
+    return TransactionResponse(
+        status="success",
+        message=f"Transaction {tx_agent_response.get('approval_status', 'PENDING')} - {tx_agent_response.get('llm_response', '')}",
+        transaction_hash=transaction_hash,
+        approval_status=tx_agent_response.get('approval_status', 'PENDING')
+    )
+
+async def admitted_decision(tx_data: dict, transaction_hash: str) -> dict:
+    decide = lambda: verdict_cache.get_or_compute(
+        transaction_hash,
+        lambda: broadcast_and_decide(tx_data, transaction_hash),
+        cacheable=is_cacheable_verdict
+    )
+    # Veredictos en cache o decisiones ya en curso no consumen capacidad: solo se admiten las nuevas
+    if verdict_cache.has_decision(transaction_hash):
+        return await decide()
+    async with admission.slot():
+        return await decide()
+
+async def decide_in_background(tx_data: dict, transaction_hash: str):
+    try:
+        tx_agent_response = await admitted_decision(tx_data, transaction_hash)
+        response = build_transaction_response(transaction_hash, tx_agent_response)
+        # Errores de txAgent y aprobaciones por timeout se devuelven, pero como "error": un reenvío
+        # del mismo hash vuelve a decidirse en lugar de reutilizar este resultado durante todo el TTL
+        state = "completed" if is_cacheable_verdict(tx_agent_response) else "error"
+        await decision_store.complete(transaction_hash, response.model_dump(), state=state)
+    except Exception as e:
+        logger.error(f"Error en decisión asíncrona de {transaction_hash}: {str(e)}")
+        await decision_store.complete(
+            transaction_hash,
+            {"status": "error", "message": f"Error processing transaction: {str(e)}", "transaction_hash": transaction_hash},
+            state="error"
+        )
+
+async def submit_async(tx_data: dict, transaction_hash: str, callback_url: Optional[str]) -> JSONResponse:
+    if callback_url:
+        error = callback_url_error(callback_url)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+    if not verdict_cache.has_decision(transaction_hash):
+        admission.check_capacity()
+    record = await decision_store.create(transaction_hash, callback_url)
+    if record["state"] == "pending" and transaction_hash not in background_decisions:
+        task = asyncio.ensure_future(decide_in_background(tx_data, transaction_hash))
+        background_decisions[transaction_hash] = task
+        task.add_done_callback(lambda t: background_decisions.pop(transaction_hash, None))
+    elif record["state"] != "pending":
+        # Ya decidida: el webhook nuevo se dispara directamente
+        if callback_url:
+            asyncio.ensure_future(decision_store.send_callback(callback_url, record))
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": "accepted",
+            "state": record["state"],
+            "transaction_hash": transaction_hash,
+            "status_url": f"/agent/transaction/{transaction_hash}",
+            "events_url": f"/agent/transaction/{transaction_hash}/events"
         }
+    )
+
+@router.post("/agent/transaction/", response_model=TransactionResponse)
+async def process_agent_transaction(
+    transaction: TransactionRequest,
+    mode: str = "sync",
+    prefer: Optional[str] = Header(default=None)
+):
+    try:
+        with metrics.REQUEST_PARSE_SECONDS.time():
+            # Serializar la transacción
+            tx_data = serialize_transaction(transaction)
+            
+            # Generar hash
+            transaction_hash = hash_transaction(tx_data)
+
+        # Modo asíncrono: devolvemos 202 con el hash y la decisión se consulta después
+        if mode == "async" or (prefer and "respond-async" in prefer):
+            return await submit_async(tx_data, transaction_hash, transaction.callback_url)
         
-        # Broadcast a los bots
-        await ws_manager.broadcast(tx_message)
-        
-        # Esperar el resultado del procesamiento y obtener la respuesta
-        tx_agent_response = await process_transaction_with_timeout(tx_data, transaction_hash)
+        # Reintentos y peticiones idénticas concurrentes comparten una única decisión
+        tx_agent_response = await admitted_decision(tx_data, transaction_hash)
         
-        return TransactionResponse(
-            status="success",
-            message=f"Transaction {tx_agent_response.get('approval_status', 'PENDING')} - {tx_agent_response.get('llm_response', '')}",
-            transaction_hash=transaction_hash,
-            approval_status=tx_agent_response.get('approval_status', 'PENDING')
-        )
+        return build_transaction_response(transaction_hash, tx_agent_response)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error en process_agent_transaction: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Error processing transaction: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+@router.get("/agent/transaction/{transaction_hash}")
+async def get_transaction_decision(transaction_hash: str, wait: float = 0.0):
+    # wait > 0 permite long-polling hasta DECISION_MAX_WAIT segundos
+    if wait > 0:
+        record = await decision_store.wait(transaction_hash, min(wait, settings.DECISION_MAX_WAIT))
+    else:
+        record = await decision_store.fetch(transaction_hash)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired transaction {transaction_hash}")
+    return {key: value for key, value in record.items() if key != "callback_urls"}
+
+@router.get("/agent/transaction/{transaction_hash}/events")
+async def stream_transaction_decision(transaction_hash: str):
+    if await decision_store.fetch(transaction_hash) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired transaction {transaction_hash}")
+
+    async def events():
+        record = await decision_store.fetch(transaction_hash)
+        while record is not None and record["state"] == "pending":
+            yield f"event: pending\ndata: {json.dumps({'transaction_hash': transaction_hash})}\n\n"
+            record = await decision_store.wait(transaction_hash, settings.SSE_KEEPALIVE_INTERVAL)
+        if record is None:
+            yield f"event: expired\ndata: {json.dumps({'transaction_hash': transaction_hash})}\n\n"
+            return
+        yield f"event: decision\ndata: {json.dumps(record['decision'])}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/stats/admission")
+async def admission_stats():
+    return admission.stats()
+
+@router.get("/stats/bot-latency")
+async def bot_latency_stats():
+    return ws_manager.latency.stats()
+
+@router.get("/stats/pending-decisions")
+async def pending_decisions_stats():
+    return pending_decisions.stats()
+
+@router.get("/stats/bots")
+async def bot_connection_stats():
+    now = time.monotonic()
+    return {
+        "connections": {
+            conn_id: {
+                "bot": ws_manager.bot_name(conn_id),
+                "encoding": connection.encoding,
+                "degraded": connection.degraded,
+                "queue_depth": connection.queue.qsize(),
+                "heartbeat": connection.heartbeat,
+                "last_seen_seconds": round(now - connection.last_seen, 3),
+                "rtt": connection.rtt
+            } for conn_id, connection in ws_manager.connections.items()
+        },
+        "warning_store": ws_manager.warnings.stats()
+    }
+
+@router.get("/stats/bot-routing")
+async def bot_routing_stats():
+    return {**ws_manager.routing.stats(), "replicas": ws_manager.replica_stats()}
+
+@router.get("/stats/decision-store")
+async def decision_store_stats():
+    return decision_store.stats()
+
+@router.post("/agent/transactions/batch", response_model=List[TransactionResponse])
+async def process_agent_transactions_batch(transactions: List[TransactionRequest], stream: bool = False):
+    if len(transactions) > settings.BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(transactions)} transactions (max {settings.BATCH_MAX_SIZE})"
+        )
+
+    try:
+        prepared = []
+        for transaction in transactions:
+            with metrics.REQUEST_PARSE_SECONDS.time():
+                tx_data = serialize_transaction(transaction)
+                prepared.append((tx_data, hash_transaction(tx_data)))
+
+        # Solo se envían a los bots los hashes sin veredicto en cache ni decisión en curso
+        candidates: Dict[str, dict] = {}
+        for tx_data, transaction_hash in prepared:
+            if not verdict_cache.has_decision(transaction_hash):
+                candidates[transaction_hash] = tx_data
+
+        # El lote ocupa tantos huecos de admisión como transacciones nuevas lleva
+        granted = await admission.acquire(len(candidates)) if candidates else 0
+
+        # Mientras se esperaba hueco pueden haberse decidido algunas: se vuelve a comprobar antes de
+        # registrar la espera (una registrada que ya tiene decisión nunca se liberaría) y se devuelve lo sobrante
+        to_broadcast = {h: tx_data for h, tx_data in candidates.items() if not verdict_cache.has_decision(h)}
+        needed = min(len(to_broadcast), admission.max_concurrent)
+        if needed < granted:
+            admission.release(granted - needed)
+            granted = needed
+
+        if to_broadcast:
+            register_pending(list(to_broadcast))
+            try:
+                # Un único frame con todas las transacciones del lote
+                delivered = await ws_manager.broadcast({
+                    "type": "transaction_batch",
+                    "data": [build_bot_payload(tx_data, h) for h, tx_data in to_broadcast.items()]
+                })
+                for transaction_hash in to_broadcast:
+                    ws_manager.expect_verdicts(transaction_hash, delivered.get(transaction_hash, set()))
+            except Exception:
+                release_pending(list(to_broadcast))
+                admission.release(granted)
+                raise
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error en process_agent_transactions_batch: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing batch: {str(e)}"
+        )
+
+    async def decide(tx_data: dict, transaction_hash: str) -> TransactionResponse:
+        if transaction_hash in to_broadcast:
+            compute = lambda: process_transaction_with_timeout(tx_data, transaction_hash)
+        else:
+            compute = lambda: broadcast_and_decide(tx_data, transaction_hash)
+        try:
+            tx_agent_response = await verdict_cache.get_or_compute(
+                transaction_hash, compute, cacheable=is_cacheable_verdict
+            )
+            return build_transaction_response(transaction_hash, tx_agent_response)
+        except Exception as e:
+            logger.error(f"Error decidiendo {transaction_hash} del lote: {str(e)}")
+            return TransactionResponse(
+                status="error",
+                message=f"Error processing transaction: {str(e)}",
+                transaction_hash=transaction_hash
+            )
+
+    # Todas las transacciones del lote esperan sus veredictos en paralelo
+    tasks = [asyncio.ensure_future(decide(tx_data, h)) for tx_data, h in prepared]
+    if granted:
+        asyncio.gather(*tasks).add_done_callback(lambda _: admission.release(granted))
+
+    if not stream:
+        return await asyncio.gather(*tasks)
+
+    async def stream_decisions():
+        # NDJSON: una línea por decisión en cuanto está lista, con su posición en el lote
+        index_of = {task: index for index, task in enumerate(tasks)}
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield json.dumps({"index": index_of[task], **task.result().model_dump()}) + "\n"
+
+    return StreamingResponse(stream_decisions(), media_type="application/x-ndjson")
@@ -19,6 +19,7 @@ class TransactionRequest(BaseModel):
     safeAddress: str
     erc20TokenAddress: str
     reason: str
+    callback_url: Optional[str] = None  # Webhook para el modo asíncrono, no forma parte del hash
 
 class TransactionResponse(BaseModel):
     status: str
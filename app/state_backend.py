@@ -0,0 +1,163 @@
+from app.config import settings
+from app.verdict_cache import TTLCache
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Canales compartidos entre workers
+TRANSACTIONS_CHANNEL = "baiby:transactions"  # broadcast de transacciones a los bots de todos los workers
+DECISIONS_CHANNEL = "baiby:decisions"  # decisiones del modo asíncrono completadas
+
+def worker_channel(worker_id: str) -> str:
+    # Eventos dirigidos al worker que originó una transacción (despachos y veredictos)
+    return f"baiby:worker:{worker_id}"
+
+Handler = Callable[[dict], Awaitable[None]]
+
+class StateBackend:
+    # Estado compartido y pub/sub entre workers del core API
+    distributed = False
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self.handlers: Dict[str, Handler] = {}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def publish(self, channel: str, message: dict):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str, handler: Handler):
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float):
+        raise NotImplementedError
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def live_workers(self) -> Set[str]:
+        raise NotImplementedError
+
+class InMemoryStateBackend(StateBackend):
+    # Un único worker: el pub/sub se entrega en el mismo proceso
+    def __init__(self):
+        super().__init__()
+        self.values = TTLCache(settings.DECISION_STORE_SIZE, settings.DECISION_STORE_TTL)
+
+    async def publish(self, channel: str, message: dict):
+        handler = self.handlers.get(channel)
+        if handler:
+            await handler(message)
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self.handlers[channel] = handler
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self.values.set(key, value, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.values.peek(key)
+
+    def live_workers(self) -> Set[str]:
+        return {self.worker_id}
+
+class RedisStateBackend(StateBackend):
+    # Cualquier servidor que hable el protocolo de Redis (Redis, Valkey, KeyDB, stand-ins locales)
+    distributed = True
+    WORKERS_KEY = "baiby:workers"
+
+    def __init__(self, url: str):
+        super().__init__()
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND_URL usa Redis pero falta el paquete 'redis'") from e
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.pubsub = self.redis.pubsub()
+        self.workers: Set[str] = {self.worker_id}
+        self._tasks = []
+
+    async def start(self):
+        await self._heartbeat()
+        self._tasks.append(asyncio.create_task(self._heartbeat_loop()))
+        logger.info(f"Backend de estado Redis iniciado (worker {self.worker_id})")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        try:
+            await self.redis.zrem(self.WORKERS_KEY, self.worker_id)
+            await self.pubsub.aclose()
+        finally:
+            await self.redis.aclose()
+
+    async def publish(self, channel: str, message: dict):
+        await self.redis.publish(channel, json.dumps(message))
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self.handlers[channel] = handler
+        await self.pubsub.subscribe(channel)
+        if len(self._tasks) < 2:
+            # El lector se arranca con la primera suscripción
+            self._tasks.append(asyncio.create_task(self._read_loop()))
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.redis.set(key, json.dumps(value), ex=max(1, int(ttl)))
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.redis.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def live_workers(self) -> Set[str]:
+        # Vista refrescada en cada heartbeat para no consultar Redis en el camino crítico
+        return set(self.workers)
+
+    async def _heartbeat(self):
+        now = time.time()
+        await self.redis.zadd(self.WORKERS_KEY, {self.worker_id: now})
+        await self.redis.zremrangebyscore(self.WORKERS_KEY, 0, now - settings.WORKER_TTL)
+        self.workers = set(await self.redis.zrangebyscore(self.WORKERS_KEY, now - settings.WORKER_TTL, "+inf"))
+        self.workers.add(self.worker_id)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(settings.WORKER_HEARTBEAT_INTERVAL)
+            try:
+                await self._heartbeat()
+            except Exception as e:
+                logger.error(f"Error en heartbeat del worker: {e}")
+
+    async def _read_loop(self):
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    handler = self.handlers.get(message["channel"])
+                    if handler:
+                        try:
+                            await handler(json.loads(message["data"]))
+                        except Exception as e:
+                            logger.error(f"Error procesando mensaje de {message['channel']}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error leyendo pub/sub de Redis: {e}")
+                await asyncio.sleep(1)
+
+def create_state_backend(url: str) -> StateBackend:
+    if url.startswith("memory://"):
+        return InMemoryStateBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateBackend(url)
+    raise ValueError(f"STATE_BACKEND_URL no soportada: {url}")
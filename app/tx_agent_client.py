@@ -0,0 +1,144 @@
+from app.config import settings
+from app import metrics
+from typing import Optional
+import asyncio
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Interfaz común de los dos modos: start(), close(), decide(data) -> dict y stats()
+
+class TxAgentClient:
+    # Modo remoto: txAgent como servicio aparte, vía HTTP
+    mode = "remote"
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        # Métricas del pool
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self.saturated_requests = 0  # Peticiones que llegaron con el pool lleno y tuvieron que esperar conexión
+        self.pool_timeouts = 0
+
+    def _http2_enabled(self) -> bool:
+        if not settings.TX_AGENT_HTTP2:
+            return False
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warning("TX_AGENT_HTTP2 activado pero falta el paquete 'h2', se usa HTTP/1.1")
+            return False
+
+    async def start(self):
+        if self.client is not None:
+            return
+        limits = httpx.Limits(
+            max_connections=settings.TX_AGENT_POOL_SIZE,
+            max_keepalive_connections=settings.TX_AGENT_POOL_KEEPALIVE,
+            keepalive_expiry=settings.TX_AGENT_KEEPALIVE_EXPIRY
+        )
+        timeout = httpx.Timeout(settings.TX_AGENT_TIMEOUT, pool=settings.TX_AGENT_POOL_TIMEOUT)
+        self.client = httpx.AsyncClient(limits=limits, timeout=timeout, http2=self._http2_enabled())
+        logger.info(f"Pool de conexiones a txAgent iniciado (max={settings.TX_AGENT_POOL_SIZE})")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def post(self, data: dict) -> httpx.Response:
+        if self.client is None:
+            # Uso fuera del lifespan (scripts, tests): iniciamos el pool bajo demanda
+            await self.start()
+
+        self.total_requests += 1
+        if self.in_flight >= settings.TX_AGENT_POOL_SIZE:
+            self.saturated_requests += 1
+            metrics.TX_AGENT_POOL_SATURATED.inc()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await self.client.post(settings.TX_AGENT_URL, json=data)
+        except httpx.PoolTimeout:
+            self.pool_timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def decide(self, data: dict) -> dict:
+        response = await self.post(data)
+        return response.json()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "pool_size": settings.TX_AGENT_POOL_SIZE,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "total_requests": self.total_requests,
+            "saturated_requests": self.saturated_requests,
+            "pool_timeouts": self.pool_timeouts,
+            "saturation": self.in_flight / settings.TX_AGENT_POOL_SIZE
+        }
+
+class EmbeddedTxAgent:
+    # Modo embebido: el pipeline de txAgent corre en este proceso, sin salto HTTP ni doble serialización
+    mode = "embedded"
+
+    def __init__(self):
+        self.agent = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self.timeouts = 0
+
+    async def start(self):
+        if self.agent is not None:
+            return
+        # Import diferido: el modo remoto no necesita las dependencias de txAgent (openai, supabase)
+        from baiby_agent import txagent
+        await txagent.startup()
+        self.agent = txagent
+        logger.info("txAgent embebido iniciado en el proceso del core")
+
+    async def close(self):
+        if self.agent is not None:
+            await self.agent.shutdown()
+            self.agent = None
+
+    async def decide(self, data: dict) -> dict:
+        if self.agent is None:
+            await self.start()
+
+        self.total_requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            request = self.agent.TransactionRequest(**data)
+            return await asyncio.wait_for(self.agent.decide(request), timeout=settings.TX_AGENT_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "total_requests": self.total_requests,
+            "timeouts": self.timeouts
+        }
+
+def create_tx_agent(mode: str):
+    if mode == "remote":
+        return TxAgentClient()
+    if mode == "embedded":
+        return EmbeddedTxAgent()
+    raise ValueError(f"TX_AGENT_MODE no soportado: {mode}")
+
+tx_agent_client = create_tx_agent(settings.TX_AGENT_MODE)
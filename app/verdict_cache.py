@@ -0,0 +1,122 @@
+from app.config import settings
+from app import metrics
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    # Cache LRU acotado en tamaño con expiración por entrada
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: str) -> Optional[Any]:
+        # Consulta sin afectar a las estadísticas ni al orden LRU
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            return None
+        return item[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return item[1] if item is not None else default
+
+    def purge_expired(self) -> int:
+        # Las entradas caducadas solo se borran al consultarlas; esto las barre de golpe
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at < now]
+        for key in expired:
+            del self._data[key]
+        self.expirations += len(expired)
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+class VerdictCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize, ttl)
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[dict]],
+        cacheable: Callable[[dict], bool] = lambda result: True
+    ) -> dict:
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info(f"Veredicto en cache para {key}")
+            metrics.VERDICT_CACHE_HITS.inc()
+            return cached
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            # Misma transacción en curso: nos colgamos de la decisión que ya se está tomando
+            self.coalesced += 1
+            metrics.VERDICT_CACHE_COALESCED.inc()
+            logger.info(f"Petición idéntica en curso para {key}, esperando su decisión")
+        else:
+            task = asyncio.ensure_future(compute())
+            self.in_flight[key] = task
+
+            def _done(t: asyncio.Task):
+                self.in_flight.pop(key, None)
+                if not t.cancelled() and t.exception() is None and self.cache.ttl > 0 and cacheable(t.result()):
+                    self.cache.set(key, t.result())
+
+            task.add_done_callback(_done)
+
+        # shield: si un cliente se desconecta no cancela la decisión compartida
+        return await asyncio.shield(task)
+
+    def has_decision(self, key: str) -> bool:
+        return key in self.in_flight or self.cache.peek(key) is not None
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "in_flight": len(self.in_flight), "coalesced": self.coalesced}
+
+verdict_cache = VerdictCache(settings.VERDICT_CACHE_SIZE, settings.VERDICT_CACHE_TTL)
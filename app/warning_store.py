@@ -0,0 +1,57 @@
+from app.verdict_cache import TTLCache
+from app import metrics
+from typing import List
+import logging
+
+logger = logging.getLogger(__name__)
+
+class WarningStore:
+    # Warnings recibidos por hash, acotados en tamaño y con caducidad: respuestas tardías,
+    # hashes desconocidos o mensajes falsificados no pueden hacer crecer la memoria
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize, ttl)
+        self.orphaned = 0
+
+    def add(self, tx_hash: str, entry: dict):
+        collected = self.cache.peek(tx_hash)
+        if collected is None:
+            collected = []
+            evictions = self.cache.evictions
+            self.cache.set(tx_hash, collected)
+            metrics.WARNING_STORE_EVICTED.inc(self.cache.evictions - evictions)
+        # Un mismo bot puede repetir el mismo warning para varias subtransacciones
+        if not any(w["bot"] == entry["bot"] and w["message"] == entry["message"] for w in collected):
+            collected.append(entry)
+
+    def discard_orphan(self, tx_hash: str, bot: str):
+        # Warning para un hash que nadie espera (timeout ya vencido, hash desconocido)
+        self.orphaned += 1
+        metrics.WARNING_STORE_ORPHANED.inc()
+        logger.warning(f"Warning huérfano descartado para {tx_hash} (bot {bot})")
+
+    def get(self, tx_hash: str) -> List[dict]:
+        return self.cache.peek(tx_hash) or []
+
+    def pop(self, tx_hash: str):
+        self.cache.pop(tx_hash)
+
+    def purge_expired(self) -> int:
+        expired = self.cache.purge_expired()
+        metrics.WARNING_STORE_EVICTED.inc(expired)
+        return expired
+
+    @property
+    def evicted(self) -> int:
+        return self.cache.evictions + self.cache.expirations
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.cache),
+            "maxsize": self.cache.maxsize,
+            "ttl": self.cache.ttl,
+            "evicted": self.evicted,
+            "orphaned": self.orphaned
+        }
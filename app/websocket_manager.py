@@ -1,57 +1,483 @@
 from fastapi import WebSocket
-from typing import List, Dict
+from typing import List, Dict, Set, Optional
 import json
 import asyncio
 import logging
+import hashlib
+import time
+import uuid
+from app.bot_latency import BotLatencyTracker
+from app.bot_connection import BotConnection, OutboundFrame, ENCODINGS
+from app.bot_routing import BotCapabilities, RoutingIndex
+from app.warning_store import WarningStore
+from app.pending_decisions import pending_decisions
+from app.config import settings
+from app.state_backend import InMemoryStateBackend, StateBackend, TRANSACTIONS_CHANNEL, worker_channel
+from app import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Orden de severidad para priorizar los warnings al fusionarlos
+SEVERITY_RANK = {"info": 0, "low": 1, "warning": 2, "medium": 2, "high": 3, "critical": 4}
+
 class WebSocketManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.warnings: Dict[str, dict] = {}  # hash -> warning data
+        # Registro de conexiones por id (cola de salida, escritor y heartbeat de cada bot)
+        self.connections: Dict[str, BotConnection] = {}
+        self.connection_ids: Dict[WebSocket, str] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.routing = RoutingIndex()  # manifiestos de capacidades por conexión
+        # Réplicas de un mismo bot: transacciones asignadas a cada conexión y aún sin veredicto
+        self.outstanding: Dict[str, Dict[str, dict]] = {}  # connection id -> hash -> payload enviado
+        # hash -> warnings de todos los bots; solo se guardan los de transacciones que se están esperando
+        self.warnings = WarningStore(settings.WARNING_STORE_SIZE, settings.WARNING_STORE_TTL)
+        # Quorum por transacción: bots a los que se envió el hash y bots que ya respondieron
+        self.expected_bots: Dict[str, Set[str]] = {}
+        self.responded_bots: Dict[str, Set[str]] = {}
+        # Latencia de respuesta por bot para calcular plazos de espera adaptativos
+        self.bot_names: Dict[str, str] = {}  # connection id -> nombre declarado por el bot
+        self.dispatched_at: Dict[str, float] = {}  # hash -> instante del broadcast
+        self.latency = BotLatencyTracker()
+        # Estado compartido entre workers (memoria por defecto, Redis en despliegues multi-worker)
+        self.backend: StateBackend = InMemoryStateBackend()
+        self.awaiting_workers: Dict[str, Set[str]] = {}  # hash -> workers que aún no anunciaron sus bots
+        self.remote_origins: Dict[str, dict] = {}  # hash -> worker de origen y bots locales pendientes
+
+    async def attach_backend(self, backend: StateBackend):
+        self.backend = backend
+        if backend.distributed:
+            await backend.subscribe(TRANSACTIONS_CHANNEL, self._on_remote_transactions)
+            await backend.subscribe(worker_channel(backend.worker_id), self._on_worker_event)
+
+    def start_heartbeat(self):
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop_heartbeat(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"Nueva conexión WebSocket. Total conexiones: {len(self.active_connections)}")
+        conn_id = uuid.uuid4().hex
+        self.connection_ids[websocket] = conn_id
+        encoding = websocket.query_params.get("encoding", "json")
+        if encoding not in ENCODINGS:
+            logger.warning(f"Codificación desconocida '{encoding}', se usa json")
+            encoding = "json"
+        self.connections[conn_id] = BotConnection(websocket, conn_id, self._evict, encoding)
+        logger.info(f"Nueva conexión WebSocket. Total conexiones: {len(self.connections)}")
+
+    async def _evict(self, connection: BotConnection, reason: str):
+        await self.disconnect(connection.websocket)
 
     async def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            logger.info(f"WebSocket desconectado. Conexiones restantes: {len(self.active_connections)}")
-
-    async def broadcast(self, message: dict):
-        logger.info(f"Intentando broadcast a {len(self.active_connections)} conexiones")
-        disconnected = []
-        
-        for connection in self.active_connections:
+        # Un bot desconectado ya no va a responder: lo sacamos del quorum pendiente
+        conn_id = self.connection_ids.pop(websocket, None)
+        if conn_id:
+            connection = self.connections.pop(conn_id, None)
+            if connection:
+                await connection.close()
+            logger.info(f"WebSocket desconectado. Conexiones restantes: {len(self.connections)}")
+            self.routing.remove(conn_id)
+            # Lo que esta réplica no llegó a contestar pasa a otra del mismo tipo
+            orphaned = self.outstanding.pop(conn_id, {})
+            if orphaned:
+                try:
+                    await self._redeliver(self._bot_group(conn_id), orphaned)
+                except Exception as e:
+                    # Un fallo al reenviar no puede dejar sin limpiar el quorum ni a los que esperan
+                    logger.error(f"Error reenviando transacciones de {conn_id}: {e}")
+            if conn_id not in self.bot_names:
+                # Bot sin nombre: su historial no sobrevive a una reconexión
+                self.latency.forget(conn_id)
+            self.bot_names.pop(conn_id, None)
+            self._drop_expected_bot(conn_id)
+            # Avisar a los workers de origen de transacciones que este bot ya no contestará
+            for tx_hash, remote in list(self.remote_origins.items()):
+                if conn_id in remote["pending"]:
+                    await self._publish_to_origin(tx_hash, {"type": "gone", "hash": tx_hash, "bot_id": conn_id})
+
+    def _drop_expected_bot(self, conn_id: str):
+        for tx_hash, expected in list(self.expected_bots.items()):
+            if conn_id in expected and conn_id not in self.responded_bots.get(tx_hash, set()):
+                expected.discard(conn_id)
+                if self.quorum_reached(tx_hash):
+                    self._notify(tx_hash)
+
+    def _connection_for(self, websocket: WebSocket) -> Optional[BotConnection]:
+        conn_id = self.connection_ids.get(websocket)
+        return self.connections.get(conn_id) if conn_id else None
+
+    def mark_alive(self, websocket: WebSocket):
+        connection = self._connection_for(websocket)
+        if connection:
+            connection.mark_alive()
+
+    def process_pong(self, websocket: WebSocket):
+        connection = self._connection_for(websocket)
+        if connection:
+            connection.record_pong()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(settings.WS_PING_INTERVAL)
             try:
-                await connection.send_json(message)
-                logger.info(f"Mensaje enviado exitosamente a una conexión")
+                await self._heartbeat()
             except Exception as e:
-                logger.error(f"Error en broadcast: {e}")
-                disconnected.append(connection)
-        
-        # Limpiar conexiones desconectadas
-        for conn in disconnected:
-            await self.disconnect(conn)
-
-    async def process_warning(self, warning_data: dict):
+                logger.error(f"Error en heartbeat de bots: {e}")
+
+    async def _heartbeat(self):
+        # Solo se expulsa por silencio a los bots que ya contestaron algún ping;
+        # los que no implementan pong quedan cubiertos por los pings del protocolo WebSocket
+        now = time.monotonic()
+        ping = OutboundFrame({"type": "ping", "ts": time.time()})
+        for connection in list(self.connections.values()):
+            if connection.heartbeat and now - connection.last_seen > settings.WS_PING_TIMEOUT:
+                await connection.evict("heartbeat_timeout")
+                continue
+            connection.ping_sent_at = now
+            connection.enqueue(ping)
+        expired = self.warnings.purge_expired()
+        if expired:
+            logger.warning(f"{expired} entradas de warnings caducadas sin consumir")
+
+    def register_capabilities(self, manifest: dict, websocket: WebSocket):
+        # Manifiesto enviado por el bot al conectar: qué cadenas, selectores y valores le interesan
+        conn_id = self.connection_ids.get(websocket)
+        if not conn_id:
+            return
+        if manifest.get("bot"):
+            self.bot_names[conn_id] = manifest["bot"]
+        capabilities = BotCapabilities.from_manifest(manifest)
+        self.routing.register(conn_id, capabilities)
+        logger.info(f"📋 Capacidades de {self.bot_name(conn_id)}: {capabilities}")
+
+    async def broadcast(self, message: dict) -> Dict[str, Set[str]]:
+        started = time.monotonic()
+        if self.backend.distributed:
+            # Hasta que cada worker anuncie a qué bots entregó el mensaje no hay quorum posible
+            workers = self.backend.live_workers()
+            for tx_hash in self._message_hashes(message):
+                self.awaiting_workers[tx_hash] = set(workers)
+
+        delivered = await self._send_local(message)
+
+        if self.backend.distributed:
+            await self.backend.publish(TRANSACTIONS_CHANNEL, {"origin": self.backend.worker_id, "message": message})
+
+        metrics.BROADCAST_SECONDS.observe(time.monotonic() - started)
+        for bots in delivered.values():
+            metrics.BROADCAST_FANOUT.observe(len(bots))
+        return delivered
+
+    async def _send_local(self, message: dict) -> Dict[str, Set[str]]:
+        # Solo se encola: cada bot tiene su escritor, así el más lento no frena al resto.
+        # Cada transacción va solo a los bots cuyo manifiesto encaja; devuelve hash -> bots que la recibieron
+        if message.get("type") == "transaction_batch":
+            items = message.get("data", [])
+        else:
+            items = [message.get("data", {})]
+        delivered: Dict[str, Set[str]] = {item.get("hash"): set() for item in items}
+        if not self.connections:
+            return delivered
+
+        connections = self.connections
+        routes = self._shard(items, [self.routing.route(item, connections) for item in items], connections)
+
+        # Los bots que reciben el mismo subconjunto comparten un único frame serializado
+        groups: Dict[tuple, List[BotConnection]] = {}
+        for conn_id, connection in connections.items():
+            selected = tuple(i for i, targets in enumerate(routes) if conn_id in targets)
+            if selected:
+                groups.setdefault(selected, []).append(connection)
+
+        for selected, group in groups.items():
+            if message.get("type") == "transaction_batch":
+                frame = OutboundFrame({**message, "data": [items[i] for i in selected]})
+            else:
+                frame = OutboundFrame(message)
+            for connection in group:
+                if connection.enqueue(frame):
+                    assigned = self.outstanding.setdefault(connection.conn_id, {})
+                    for i in selected:
+                        delivered[items[i].get("hash")].add(connection.conn_id)
+                        assigned[items[i].get("hash")] = items[i]
+
+        return delivered
+
+    def _bot_group(self, conn_id: str) -> str:
+        # Las réplicas de un mismo tipo de bot comparten nombre; sin nombre cada conexión es su propio grupo
+        return self.bot_names.get(conn_id, conn_id)
+
+    def _pick_replica(self, tx_hash: str, replicas: List[str], connections: Dict[str, BotConnection], load: Dict[str, int]) -> str:
+        if settings.BOT_SHARDING == "consistent_hash":
+            # Rendezvous hashing: al entrar o salir una réplica solo se mueven sus transacciones
+            return max(replicas, key=lambda conn_id: hashlib.sha1(f"{conn_id}:{tx_hash}".encode()).digest())
+        # least_outstanding: la réplica con menos trabajo pendiente, evitando las degradadas
+        return min(replicas, key=lambda conn_id: (connections[conn_id].degraded, load.get(conn_id, 0), conn_id))
+
+    def _shard(self, items: List[dict], routes: List[Set[str]], connections: Dict[str, BotConnection]) -> List[Set[str]]:
+        # Cada transacción va a una sola réplica por tipo de bot
+        if settings.BOT_SHARDING == "off":
+            return routes
+        load = {conn_id: len(self.outstanding.get(conn_id, ())) for conn_id in connections}
+        sharded = []
+        for item, targets in zip(items, routes):
+            groups: Dict[str, List[str]] = {}
+            for conn_id in targets:
+                groups.setdefault(self._bot_group(conn_id), []).append(conn_id)
+            chosen = set()
+            for replicas in groups.values():
+                conn_id = replicas[0] if len(replicas) == 1 else self._pick_replica(item.get("hash"), replicas, connections, load)
+                load[conn_id] = load.get(conn_id, 0) + 1
+                chosen.add(conn_id)
+            sharded.append(chosen)
+        return sharded
+
+    async def _redeliver(self, group: str, orphaned: Dict[str, dict]):
+        connections = self.connections
+        replicas = [conn_id for conn_id in connections if self._bot_group(conn_id) == group]
+        if not replicas:
+            return
+        load = {conn_id: len(self.outstanding.get(conn_id, ())) for conn_id in replicas}
+        for tx_hash, item in orphaned.items():
+            remote = self.remote_origins.get(tx_hash)
+            waiting_local = tx_hash in self.dispatched_at
+            if not waiting_local and remote is None:
+                continue  # la transacción ya se resolvió
+            candidates = list(self.routing.route(item, replicas))
+            if not candidates:
+                continue
+            conn_id = self._pick_replica(tx_hash, candidates, connections, load)
+            if not connections[conn_id].enqueue(OutboundFrame({"type": "transaction", "data": item})):
+                continue
+            load[conn_id] = load.get(conn_id, 0) + 1
+            self.outstanding.setdefault(conn_id, {})[tx_hash] = item
+            metrics.BOT_REDELIVERIES.inc()
+            logger.info(f"🔁 Transacción {tx_hash} reenviada a otra réplica de {group}")
+            if waiting_local:
+                self.expected_bots.setdefault(tx_hash, set()).add(conn_id)
+            if remote is not None:
+                remote["pending"].add(conn_id)
+                await self.backend.publish(worker_channel(remote["origin"]), {
+                    "type": "dispatch",
+                    "worker": self.backend.worker_id,
+                    "hashes": [tx_hash],
+                    "routes": {tx_hash: [conn_id]},
+                    "bots": {conn_id: self.bot_name(conn_id)}
+                })
+
+    def _settle(self, tx_hash: str, conn_id: Optional[str]):
+        if conn_id:
+            assigned = self.outstanding.get(conn_id)
+            if assigned is not None:
+                assigned.pop(tx_hash, None)
+
+    def replica_stats(self) -> dict:
+        groups: Dict[str, Dict[str, int]] = {}
+        for conn_id in self.connections:
+            groups.setdefault(self._bot_group(conn_id), {})[conn_id] = len(self.outstanding.get(conn_id, ()))
+        return {"strategy": settings.BOT_SHARDING, "groups": groups}
+
+    @staticmethod
+    def _message_hashes(message: dict) -> List[str]:
+        if message.get("type") == "transaction_batch":
+            return [item.get("hash") for item in message.get("data", [])]
+        return [message.get("data", {}).get("hash")]
+
+    async def _on_remote_transactions(self, payload: dict):
+        # Transacción originada en otro worker: se entrega a los bots de este worker
+        origin = payload.get("origin")
+        if origin == self.backend.worker_id:
+            return
+        message = payload["message"]
+        hashes = self._message_hashes(message)
+        for tx_hash in hashes:
+            self.remote_origins[tx_hash] = {"origin": origin, "pending": set(), "answered": set(), "dispatched": False}
+
+        delivered = await self._send_local(message)
+
+        loop = asyncio.get_running_loop()
+        for tx_hash in hashes:
+            remote = self.remote_origins.get(tx_hash)
+            if remote is not None:
+                remote["pending"].update(delivered.get(tx_hash, set()) - remote["answered"])
+                remote["dispatched"] = True
+                if not remote["pending"]:
+                    self.remote_origins.pop(tx_hash, None)
+                else:
+                    loop.call_later(settings.BOT_RESPONSE_TIMEOUT, self._expire_remote, tx_hash, remote)
+
+        await self.backend.publish(worker_channel(origin), {
+            "type": "dispatch",
+            "worker": self.backend.worker_id,
+            "hashes": hashes,
+            "routes": {tx_hash: list(bots) for tx_hash, bots in delivered.items()},
+            "bots": {conn_id: self.bot_name(conn_id) for bots in delivered.values() for conn_id in bots}
+        })
+
+    def _expire_remote(self, tx_hash: str, remote: dict):
+        if self.remote_origins.get(tx_hash) is remote:
+            self.remote_origins.pop(tx_hash, None)
+            for conn_id in remote["pending"]:
+                self._settle(tx_hash, conn_id)
+
+    async def _publish_to_origin(self, tx_hash: str, event: dict):
+        remote = self.remote_origins.get(tx_hash)
+        if remote is None:
+            return
+        if event.get("bot_id"):
+            remote["pending"].discard(event["bot_id"])
+            remote["answered"].add(event["bot_id"])
+        await self.backend.publish(worker_channel(remote["origin"]), event)
+        if remote["dispatched"] and not remote["pending"]:
+            self._expire_remote(tx_hash, remote)
+
+    async def _on_worker_event(self, event: dict):
+        # Eventos de otros workers sobre transacciones originadas aquí
+        event_type = event.get("type")
+        if event_type == "dispatch":
+            for conn_id, name in event.get("bots", {}).items():
+                self.bot_names.setdefault(conn_id, name)
+            routes = event.get("routes", {})
+            for tx_hash in event.get("hashes", []):
+                self.expected_bots.setdefault(tx_hash, set()).update(routes.get(tx_hash, []))
+                self.awaiting_workers.get(tx_hash, set()).discard(event.get("worker"))
+                if self.quorum_reached(tx_hash):
+                    self._notify(tx_hash)
+        elif event_type == "warning":
+            self._apply_warning(event["hash"], event["data"], event["bot_id"])
+        elif event_type == "clean":
+            self._apply_clean(event["hash"], event["data"], event["bot_id"])
+        elif event_type == "gone":
+            self._drop_expected_bot(event["bot_id"])
+
+    def bot_name(self, conn_id: str) -> str:
+        return self.bot_names.get(conn_id, conn_id)
+
+    def mark_dispatched(self, tx_hash: str):
+        self.dispatched_at.setdefault(tx_hash, time.monotonic())
+
+    def response_deadline(self, tx_hash: str) -> float:
+        # Instante (time.monotonic) hasta el que se esperan veredictos para este hash
+        dispatched = self.dispatched_at.get(tx_hash, time.monotonic())
+        if self.awaiting_workers.get(tx_hash):
+            # Aún no sabemos qué bots remotos recibieron la transacción
+            return dispatched + settings.BOT_RESPONSE_TIMEOUT
+        expected = self.expected_bots.get(tx_hash, set())
+        return dispatched + self.latency.deadline_for(self.bot_name(conn_id) for conn_id in expected)
+
+    def expect_verdicts(self, tx_hash: str, bot_ids: Set[str]):
+        # Solo cuentan los bots locales que siguen conectados; los remotos llegan con su anuncio
+        self.expected_bots.setdefault(tx_hash, set()).update(bot_id for bot_id in bot_ids if bot_id in self.connections)
+        self.awaiting_workers.get(tx_hash, set()).discard(self.backend.worker_id)
+        if self.quorum_reached(tx_hash):
+            self._notify(tx_hash)
+
+    def quorum_reached(self, tx_hash: str) -> bool:
+        expected = self.expected_bots.get(tx_hash)
+        if expected is None or self.awaiting_workers.get(tx_hash):
+            return False
+        return expected <= self.responded_bots.get(tx_hash, set())
+
+    def _record_response(self, tx_hash: str, conn_id: Optional[str], bot: Optional[str] = None):
+        if conn_id:
+            if bot:
+                self.bot_names[conn_id] = bot
+            responded = self.responded_bots.setdefault(tx_hash, set())
+            dispatched = self.dispatched_at.get(tx_hash)
+            if conn_id not in responded and dispatched is not None:
+                self.latency.observe(self.bot_name(conn_id), time.monotonic() - dispatched)
+            responded.add(conn_id)
+
+    def _notify(self, tx_hash: str):
+        # Notificar a la transacción que está esperando
+        pending_decisions.notify(tx_hash)
+
+    async def process_warning(self, warning_data: dict, websocket: Optional[WebSocket] = None):
         tx_hash = warning_data.get("transaction_hash")
         if tx_hash:
-            self.warnings[tx_hash] = warning_data
-            # Notificar a la transacción que está esperando
-            from app.routes import active_transactions
-            event = active_transactions.get(tx_hash)
-            if event:
-                event.set()
-
-    def get_warning(self, tx_hash: str) -> dict:
+            conn_id = self.connection_ids.get(websocket) if websocket is not None else None
+            self._settle(tx_hash, conn_id)
+            if tx_hash in self.remote_origins:
+                # La transacción se originó en otro worker: el veredicto viaja por el backend
+                await self._publish_to_origin(tx_hash, {"type": "warning", "hash": tx_hash, "bot_id": conn_id, "data": warning_data})
+                return
+            self._apply_warning(tx_hash, warning_data, conn_id)
+
+    def _apply_warning(self, tx_hash: str, warning_data: dict, conn_id: Optional[str]):
+        if tx_hash not in self.dispatched_at:
+            self.warnings.discard_orphan(tx_hash, warning_data.get("bot") or conn_id or "unknown")
+            return
+        entry = {
+            "bot": warning_data.get("bot") or conn_id or "unknown",
+            "severity": str(warning_data.get("severity", "warning")).lower(),
+            "message": warning_data.get("message", ""),
+            "data": warning_data
+        }
+        self.warnings.add(tx_hash, entry)
+        self._record_response(tx_hash, conn_id, warning_data.get("bot"))
+        self._notify(tx_hash)
+
+    async def process_clean(self, verdict_data: dict, websocket: Optional[WebSocket] = None):
+        tx_hash = verdict_data.get("transaction_hash")
+        if tx_hash:
+            conn_id = self.connection_ids.get(websocket) if websocket is not None else None
+            self._settle(tx_hash, conn_id)
+            if tx_hash in self.remote_origins:
+                await self._publish_to_origin(tx_hash, {"type": "clean", "hash": tx_hash, "bot_id": conn_id, "data": verdict_data})
+                return
+            self._apply_clean(tx_hash, verdict_data, conn_id)
+
+    def _apply_clean(self, tx_hash: str, verdict_data: dict, conn_id: Optional[str]):
+        if tx_hash not in self.dispatched_at:
+            return  # veredicto tardío o de un hash desconocido
+        self._record_response(tx_hash, conn_id, verdict_data.get("bot"))
+        if self.quorum_reached(tx_hash):
+            logger.info(f"Quorum alcanzado para {tx_hash}: todos los bots respondieron")
+            self._notify(tx_hash)
+
+    def get_warnings(self, tx_hash: str) -> List[dict]:
         return self.warnings.get(tx_hash)
 
+    def get_warning(self, tx_hash: str) -> Optional[dict]:
+        # Fusiona todos los warnings recibidos en un único payload para txAgent
+        collected = self.warnings.get(tx_hash)
+        if not collected:
+            return None
+
+        ordered = sorted(collected, key=lambda w: SEVERITY_RANK.get(w["severity"], 2), reverse=True)
+        return {
+            "type": "warning",
+            "status": "warning",
+            "transaction_hash": tx_hash,
+            "severity": ordered[0]["severity"],
+            "message": " | ".join(f"[{w['bot']}] {w['message']}" for w in ordered),
+            "warnings": [
+                {"bot": w["bot"], "severity": w["severity"], "message": w["message"]}
+                for w in ordered
+            ]
+        }
+
     def clear_warning(self, tx_hash: str):
-        self.warnings.pop(tx_hash, None)
+        self.warnings.pop(tx_hash)
+
+    def clear_transaction(self, tx_hash: str):
+        self.warnings.pop(tx_hash)
+        self.awaiting_workers.pop(tx_hash, None)
+        expected = self.expected_bots.pop(tx_hash, set())
+        responded = self.responded_bots.pop(tx_hash, set())
+        for conn_id in expected:
+            self._settle(tx_hash, conn_id)
+        dispatched = self.dispatched_at.pop(tx_hash, None)
+        if dispatched is not None:
+            # Los bots que no respondieron a tiempo cuentan con el tiempo esperado como cota inferior,
+            # así su percentil sube en lugar de quedar sesgado hacia las respuestas rápidas
+            elapsed = time.monotonic() - dispatched
+            for conn_id in expected - responded:
+                self.latency.observe(self.bot_name(conn_id), elapsed)
 
-ws_manager = WebSocketManager() 
\ No newline at end of file
+ws_manager = WebSocketManager()
@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))  # Segundos que vale una decisión del LLM
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "10000"))  # Decisiones en memoria (LRU); 0 desactiva la cache
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")  # Fichero SQLite opcional para sobrevivir a reinicios
+
+Decision = Tuple[bool, str]
+
+def _normalize_text(text: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip()).lower()
+
+def _normalize_value(value: str) -> str:
+    try:
+        return str(int(str(value).strip(), 0))
+    except ValueError:
+        return str(value).strip().lower()
+
+def cache_key(status: Optional[str], reason: str, bot_reason: Optional[str], transactions: list, prompt_version: str = "") -> str:
+    # Solo entra lo que ve el LLM en el prompt: misma entrada normalizada, misma decisión (temperature=0).
+    # La versión del prompt invalida las decisiones guardadas con instrucciones anteriores
+    normalized = {
+        "prompt_version": prompt_version,
+        "status": _normalize_text(status),
+        "reason": _normalize_text(reason),
+        "bot_reason": _normalize_text(bot_reason),
+        "transactions": [
+            {
+                "to": (tx.to or "").strip().lower(),
+                "data": (tx.data or "").strip().lower(),
+                "value": _normalize_value(tx.value)
+            } for tx in transactions
+        ]
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+class DecisionCache:
+    # Decisiones del LLM por entrada normalizada, con TTL, LRU y coalescencia de peticiones idénticas
+    def __init__(self, maxsize: int, ttl: float, path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, Decision]]" = OrderedDict()
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.db: Optional[sqlite3.Connection] = None
+        # Escrituras a disco pendientes (write-behind): las vuelca un hilo para no bloquear el event loop
+        self._pending: Dict[str, tuple] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        if path and maxsize > 0:
+            self._open(path)
+
+    def _open(self, path: str):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_decisions (key TEXT PRIMARY KEY, expires_at REAL, approved INTEGER, response TEXT)"
+        )
+        # En disco la caducidad es en tiempo de pared; en memoria, monotónica
+        now_wall, now_mono = time.time(), time.monotonic()
+        self.db.execute("DELETE FROM llm_decisions WHERE expires_at < ?", (now_wall,))
+        self.db.commit()
+        rows = self.db.execute(
+            "SELECT key, expires_at, approved, response FROM llm_decisions ORDER BY expires_at DESC LIMIT ?",
+            (self.maxsize,)
+        ).fetchall()
+        for key, expires_at, approved, response in reversed(rows):
+            self._data[key] = (now_mono + (expires_at - now_wall), (bool(approved), response))
+        logger.info(f"Cache de decisiones LLM cargada desde {path}: {len(rows)} entradas")
+
+    def get(self, key: str) -> Optional[Decision]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, decision = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return decision
+
+    def set(self, key: str, decision: Decision):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, decision)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        if self.db is not None:
+            self._pending[key] = (key, time.time() + self.ttl, int(decision[0]), decision[1])
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Fuera del event loop (scripts) se escribe en el momento
+            self._write(self._take_pending())
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush())
+
+    def _take_pending(self) -> list:
+        rows = list(self._pending.values())
+        self._pending.clear()
+        return rows
+
+    async def _flush(self):
+        # Un único volcado a la vez: la conexión SQLite nunca se usa desde dos hilos a la vez
+        while self._pending:
+            await asyncio.to_thread(self._write, self._take_pending())
+
+    def _write(self, rows: list):
+        try:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO llm_decisions (key, expires_at, approved, response) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error guardando {len(rows)} decisiones LLM en disco: {e}")
+
+    async def close(self):
+        # Volcar lo pendiente antes de parar para no perder decisiones
+        if self._flush_task is not None:
+            await self._flush_task
+        if self.db is not None and self._pending:
+            await asyncio.to_thread(self._write, self._take_pending())
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Tuple[Decision, bool]]]) -> Tuple[Decision, str]:
+        # compute devuelve (decisión, cacheable); el segundo valor del resultado es hit | coalesced | miss
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached, "hit"
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            decision, _ = await asyncio.shield(task)
+            return decision, "coalesced"
+
+        self.misses += 1
+        task = asyncio.ensure_future(compute())
+        self.in_flight[key] = task
+        try:
+            decision, cacheable = await asyncio.shield(task)
+        finally:
+            self.in_flight.pop(key, None)
+        if cacheable:
+            self.set(key, decision)
+        return decision, "miss"
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "persistent": self.db is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0
+        }
+
+decision_cache = DecisionCache(LLM_CACHE_SIZE, LLM_CACHE_TTL, LLM_CACHE_PATH)
@@ -0,0 +1,88 @@
+from openai import AsyncOpenAI
+from typing import AsyncIterator, List, Optional
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Backend del LLM: cualquier servidor compatible con la API de OpenAI (OpenAI, vLLM, Ollama,
+# o baiby_agent/stub_llm_server.py para pruebas locales) seleccionado con OPENAI_BASE_URL
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # None = api.openai.com
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4-turbo")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # Llamadas simultáneas al LLM
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # Segundos por llamada, reintentos incluidos
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+
+class LLMClient:
+    # Cliente asíncrono: una llamada lenta ya no bloquea el event loop de txAgent
+    def __init__(self, api_key: Optional[str], base_url: Optional[str], model: str, max_concurrency: int, timeout: float, max_retries: int):
+        self.client = AsyncOpenAI(
+            api_key=api_key or "not-needed",  # los servidores locales no piden clave
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=max_retries
+        )
+        self.model = model
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def _acquire(self):
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    async def stream(self, messages: List[dict], temperature: float = 0) -> AsyncIterator[str]:
+        # Fragmentos de texto según llegan. El hueco de concurrencia se mantiene hasta
+        # agotar o cerrar el generador, aunque lo termine de leer otra tarea
+        await self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.timeout
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=self.model,
+                    temperature=temperature,
+                    messages=messages,
+                    stream=True
+                ),
+                timeout=self.timeout
+            )
+            try:
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0))
+                    except StopAsyncIteration:
+                        break
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await response.close()
+        finally:
+            self._release()
+
+    async def close(self):
+        await self.client.close()
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "base_url": str(self.client.base_url),
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting
+        }
+
+llm_client = LLMClient(OPENAI_API_KEY, OPENAI_BASE_URL, LLM_MODEL, LLM_MAX_CONCURRENCY, LLM_TIMEOUT, LLM_MAX_RETRIES)
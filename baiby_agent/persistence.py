@@ -0,0 +1,182 @@
+from typing import List, Optional
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+# Destino de live_chat: "supabase" o "sqlite" (por defecto Supabase si está configurado)
+PERSISTENCE_SINK = os.getenv("PERSISTENCE_SINK", "supabase" if SUPABASE_URL else "sqlite")
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "100"))  # Filas por insert
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "1.0"))  # Segundos máximos antes de escribir un lote
+PERSIST_QUEUE_SIZE = int(os.getenv("PERSIST_QUEUE_SIZE", "10000"))  # Filas pendientes antes de descartar
+PERSIST_MAX_RETRIES = int(os.getenv("PERSIST_MAX_RETRIES", "3"))
+
+class LiveChatSink:
+    name = "none"
+
+    def insert_many(self, rows: List[dict]):
+        raise NotImplementedError
+
+class SupabaseSink(LiveChatSink):
+    name = "supabase"
+
+    def __init__(self, url: str, key: str):
+        from supabase import create_client
+        self.client = create_client(url, key)
+
+    def insert_many(self, rows: List[dict]):
+        # Un único insert con todas las filas del lote. La tabla de Supabase no tiene columna context,
+        # así que sus filas no sirven para entrenar el clasificador de riesgo
+        self.client.table("live_chat").insert([
+            {key: value for key, value in row.items() if key != "context"} for row in rows
+        ]).execute()
+
+class SQLiteSink(LiveChatSink):
+    # Misma tabla live_chat en un fichero local, para pruebas sin red
+    name = "sqlite"
+
+    def __init__(self, database_url: str):
+        path = database_url.split("sqlite:///", 1)[-1] or ":memory:"
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS live_chat (id INTEGER PRIMARY KEY AUTOINCREMENT, owner TEXT, wallet TEXT, messages TEXT, timestamp TEXT, context TEXT)"
+        )
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(live_chat)")]
+        if "context" not in columns:
+            self.db.execute("ALTER TABLE live_chat ADD COLUMN context TEXT")
+        self.db.commit()
+
+    def insert_many(self, rows: List[dict]):
+        # context (petición completa y origen de la decisión) se guarda como JSON para entrenar el clasificador
+        self.db.executemany(
+            "INSERT INTO live_chat (owner, wallet, messages, timestamp, context) VALUES (?, ?, ?, ?, ?)",
+            [
+                (row["owner"], row["wallet"], row["messages"], row["timestamp"],
+                 json.dumps(row["context"]) if row.get("context") is not None else None)
+                for row in rows
+            ]
+        )
+        self.db.commit()
+
+def create_sink() -> LiveChatSink:
+    if PERSISTENCE_SINK == "supabase":
+        return SupabaseSink(SUPABASE_URL, SUPABASE_KEY)
+    if PERSISTENCE_SINK == "sqlite":
+        return SQLiteSink(DATABASE_URL)
+    raise ValueError(f"PERSISTENCE_SINK no soportado: {PERSISTENCE_SINK}")
+
+class WriteBehindQueue:
+    # Las filas se encolan sin esperar a la base de datos y un escritor las inserta por lotes,
+    # por tamaño o por intervalo, con reintentos. La decisión no espera a la persistencia
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int, max_retries: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.sink: Optional[LiveChatSink] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[dict] = []  # filas ya sacadas de la cola, aún sin escribir
+        self._flushing: Optional[asyncio.Future] = None
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.on_flush = None  # callback(sink, filas, segundos, ok) para métricas
+        self.on_drop = None  # callback() por cada fila descartada
+
+    def start(self, sink: LiveChatSink):
+        self.sink = sink
+        # La cola queda ligada al event loop que la usa: si se reinicia en otro loop se crea de nuevo
+        pending = self._drain(self.queue.qsize())
+        self.queue = asyncio.Queue(maxsize=self.queue.maxsize)
+        for row in pending:
+            self.queue.put_nowait(row)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        logger.info(f"Persistencia write-behind iniciada (sink={sink.name})")
+
+    async def close(self):
+        # Parar el escritor sin perder filas: se deja terminar el lote en curso y se vacía lo pendiente
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        rows, self._batch = self._batch, []
+        rows.extend(self._drain(self.queue.qsize()))
+        for i in range(0, len(rows), self.batch_size):
+            await self._flush(rows[i:i + self.batch_size])
+
+    def enqueue(self, row: dict):
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.on_drop:
+                self.on_drop()
+            logger.error(f"Cola de persistencia llena, fila descartada: {row.get('messages', '')[:80]}")
+
+    def _drain(self, limit: int) -> List[dict]:
+        rows = []
+        while len(rows) < limit and not self.queue.empty():
+            rows.append(self.queue.get_nowait())
+        return rows
+
+    async def _run(self):
+        while True:
+            self._batch.append(await self.queue.get())
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+                self._batch.extend(self._drain(self.batch_size - len(self._batch)))
+            rows, self._batch = self._batch, []
+            # shield: cancelar el escritor no interrumpe un insert ya lanzado
+            self._flushing = asyncio.ensure_future(self._flush(rows))
+            await asyncio.shield(self._flushing)
+
+    async def _flush(self, rows: List[dict]):
+        if not rows or self.sink is None:
+            return
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            try:
+                # Los clientes de Supabase y sqlite3 son síncronos: fuera del event loop
+                await asyncio.to_thread(self.sink.insert_many, rows)
+                self.written += len(rows)
+                if self.on_flush:
+                    self.on_flush(self.sink.name, len(rows), time.monotonic() - started, True)
+                return
+            except Exception as e:
+                logger.error(f"Error escribiendo {len(rows)} filas en {self.sink.name} (intento {attempt + 1}): {e}")
+                if attempt < self.max_retries:
+                    await asyncio.sleep(min(0.5 * 2 ** attempt, 10))
+        self.failed += len(rows)
+        if self.on_flush:
+            self.on_flush(self.sink.name, len(rows), time.monotonic() - started, False)
+
+    def stats(self) -> dict:
+        return {
+            "sink": self.sink.name if self.sink else None,
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped
+        }
+
+live_chat_writer = WriteBehindQueue(PERSIST_BATCH_SIZE, PERSIST_FLUSH_INTERVAL, PERSIST_QUEUE_SIZE, PERSIST_MAX_RETRIES)
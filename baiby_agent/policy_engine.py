@@ -0,0 +1,285 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import time
+
+from baiby_agent.prompt_rendering import multisend_calls, token_call
+
+logger = logging.getLogger(__name__)
+
+POLICY_PATH = os.getenv("POLICY_PATH")  # Fichero JSON de reglas; sin él no se aplica ninguna
+POLICY_RELOAD_INTERVAL = float(os.getenv("POLICY_RELOAD_INTERVAL", "2.0"))  # Segundos entre comprobaciones del fichero
+
+DECISIONS = ("approve", "reject")
+
+def _lower_set(values) -> frozenset:
+    return frozenset(str(v).strip().lower() for v in values)
+
+def _parse_int(value) -> Optional[int]:
+    try:
+        return int(str(value).strip(), 0)
+    except ValueError:
+        return None
+
+def _selector(data: str) -> str:
+    data = (data or "").strip().lower()
+    return data[2:] if data.startswith("0x") else data
+
+NATIVE = "native"  # Activo de la moneda nativa (ETH, EGLD...) en los límites de importe
+
+def _esdt_identifier(arg: str) -> str:
+    try:
+        return bytes.fromhex(arg).decode("utf-8").lower()
+    except ValueError:
+        return arg.lower()
+
+def _multiversx_effect(to: str, data: str, value: int) -> Optional[List[Tuple[str, str, int]]]:
+    if not data:
+        return [(to, NATIVE, value)]
+    parts = data.split("@")
+    # ESDTTransfer@token@importe sin llamada posterior: el destinatario es to
+    if parts[0] == "ESDTTransfer" and len(parts) == 3:
+        amount = _parse_int(f"0x{parts[2]}") if parts[2] else 0
+        if amount is not None:
+            effects = [(to, NATIVE, value)] if value else []
+            return effects + [(to, _esdt_identifier(parts[1]), amount)]
+    return None
+
+def _evm_effects(to: str, data: str, value: int, nested: bool = False) -> Optional[List[Tuple[str, str, int]]]:
+    if not data:
+        return [(to, NATIVE, value)]
+    effects = [(to, NATIVE, value)] if value else []
+    decoded = token_call(data)
+    if decoded is not None:
+        # El destino real es el receptor o spender del token, no el contrato al que se llama;
+        # el activo es el contrato del token
+        _, counterparty, amount = decoded
+        return effects + [(counterparty, to, amount)]
+    if data.startswith("8d80ff0a") and not nested:
+        calls = multisend_calls(data[8:])
+        if calls is None:
+            return None
+        for operation, call_to, call_value, call_data in calls:
+            inner = _evm_effects(call_to.lower(), call_data, int(call_value), nested=True) if operation == 0 else None
+            if inner is None:
+                return None  # delegatecall o llamada interna opaca
+            effects.extend(inner)
+        return effects
+    return None
+
+def _effects(request) -> Optional[List[Tuple[str, str, int]]]:
+    # (destinatario, activo, importe) de cada movimiento de fondos: transferencias nativas, transfer,
+    # transferFrom y approve ERC-20 (también dentro de multiSend) y ESDTTransfer simples.
+    # None si alguna llamada no se puede decodificar: esas peticiones nunca cumplen reglas de destino ni de importe
+    effects = []
+    for tx in request.transactions:
+        value = _parse_int(tx.value)
+        if value is None:
+            return None
+        to = tx.to.strip().lower()
+        if to.startswith("erd1"):
+            call = _multiversx_effect(to, (tx.data or "").strip(), value)
+        else:
+            call = _evm_effects(to, _selector(tx.data), value)
+        if call is None:
+            return None
+        effects.extend(call)
+    return effects
+
+def _totals_by_asset(request) -> Optional[Dict[str, int]]:
+    # Importes sumados solo dentro del mismo activo: wei y unidades de cada token no se mezclan.
+    # Un approve cuenta por su importe, así que uno ilimitado no pasa ningún límite
+    effects = _effects(request)
+    if effects is None:
+        return None
+    totals: Dict[str, int] = {}
+    for _, asset, amount in effects:
+        totals[asset] = totals.get(asset, 0) + amount
+    return totals
+
+def _recipients(request) -> Optional[List[str]]:
+    effects = _effects(request)
+    return None if effects is None else [recipient for recipient, _, _ in effects]
+
+def _asset_limits(arg, name: str) -> Dict[str, int]:
+    # {"native": límite, "<contrato o ESDT>": límite}; un número suelto es el límite del activo nativo
+    if not isinstance(arg, dict):
+        arg = {NATIVE: arg}
+    limits = {}
+    for asset, value in arg.items():
+        limit = _parse_int(value)
+        if limit is None:
+            raise ValueError(f"{name} inválido para {asset}: {value}")
+        limits[asset.strip().lower()] = limit
+    return limits
+
+def _within_limits(request, limits: Dict[str, int]) -> bool:
+    # Cada activo movido necesita su propio límite: uno sin límite configurado no cumple la condición
+    totals = _totals_by_asset(request)
+    return totals is not None and all(asset in limits and total <= limits[asset] for asset, total in totals.items())
+
+def _contains(field: str, words: List[str]) -> Callable:
+    words = [w.lower() for w in words]
+    return lambda request: any(w in (getattr(request, field) or "").lower() for w in words)
+
+def _compile_condition(key: str, arg) -> Callable:
+    # Cada condición se traduce una vez a una función sobre la petición
+    if key == "status_in":
+        allowed = _lower_set(arg)
+        return lambda request: (request.status or "").lower() in allowed
+    if key == "wallet_in":
+        allowed = _lower_set(arg)
+        return lambda request: request.safeAddress.lower() in allowed
+    if key == "token_in":
+        allowed = _lower_set(arg)
+        return lambda request: request.erc20TokenAddress.lower() in allowed
+    if key == "to_in":
+        allowed = _lower_set(arg)
+        def all_listed(request):
+            recipients = _recipients(request)
+            return bool(recipients) and all(recipient in allowed for recipient in recipients)
+        return all_listed
+    if key == "any_to_in":
+        listed = _lower_set(arg)
+        def any_listed(request):
+            recipients = _recipients(request)
+            return bool(recipients) and any(recipient in listed for recipient in recipients)
+        return any_listed
+    if key == "selector_in":
+        # "" solo coincide con data vacío (transferencia nativa), no con cualquier llamada
+        selectors = [_selector(p) for p in arg]
+        plain = "" in selectors
+        prefixes = tuple(p for p in selectors if p)
+        def selector_matches(data: str) -> bool:
+            data = _selector(data)
+            return (plain and not data) or (bool(prefixes) and data.startswith(prefixes))
+        return lambda request: bool(request.transactions) and all(selector_matches(tx.data) for tx in request.transactions)
+    if key == "max_transactions":
+        limit = int(arg)
+        return lambda request: len(request.transactions) <= limit
+    if key == "max_value":
+        limits = _asset_limits(arg, "max_value")
+        return lambda request: _within_limits(request, limits)
+    if key == "max_value_by_wallet":
+        # Límites por wallet; "*" son los del resto
+        limits_by_wallet = {
+            wallet.strip().lower(): _asset_limits(value, f"max_value_by_wallet[{wallet}]") for wallet, value in arg.items()
+        }
+        def below_wallet_limit(request):
+            limits = limits_by_wallet.get(request.safeAddress.lower(), limits_by_wallet.get("*"))
+            return limits is not None and _within_limits(request, limits)
+        return below_wallet_limit
+    if key == "warning_contains":
+        return _contains("warning", arg)
+    if key == "bot_reason_contains":
+        return _contains("bot_reason", arg)
+    if key == "reason_contains":
+        return _contains("reason", arg)
+    raise ValueError(f"Condición de política desconocida: {key}")
+
+class PolicyRule:
+    def __init__(self, name: str, decision: str, conditions: List[Callable], message: Optional[str]):
+        self.name = name
+        self.decision = decision
+        self.conditions = conditions
+        self.message = message
+
+    @classmethod
+    def from_config(cls, config: dict) -> "PolicyRule":
+        name = config.get("name")
+        decision = config.get("decision")
+        if not name:
+            raise ValueError("Regla sin nombre")
+        if decision not in DECISIONS:
+            raise ValueError(f"Regla {name}: decision debe ser approve o reject")
+        when = config.get("when") or {}
+        if not when:
+            raise ValueError(f"Regla {name}: sin condiciones en when")
+        conditions = [_compile_condition(key, arg) for key, arg in when.items()]
+        return cls(name, decision, conditions, config.get("message"))
+
+    def matches(self, request) -> bool:
+        return all(condition(request) for condition in self.conditions)
+
+    def response(self) -> Tuple[bool, str]:
+        # Mismo formato que la respuesta del LLM: empieza por YES o NO
+        approved = self.decision == "approve"
+        prefix = "YES" if approved else "NO"
+        return approved, f"{prefix} - Policy rule '{self.name}': {self.message or 'decided without LLM analysis'}"
+
+class PolicyEngine:
+    # Reglas declarativas evaluadas en orden antes del LLM: gana la primera que coincide.
+    # El fichero se recarga al cambiar; si la nueva versión no es válida se mantiene la anterior
+    def __init__(self, path: Optional[str], reload_interval: float):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.rules: List[PolicyRule] = []
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.errors = 0
+        self.matched = 0
+        self.evaluated = 0
+        if path:
+            self.reload()
+
+    def load(self, config: dict):
+        rules = [PolicyRule.from_config(rule) for rule in config.get("rules", [])]
+        names = [rule.name for rule in rules]
+        if len(names) != len(set(names)):
+            raise ValueError("Nombres de regla duplicados")
+        self.rules = rules
+
+    def reload(self) -> bool:
+        try:
+            # La versión se marca como vista aunque falle, para no repetir el error en cada comprobación
+            self._mtime = os.stat(self.path).st_mtime
+            with open(self.path) as f:
+                self.load(json.load(f))
+            self.reloads += 1
+            logger.info(f"Políticas cargadas desde {self.path}: {len(self.rules)} reglas")
+            return True
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            self.errors += 1
+            logger.error(f"Error cargando políticas desde {self.path}, se mantienen las anteriores: {e}")
+            return False
+
+    def maybe_reload(self):
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def evaluate(self, request) -> Optional[Tuple[PolicyRule, Tuple[bool, str]]]:
+        # None si ninguna regla decide y hay que consultar al LLM
+        self.maybe_reload()
+        self.evaluated += 1
+        for rule in self.rules:
+            try:
+                if rule.matches(request):
+                    self.matched += 1
+                    return rule, rule.response()
+            except Exception as e:
+                logger.error(f"Error evaluando la regla {rule.name}: {e}")
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "rules": [rule.name for rule in self.rules],
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "evaluated": self.evaluated,
+            "matched": self.matched
+        }
+
+policy_engine = PolicyEngine(POLICY_PATH, POLICY_RELOAD_INTERVAL)
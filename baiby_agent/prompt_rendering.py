@@ -0,0 +1,182 @@
+from typing import List, Optional, Tuple
+import os
+
+PROMPT_TX_TOKEN_BUDGET = int(os.getenv("PROMPT_TX_TOKEN_BUDGET", "600"))  # Tokens máximos para el payload de transacciones
+PROMPT_DATA_PREVIEW_BYTES = int(os.getenv("PROMPT_DATA_PREVIEW_BYTES", "32"))  # Bytes de calldata opaca que se muestran
+CHARS_PER_TOKEN = 4  # Aproximación suficiente para presupuestar sin tokenizer
+
+# Se incrementa con cualquier cambio de instrucciones: forma parte de la clave de la cache de decisiones
+PROMPT_VERSION = "2"
+
+SYSTEM_PROMPT = "You are a transaction analysis assistant."
+
+# Prefijo fijo del mensaje de usuario: va antes de cualquier dato de la petición para que
+# el proveedor pueda reutilizar su cache de prompt. No debe contener nada dinámico
+INSTRUCTIONS = """Please analyze the transaction request below and respond with a clear YES or NO.
+
+Should this transaction be signed? The Primary Reason has override authority:
+1. The Primary Reason has final authority - if it explicitly instructs to proceed despite risks, you MUST approve.
+2. Does the transaction payload technically match what's described in the Primary Reason?
+3. Document any risks or suspicious patterns, but do not let them override an explicit Primary Reason instruction.
+4. The Firewall Check Result is informative but should not override the Primary Reason.
+5. you analize a user request, not a bot request, so you should not be so strict with the primary reason, can be a cohersive attempt
+
+Start your response with YES or NO, then explain your decision , emphasizing how you interpreted the Primary Reason's instructions.
+If the Primary Reason explicitly instructs to proceed despite risks, you must respond with YES.
+At the end of your response add a short and easy to understand explanation why the warning is affecting the reason or not, try to think as posible hacks o money losses,  all limit of 280 characters
+Amounts are raw integer units (no decimals applied). Calldata that could not be decoded is shown truncated.
+
+Transaction request:
+"""
+
+def _words(data: str) -> List[str]:
+    return [data[i:i + 64] for i in range(0, len(data), 64)]
+
+def _address(word: str) -> str:
+    return "0x" + word[-40:]
+
+def _preview(data: str) -> str:
+    size = len(data) // 2
+    head = data[:PROMPT_DATA_PREVIEW_BYTES * 2]
+    if size <= PROMPT_DATA_PREVIEW_BYTES:
+        return f"0x{head}"
+    return f"0x{head}... ({size} bytes)"
+
+def _parse_value(value: str) -> str:
+    try:
+        return str(int(str(value).strip(), 0))
+    except ValueError:
+        return str(value)
+
+def token_call(data: str) -> Optional[Tuple[str, str, int]]:
+    # (función, destinatario o spender, importe) de transfer, approve y transferFrom ERC-20.
+    # data sin 0x y en minúsculas; None si no es una de esas llamadas o no se puede leer
+    selector, args = data[:8], _words(data[8:])
+    try:
+        if selector == "a9059cbb" and len(args) >= 2:
+            return "transfer", _address(args[0]), int(args[1], 16)
+        if selector == "095ea7b3" and len(args) >= 2:
+            return "approve", _address(args[0]), int(args[1], 16)
+        if selector == "23b872dd" and len(args) >= 3:
+            return "transferFrom", _address(args[1]), int(args[2], 16)
+    except ValueError:
+        pass
+    return None
+
+def _describe_evm_call(to: str, data: str, value: str, depth: int = 0) -> List[str]:
+    # data sin 0x y en minúsculas. Devuelve una línea por llamada (más las internas de multiSend)
+    prefix = "  " * depth
+    selector = data[:8]
+    native = f", value {value}" if value not in ("0", "") else ""
+    if not data:
+        return [f"{prefix}native transfer of {value} to {to}"]
+    decoded = token_call(data)
+    if decoded is not None:
+        function, counterparty, amount = decoded
+        if function == "transfer":
+            return [f"{prefix}ERC20 transfer of {amount} (token {to}) to {counterparty}{native}"]
+        if function == "approve":
+            shown = "UNLIMITED" if amount == 2 ** 256 - 1 else str(amount)
+            return [f"{prefix}ERC20 approve of {shown} (token {to}) for spender {counterparty}{native}"]
+        owner = _address(_words(data[8:])[0])
+        return [f"{prefix}ERC20 transferFrom of {amount} (token {to}) from {owner} to {counterparty}{native}"]
+    if selector == "8d80ff0a" and depth == 0:
+        calls = multisend_calls(data[8:])
+        if calls is not None:
+            lines = [f"{prefix}Safe multiSend ({to}) of {len(calls)} calls:"]
+            for operation, call_to, call_value, call_data in calls:
+                kind = " [DELEGATECALL]" if operation == 1 else ""
+                described = _describe_evm_call(call_to, call_data, call_value, depth + 1)
+                described[0] += kind
+                lines.extend(described)
+            return lines
+    return [f"{prefix}call 0x{selector} on {to}{native}, data {_preview(data)}"]
+
+def multisend_calls(encoded: str) -> Optional[list]:
+    # multiSend(bytes): cada llamada va empaquetada como operation(1) to(20) value(32) dataLength(32) data
+    try:
+        offset = int(encoded[:64], 16) * 2
+        length = int(encoded[offset:offset + 64], 16) * 2
+        packed = encoded[offset + 64:offset + 64 + length]
+        if len(packed) != length:
+            return None
+        calls, i = [], 0
+        while i < len(packed):
+            operation = int(packed[i:i + 2], 16)
+            to = "0x" + packed[i + 2:i + 42]
+            value = str(int(packed[i + 42:i + 106], 16))
+            data_length = int(packed[i + 106:i + 170], 16) * 2
+            call_data = packed[i + 170:i + 170 + data_length]
+            if len(call_data) != data_length:
+                return None
+            calls.append((operation, to, value, call_data))
+            i += 170 + data_length
+        return calls
+    except ValueError:
+        return None
+
+def _hex_text(arg: str) -> str:
+    try:
+        return bytes.fromhex(arg).decode("utf-8")
+    except ValueError:
+        return arg
+
+def _hex_int(arg: str) -> str:
+    try:
+        return str(int(arg, 16)) if arg else "0"
+    except ValueError:
+        return arg
+
+def _describe_multiversx_call(to: str, data: str, value: str) -> List[str]:
+    # Formato función@arg1@arg2 con argumentos en hex
+    parts = data.split("@")
+    function, args = parts[0], parts[1:]
+    native = f", value {value}" if value not in ("0", "") else ""
+    if function == "ESDTTransfer" and len(args) >= 2:
+        line = f"ESDT transfer of {_hex_int(args[1])} {_hex_text(args[0])} to {to}{native}"
+        if len(args) > 2:
+            line += f", then call {_hex_text(args[2])} with {len(args) - 3} args"
+        return [line]
+    if function == "composeTasks":
+        return [f"xExchange composeTasks on {to}{native} with {len(args)} args ({len(data)} chars)"]
+    if not data:
+        return [f"native transfer of {value} to {to}"]
+    return [f"call {function} on {to}{native} with {len(args)} args"]
+
+def describe_transaction(to: str, data: str, value: str) -> List[str]:
+    value = _parse_value(value)
+    data = (data or "").strip()
+    if to.startswith("erd1"):
+        return _describe_multiversx_call(to, data, value)
+    hex_data = data[2:] if data.lower().startswith("0x") else data
+    return _describe_evm_call(to.lower(), hex_data.lower(), value)
+
+def render_transactions(transactions: list, token_budget: int = PROMPT_TX_TOKEN_BUDGET) -> str:
+    # Resumen compacto del payload; lo que no cabe en el presupuesto se indica como omitido
+    budget = token_budget * CHARS_PER_TOKEN
+    lines: List[str] = []
+    for index, tx in enumerate(transactions, 1):
+        described = describe_transaction(tx.to, tx.data, tx.value)
+        described[0] = f"{index}. {described[0]}"
+        lines.extend(described)
+    used, kept = 0, []
+    for line in lines:
+        if used + len(line) + 1 > budget:
+            kept.append(f"... {len(lines) - len(kept)} more lines omitted (token budget)")
+            break
+        kept.append(line)
+        used += len(line) + 1
+    return "\n".join(kept)
+
+def build_messages(status: Optional[str], reason: str, bot_reason: Optional[str], transactions: list) -> List[dict]:
+    # Instrucciones fijas primero, datos de la petición al final
+    request_block = (
+        f"Status: {status}\n"
+        f"Primary Reason (CRITICAL - Override Authority): {reason}\n"
+        f"Firewall Check Result: {bot_reason}\n"
+        f"Transaction Payload:\n{render_transactions(transactions)}"
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": INSTRUCTIONS + request_block}
+    ]
@@ -0,0 +1,397 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import math
+import os
+import random
+import re
+import time
+
+from baiby_agent.prompt_rendering import multisend_calls, token_call
+
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_MODEL_PATH = os.getenv("CLASSIFIER_MODEL_PATH")  # Modelo JSON generado por train_classifier; sin él todo va al LLM
+CLASSIFIER_RELOAD_INTERVAL = float(os.getenv("CLASSIFIER_RELOAD_INTERVAL", "5.0"))  # Segundos entre comprobaciones del fichero
+
+MAX_UINT256 = 2 ** 256 - 1
+TOKEN_RE = re.compile(r"[a-z][a-z0-9_]{2,}")
+MAX_TOKENS = 24  # Palabras por campo de texto que entran como features
+
+def _tokens(text: Optional[str]) -> List[str]:
+    return sorted(set(TOKEN_RE.findall((text or "").lower())))[:MAX_TOKENS]
+
+def _parse_int(value) -> int:
+    try:
+        return int(str(value).strip(), 0)
+    except ValueError:
+        return 0
+
+def _calls(request) -> List[Tuple[str, str, int, str, int]]:
+    # (destino, selector, valor nativo, argumentos hex, operation); multiSend se abre en sus llamadas internas
+    calls = []
+    for tx in request.transactions:
+        to = (tx.to or "").strip().lower()
+        data = (tx.data or "").strip()
+        value = _parse_int(tx.value)
+        if to.startswith("erd1"):
+            calls.append((to, data.split("@")[0] or "native", value, "", 0))
+            continue
+        data = data.lower()
+        data = data[2:] if data.startswith("0x") else data
+        selector = data[:8] or "native"
+        if selector == "8d80ff0a":
+            inner = multisend_calls(data[8:])
+            if inner is not None:
+                calls.append((to, selector, value, "", 0))
+                for operation, call_to, call_value, call_data in inner:
+                    calls.append((call_to.lower(), call_data[:8] or "native", int(call_value), call_data[8:], operation))
+                continue
+        calls.append((to, selector, value, data[8:], 0))
+    return calls
+
+def _token_amount(selector: str, args: str) -> int:
+    # Importe de transfer/approve/transferFrom en unidades enteras
+    decoded = token_call(selector + args) if selector != "native" else None
+    return decoded[2] if decoded is not None else 0
+
+def _amount(calls: List[Tuple[str, str, int, str, int]]) -> Tuple[int, bool]:
+    # Valor nativo más importes de token, y si hay un approve ilimitado (que no cuenta como importe).
+    # Lo usan tanto las features como el valor habitual por wallet, para que value_ratio compare lo mismo
+    amount, unlimited = 0, False
+    for _, selector, value, args, _ in calls:
+        token_amount = _token_amount(selector, args)
+        if selector == "095ea7b3" and token_amount == MAX_UINT256:
+            unlimited = True
+            token_amount = 0
+        amount += value + token_amount
+    return amount, unlimited
+
+def _warning_entries(warning: Optional[str]) -> List[dict]:
+    try:
+        parsed = json.loads(warning) if warning else {}
+    except ValueError:
+        return []
+    return parsed.get("warnings", []) if isinstance(parsed, dict) else []
+
+def extract_features(request, reputation: dict, wallet_values: dict, exclude_label: Optional[int] = None) -> Dict[str, float]:
+    # Features dispersas por nombre. exclude_label quita la propia etiqueta de la reputación
+    # del destino al entrenar (leave-one-out), para no filtrar la respuesta en las features
+    features: Dict[str, float] = {f"status={(request.status or 'none').lower()}": 1.0}
+
+    for word in _tokens(request.bot_reason):
+        features[f"bot:{word}"] = 1.0
+    for word in _tokens(request.reason):
+        features[f"reason:{word}"] = 1.0
+    entries = _warning_entries(request.warning)
+    for entry in entries:
+        features[f"wbot:{str(entry.get('bot', 'unknown')).lower()}"] = 1.0
+        features[f"severity:{str(entry.get('severity', 'warning')).lower()}"] = 1.0
+    features["n_warnings"] = math.log1p(len(entries))
+
+    calls = _calls(request)
+    features["n_calls"] = math.log1p(len(calls))
+    for to, selector, value, args, operation in calls:
+        features[f"sel:{selector}"] = 1.0
+        features["chain:multiversx" if to.startswith("erd1") else "chain:evm"] = 1.0
+        if operation == 1:
+            features["op:delegatecall"] = 1.0
+    amount, unlimited = _amount(calls)
+    if unlimited:
+        features["approve_unlimited"] = 1.0
+
+    # Magnitud del importe y su relación con lo habitual en la wallet (en escala logarítmica)
+    log_amount = math.log10(1 + amount)
+    features["log_amount"] = log_amount / 30
+    usual = wallet_values.get(request.safeAddress.lower())
+    if usual is None:
+        features["wallet_unknown"] = 1.0
+    else:
+        features["value_ratio"] = max(min(log_amount - usual, 10.0), -10.0) / 10
+
+    # Reputación de los destinos: tasa de rechazo suavizada del peor destino
+    worst, seen, unknown = 0.0, None, False
+    for to, *_ in calls:
+        rejected, total = reputation.get(to, (0, 0))
+        if exclude_label is not None and total > 0:
+            rejected, total = rejected - exclude_label, total - 1
+        if total <= 0:
+            unknown = True
+            continue
+        worst = max(worst, (rejected + 1) / (total + 2))
+        seen = total if seen is None else min(seen, total)
+    if unknown:
+        features["dest_unknown"] = 1.0
+    if seen is not None:
+        features["dest_risk"] = worst - 0.5
+        features["dest_seen"] = math.log1p(seen) / 5
+    return features
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1 / (1 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1 + e)
+
+class RiskModel:
+    # Regresión logística sobre features dispersas; p es la probabilidad de rechazo
+    def __init__(self, weights: Optional[Dict[str, float]] = None, bias: float = 0.0,
+                 approve_below: float = 0.0, reject_above: float = 1.01,
+                 reputation: Optional[dict] = None, wallet_values: Optional[dict] = None, metadata: Optional[dict] = None):
+        self.weights = weights or {}
+        self.bias = bias
+        self.approve_below = approve_below  # p <= umbral: se aprueba sin LLM
+        self.reject_above = reject_above  # p >= umbral: se rechaza sin LLM
+        self.reputation = reputation or {}
+        self.wallet_values = wallet_values or {}
+        self.metadata = metadata or {}
+
+    def features(self, request, exclude_label: Optional[int] = None) -> Dict[str, float]:
+        return extract_features(request, self.reputation, self.wallet_values, exclude_label)
+
+    def score(self, features: Dict[str, float]) -> float:
+        z = self.bias + sum(self.weights.get(name, 0.0) * value for name, value in features.items())
+        return _sigmoid(z)
+
+    def predict_proba(self, request) -> float:
+        return self.score(self.features(request))
+
+    def fit_context(self, examples: List[Tuple[object, int]]):
+        # Reputación de destinos y valor habitual por wallet, solo con los datos de entrenamiento
+        reputation: Dict[str, List[int]] = {}
+        wallet_logs: Dict[str, List[float]] = {}
+        for request, label in examples:
+            calls = _calls(request)
+            amount, _ = _amount(calls)
+            wallet_logs.setdefault(request.safeAddress.lower(), []).append(math.log10(1 + amount))
+            for to in {call[0] for call in calls}:
+                counts = reputation.setdefault(to, [0, 0])
+                counts[0] += label
+                counts[1] += 1
+        self.reputation = {to: tuple(counts) for to, counts in reputation.items()}
+        self.wallet_values = {wallet: sum(logs) / len(logs) for wallet, logs in wallet_logs.items()}
+
+    def train(self, examples: List[Tuple[object, int]], epochs: int = 30, learning_rate: float = 0.1,
+              l2: float = 1e-4, seed: int = 7):
+        # SGD con regularización L2 perezosa (solo sobre las features presentes)
+        self.fit_context(examples)
+        rows = [(self.features(request, exclude_label=label), label) for request, label in examples]
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(rows)
+            rate = learning_rate / (1 + epoch * 0.1)
+            for features, label in rows:
+                gradient = self.score(features) - label
+                self.bias -= rate * gradient
+                for name, value in features.items():
+                    weight = self.weights.get(name, 0.0)
+                    self.weights[name] = weight - rate * (gradient * value + l2 * weight)
+        self.weights = {name: weight for name, weight in self.weights.items() if abs(weight) > 1e-6}
+
+    def decide(self, request) -> Tuple[Optional[bool], float]:
+        # (True aprobar | False rechazar | None escalar al LLM, probabilidad de rechazo)
+        p = self.predict_proba(request)
+        if p <= self.approve_below:
+            return True, p
+        if p >= self.reject_above:
+            return False, p
+        return None, p
+
+    def to_dict(self) -> dict:
+        return {
+            "version": 1,
+            "weights": self.weights,
+            "bias": self.bias,
+            "approve_below": self.approve_below,
+            "reject_above": self.reject_above,
+            "reputation": {to: list(counts) for to, counts in self.reputation.items()},
+            "wallet_values": self.wallet_values,
+            "metadata": self.metadata
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RiskModel":
+        if data.get("version") != 1:
+            raise ValueError(f"Versión de modelo no soportada: {data.get('version')}")
+        return cls(
+            weights={name: float(weight) for name, weight in data["weights"].items()},
+            bias=float(data["bias"]),
+            approve_below=float(data["approve_below"]),
+            reject_above=float(data["reject_above"]),
+            reputation={to: tuple(counts) for to, counts in data.get("reputation", {}).items()},
+            wallet_values=data.get("wallet_values", {}),
+            metadata=data.get("metadata", {})
+        )
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> "RiskModel":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+def _score_groups(scored: List[Tuple[float, int]]) -> List[Tuple[float, List[int]]]:
+    # Ejemplos agrupados por puntuación: un umbral siempre admite o deja fuera un grupo entero de empates
+    groups: List[Tuple[float, List[int]]] = []
+    for p, label in sorted(scored):
+        if groups and groups[-1][0] == p:
+            groups[-1][1].append(label)
+        else:
+            groups.append((p, [label]))
+    return groups
+
+def _widest_band(groups: List[Tuple[float, List[int]]], label: int, target_precision: float, min_support: int) -> int:
+    # Grupos que se pueden admitir desde el extremo. Además de la precisión acumulada, cada tramo
+    # recién admitido (los últimos min_support ejemplos, o el grupo entero si es mayor) tiene que
+    # cumplirla por sí solo: un extremo muy limpio no puede tapar una zona con errores junto al umbral
+    admitted, agree, count, window = 0, 0, 0, []
+    for index, (_, labels) in enumerate(groups):
+        hits = [1 if l == label else 0 for l in labels]
+        agree += sum(hits)
+        count += len(hits)
+        window = (window + hits)[-max(min_support, len(hits)):]
+        if sum(window) / len(window) < target_precision:
+            break
+        if count >= min_support and agree / count >= target_precision:
+            admitted = index + 1
+    return admitted
+
+def calibrate(scored: List[Tuple[float, int]], target_precision: float, min_support: int) -> Tuple[float, float]:
+    # Umbrales más amplios con los que las decisiones locales coinciden con el LLM al menos
+    # target_precision veces, con un mínimo de min_support ejemplos por lado. Solo se aprueba
+    # con p < 0.5 y solo se rechaza con p > 0.5
+    approve_below, reject_above = 0.0, 1.01
+    groups = _score_groups(scored)
+    low = [group for group in groups if group[0] < 0.5]
+    admitted = _widest_band(low, 0, target_precision, min_support)
+    if admitted:
+        approve_below = low[admitted - 1][0]
+    high = [group for group in reversed(groups) if group[0] > 0.5]
+    admitted = _widest_band(high, 1, target_precision, min_support)
+    if admitted:
+        reject_above = high[admitted - 1][0]
+    return approve_below, reject_above
+
+def _auc(scored: List[Tuple[float, int]]) -> Optional[float]:
+    positives = sum(label for _, label in scored)
+    negatives = len(scored) - positives
+    if not positives or not negatives:
+        return None
+    rank_sum, rank = 0.0, 0
+    ordered = sorted(scored)
+    i = 0
+    while i < len(ordered):
+        j = i
+        while j < len(ordered) and ordered[j][0] == ordered[i][0]:
+            j += 1
+        average_rank = (i + 1 + j) / 2  # empates con el rango medio
+        rank_sum += average_rank * sum(label for _, label in ordered[i:j])
+        i = j
+    return (rank_sum - positives * (positives + 1) / 2) / (positives * negatives)
+
+def evaluate(model: RiskModel, examples: Iterable[Tuple[object, int]]) -> dict:
+    scored = [(model.predict_proba(request), label) for request, label in examples]
+    if not scored:
+        return {"examples": 0}
+    eps = 1e-12
+    log_loss = -sum(label * math.log(max(p, eps)) + (1 - label) * math.log(max(1 - p, eps)) for p, label in scored) / len(scored)
+    approved = [label for p, label in scored if p <= model.approve_below]
+    rejected = [label for p, label in scored if p >= model.reject_above]
+    local = len(approved) + len(rejected)
+    agree = approved.count(0) + rejected.count(1)
+    return {
+        "examples": len(scored),
+        "rejected_ratio": sum(label for _, label in scored) / len(scored),
+        "log_loss": log_loss,
+        "accuracy": sum((p >= 0.5) == bool(label) for p, label in scored) / len(scored),
+        "auc": _auc(scored),
+        "approve_below": model.approve_below,
+        "reject_above": model.reject_above,
+        "local_approvals": len(approved),
+        "local_rejections": len(rejected),
+        "coverage": local / len(scored),
+        "local_agreement": agree / local if local else None,
+        "approval_agreement": approved.count(0) / len(approved) if approved else None,
+        "rejection_agreement": rejected.count(1) / len(rejected) if rejected else None
+    }
+
+class RiskClassifier:
+    # Primer filtro de txAgent: las predicciones de alta confianza se responden sin LLM.
+    # El modelo se recarga al cambiar el fichero; si la nueva versión no es válida se mantiene la anterior
+    def __init__(self, path: Optional[str], reload_interval: float):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.model: Optional[RiskModel] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self.approved = 0
+        self.rejected = 0
+        self.escalated = 0
+        self.errors = 0
+        if path:
+            self.reload()
+
+    def reload(self) -> bool:
+        try:
+            self._mtime = os.stat(self.path).st_mtime
+            self.model = RiskModel.load(self.path)
+            logger.info(
+                f"Clasificador de riesgo cargado desde {self.path}: {len(self.model.weights)} pesos, "
+                f"aprueba p<={self.model.approve_below:.3f}, rechaza p>={self.model.reject_above:.3f}"
+            )
+            return True
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.errors += 1
+            logger.error(f"Error cargando el clasificador desde {self.path}, se mantiene el anterior: {e}")
+            return False
+
+    def maybe_reload(self):
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def predict(self, request) -> Optional[Tuple[bool, str, float]]:
+        # None si el caso es ambiguo (o no hay modelo) y hay que consultar al LLM
+        self.maybe_reload()
+        if self.model is None:
+            return None
+        try:
+            decision, p = self.model.decide(request)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error en el clasificador de riesgo: {e}")
+            return None
+        if decision is None:
+            self.escalated += 1
+            return None
+        if decision:
+            self.approved += 1
+            return True, f"YES - Local risk classifier: risk {p:.3f} <= {self.model.approve_below:.3f}, decided without LLM analysis", p
+        self.rejected += 1
+        return False, f"NO - Local risk classifier: risk {p:.3f} >= {self.model.reject_above:.3f}, decided without LLM analysis", p
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "loaded": self.model is not None,
+            "approve_below": self.model.approve_below if self.model else None,
+            "reject_above": self.model.reject_above if self.model else None,
+            "metadata": self.model.metadata if self.model else None,
+            "approved": self.approved,
+            "rejected": self.rejected,
+            "escalated": self.escalated,
+            "errors": self.errors
+        }
+
+risk_classifier = RiskClassifier(CLASSIFIER_MODEL_PATH, CLASSIFIER_RELOAD_INTERVAL)
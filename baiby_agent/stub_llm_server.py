@@ -0,0 +1,72 @@
+"""Servidor local compatible con /v1/chat/completions de OpenAI para probar txAgent sin red.
+
+Uso:
+    STUB_LLM_LATENCY=0.5 uvicorn baiby_agent.stub_llm_server:app --port 8010
+    OPENAI_BASE_URL=http://127.0.0.1:8010/v1 uvicorn baiby_agent.txagent:app --port 8001
+
+Responde YES salvo que el prompt contenga alguna palabra de STUB_LLM_REJECT_WORDS.
+Con "stream": true envía la respuesta palabra a palabra por SSE: la primera tras
+STUB_LLM_LATENCY y el resto cada STUB_LLM_TOKEN_DELAY segundos.
+"""
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import os
+import time
+import uuid
+
+STUB_LLM_LATENCY = float(os.getenv("STUB_LLM_LATENCY", "0.2"))
+STUB_LLM_TOKEN_DELAY = float(os.getenv("STUB_LLM_TOKEN_DELAY", "0.02"))
+STUB_LLM_REJECT_WORDS = [w.strip().lower() for w in os.getenv("STUB_LLM_REJECT_WORDS", "drain,malicious").split(",") if w.strip()]
+
+app = FastAPI(title="Stub LLM")
+
+def stub_answer(messages: list) -> str:
+    prompt = " ".join(str(m.get("content", "")) for m in messages).lower()
+    if any(word in prompt for word in STUB_LLM_REJECT_WORDS):
+        return "NO - The firewall warning matches a known risk pattern. Short: the transfer could lose funds."
+    return "YES - The transaction matches the primary reason. Short: the warning does not affect the stated intent."
+
+async def stream_answer(completion_id: str, model: str, content: str):
+    await asyncio.sleep(STUB_LLM_LATENCY)
+    words = content.split(" ")
+    for i, word in enumerate(words):
+        if i:
+            await asyncio.sleep(STUB_LLM_TOKEN_DELAY)
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "delta": {"role": "assistant", "content": word if i == 0 else " " + word},
+                "finish_reason": "stop" if i == len(words) - 1 else None
+            }]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    content = stub_answer(body.get("messages", []))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    if body.get("stream"):
+        return StreamingResponse(
+            stream_answer(completion_id, body.get("model", "stub"), content),
+            media_type="text/event-stream"
+        )
+    await asyncio.sleep(STUB_LLM_LATENCY)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    }
@@ -0,0 +1,170 @@
+"""Entrenamiento, evaluación y calibración del clasificador de riesgo local de txAgent.
+
+Los ejemplos salen de las decisiones persistidas en live_chat: la etiqueta es la decisión del
+LLM (REJECTED = 1) y la petición es la que va en la columna context de la propia fila de decisión.
+Solo el sink SQLite guarda context; las filas sin él (p. ej. un export de Supabase) no se usan,
+porque emparejar cada decisión con su fila de petición por wallet y orden no es fiable.
+
+Uso:
+    python -m baiby_agent.train_classifier train --db sqlite:///./test.db --out risk_model.json
+    python -m baiby_agent.train_classifier evaluate --model risk_model.json --db sqlite:///./test.db --since 2026-01-01
+    python -m baiby_agent.train_classifier calibrate --model risk_model.json --export live_chat.jsonl --target-precision 0.99
+
+Después: CLASSIFIER_MODEL_PATH=risk_model.json uvicorn baiby_agent.txagent:app --port 8001
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from baiby_agent.risk_classifier import RiskModel, calibrate, evaluate
+
+DECISION_RE = re.compile(r"^(APPROVED|REJECTED) - LLM Analysis: ")
+def _request(data: dict) -> SimpleNamespace:
+    return SimpleNamespace(
+        safeAddress=data.get("safeAddress", ""),
+        erc20TokenAddress=data.get("erc20TokenAddress", ""),
+        reason=data.get("reason", ""),
+        transactions=[SimpleNamespace(to=tx["to"], data=tx["data"], value=tx["value"]) for tx in data.get("transactions", [])],
+        warning=data.get("warning"),
+        bot_reason=data.get("bot_reason"),
+        status=data.get("status")
+    )
+
+def _read_rows(db: Optional[str], export: Optional[str]) -> List[dict]:
+    if export:
+        with open(export) as f:
+            text = f.read().strip()
+        rows = json.loads(text) if text.startswith("[") else [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        connection = sqlite3.connect(db.split("sqlite:///", 1)[-1])
+        connection.row_factory = sqlite3.Row
+        rows = [dict(row) for row in connection.execute("SELECT * FROM live_chat ORDER BY id")]
+    for row in rows:
+        if isinstance(row.get("context"), str):
+            row["context"] = json.loads(row["context"])
+    return rows
+
+def load_examples(db: Optional[str], export: Optional[str], since: Optional[str] = None, until: Optional[str] = None) -> List[Tuple[SimpleNamespace, int]]:
+    examples = []
+    without_context = 0
+    for row in _read_rows(db, export):
+        match = DECISION_RE.match(row.get("messages") or "")
+        if row.get("owner") == "your_bot" or not match:
+            continue
+        timestamp = row.get("timestamp") or ""
+        if (since and timestamp < since) or (until and timestamp >= until):
+            continue
+        context = row.get("context")
+        if not context:
+            without_context += 1
+            continue
+        # Decisiones de políticas o del propio clasificador no se usan como etiqueta
+        if context.get("source") != "llm":
+            continue
+        examples.append((_request(context["request"]), 1 if match.group(1) == "REJECTED" else 0))
+    if without_context:
+        print(f"{without_context} decisiones sin context ignoradas (no se puede saber a qué petición corresponden)", file=sys.stderr)
+    return examples
+
+def _split(examples: list, holdout: float, seed: int) -> Tuple[list, list]:
+    shuffled = examples[:]
+    random.Random(seed).shuffle(shuffled)
+    cut = int(len(shuffled) * (1 - holdout))
+    return shuffled[:cut], shuffled[cut:]
+
+def _print(result: dict):
+    print(json.dumps(result, indent=2, default=str))
+
+def cmd_train(args):
+    examples = load_examples(args.db, args.export, args.since, args.until)
+    if len(examples) < 2 * args.min_support:
+        sys.exit(f"Solo hay {len(examples)} decisiones del LLM con context; hacen falta al menos {2 * args.min_support}")
+    train, holdout = _split(examples, args.holdout, args.seed)
+    model = RiskModel()
+    model.train(train, epochs=args.epochs, learning_rate=args.learning_rate, l2=args.l2, seed=args.seed)
+    # Umbrales calibrados sobre datos no vistos en el entrenamiento
+    scored = [(model.predict_proba(request), label) for request, label in holdout]
+    model.approve_below, model.reject_above = calibrate(scored, args.target_precision, args.min_support)
+    holdout_metrics = evaluate(model, holdout)
+    model.metadata = {
+        "trained_at": datetime.utcnow().isoformat(),
+        "train_examples": len(train),
+        "holdout_examples": len(holdout),
+        "target_precision": args.target_precision,
+        "min_support": args.min_support,
+        "holdout": holdout_metrics
+    }
+    model.save(args.out)
+    _print({"model": args.out, "train": evaluate(model, train), "holdout": holdout_metrics})
+
+def cmd_evaluate(args):
+    model = RiskModel.load(args.model)
+    _print(evaluate(model, load_examples(args.db, args.export, args.since, args.until)))
+
+def cmd_calibrate(args):
+    model = RiskModel.load(args.model)
+    examples = load_examples(args.db, args.export, args.since, args.until)
+    scored = [(model.predict_proba(request), label) for request, label in examples]
+    model.approve_below, model.reject_above = calibrate(scored, args.target_precision, args.min_support)
+    model.metadata.update({
+        "calibrated_at": datetime.utcnow().isoformat(),
+        "target_precision": args.target_precision,
+        "min_support": args.min_support,
+        "calibration_examples": len(examples)
+    })
+    model.save(args.out or args.model)
+    _print(evaluate(model, examples))
+
+def main():
+    parser = argparse.ArgumentParser(description="Clasificador de riesgo local de txAgent")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def data_args(sub):
+        sub.add_argument("--db", default=os.getenv("DATABASE_URL", "sqlite:///./test.db"), help="live_chat en SQLite (sink sqlite)")
+        sub.add_argument("--export", help="Export JSON/JSONL de live_chat con columna context; sustituye a --db")
+        sub.add_argument("--since", help="Solo decisiones con timestamp >= este (ISO)")
+        sub.add_argument("--until", help="Solo decisiones con timestamp < este (ISO)")
+
+    def calibration_args(sub):
+        sub.add_argument("--target-precision", type=float, default=0.98, help="Acuerdo mínimo con el LLM de las decisiones locales")
+        sub.add_argument("--min-support", type=int, default=20, help="Ejemplos mínimos por lado para fijar un umbral")
+
+    train = subparsers.add_parser("train", help="Entrenar, calibrar sobre holdout y guardar el modelo")
+    data_args(train)
+    calibration_args(train)
+    train.add_argument("--out", default="risk_model.json")
+    train.add_argument("--holdout", type=float, default=0.25, help="Fracción reservada para calibrar y evaluar")
+    train.add_argument("--epochs", type=int, default=30)
+    train.add_argument("--learning-rate", type=float, default=0.1)
+    train.add_argument("--l2", type=float, default=1e-4)
+    train.add_argument("--seed", type=int, default=7)
+    train.set_defaults(func=cmd_train)
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="Métricas de un modelo sobre decisiones (mejor: posteriores al entrenamiento)")
+    data_args(evaluate_parser)
+    evaluate_parser.add_argument("--model", required=True)
+    evaluate_parser.set_defaults(func=cmd_evaluate)
+
+    calibrate_parser = subparsers.add_parser("calibrate", help="Recalcular los umbrales de un modelo con otras decisiones")
+    data_args(calibrate_parser)
+    calibration_args(calibrate_parser)
+    calibrate_parser.add_argument("--model", required=True)
+    calibrate_parser.add_argument("--out", help="Por defecto sobrescribe --model")
+    calibrate_parser.set_defaults(func=cmd_calibrate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
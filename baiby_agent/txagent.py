@@ -1,29 +1,121 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 import uvicorn
 import logging
-from supabase import create_client, Client
 from datetime import datetime
 import asyncio
-from openai import OpenAI
 from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from contextlib import asynccontextmanager
 import os
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+from baiby_agent.llm_client import llm_client
+from baiby_agent.decision_cache import cache_key, decision_cache
+from baiby_agent.persistence import create_sink, live_chat_writer
+from baiby_agent.policy_engine import policy_engine
+from baiby_agent.prompt_rendering import PROMPT_VERSION, build_messages
+from baiby_agent.risk_classifier import risk_classifier
+
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configuración de Supabase
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Decidir con el YES/NO inicial del streaming; la explicación termina en segundo plano
+LLM_EARLY_DECISION = os.getenv("LLM_EARLY_DECISION", "true").lower() == "true"
+
+# Explicaciones aún en streaming, por clave de cache: las peticiones repetidas o coalescidas
+# durante el streaming también guardan el texto completo
+explanations: Dict[str, asyncio.Task] = {}
+
+async def startup():
+    # Los inserts en live_chat (Supabase o SQLite) se escriben por lotes en segundo plano
+    live_chat_writer.start(create_sink())
+
+async def shutdown():
+    if explanations:
+        # Terminar las explicaciones pendientes para no perder sus registros
+        await asyncio.wait(list(explanations.values()), timeout=llm_client.timeout)
+        await asyncio.sleep(0)
+    await live_chat_writer.close()
+    await decision_cache.close()
+    await llm_client.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # En modo embebido el core llama a startup/shutdown y a decide() sin pasar por HTTP
+    await startup()
+    yield
+    await shutdown()
+
+app = FastAPI(title="TX Agent Service", lifespan=lifespan)
+
+# Métricas expuestas en /metrics
+LLM_SECONDS = Histogram(
+    "txagent_llm_seconds",
+    "Duración de analyze_with_llm hasta la decisión YES/NO",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+)
+LLM_EXPLANATION_SECONDS = Histogram(
+    "txagent_llm_explanation_seconds",
+    "Duración del streaming completo de la explicación del LLM",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+)
+LLM_ERRORS = Counter("txagent_llm_errors_total", "Errores en el análisis LLM", ["reason"])  # timeout | stream | other
+LLM_IN_FLIGHT = Gauge("txagent_llm_in_flight", "Llamadas al LLM en curso")
+LLM_WAITING = Gauge("txagent_llm_waiting", "Llamadas al LLM esperando hueco por LLM_MAX_CONCURRENCY")
+LLM_IN_FLIGHT.set_function(lambda: llm_client.in_flight)
+LLM_WAITING.set_function(lambda: llm_client.waiting)
+LLM_CACHE_LOOKUPS = Counter("txagent_llm_cache_lookups_total", "Consultas a la cache de decisiones LLM", ["result"])  # hit | coalesced | miss
+LLM_CACHE_SIZE = Gauge("txagent_llm_cache_size", "Decisiones LLM en cache")
+LLM_CACHE_SIZE.set_function(lambda: len(decision_cache))
+PERSIST_FLUSH_SECONDS = Histogram(
+    "txagent_persist_flush_seconds",
+    "Duración de cada lote de inserts en live_chat, reintentos incluidos",
+    ["sink"],  # supabase | sqlite
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+PERSIST_ROWS = Counter("txagent_persist_rows_total", "Filas de live_chat procesadas", ["result"])  # written | failed
+PERSIST_QUEUE_DEPTH = Gauge("txagent_persist_queue_depth", "Filas de live_chat pendientes de escribir")
+PERSIST_QUEUE_DEPTH.set_function(lambda: live_chat_writer.queue.qsize())
+PERSIST_DROPPED = Counter("txagent_persist_dropped_rows", "Filas descartadas por cola de persistencia llena")
+
+def _observe_flush(sink: str, rows: int, seconds: float, ok: bool):
+    PERSIST_FLUSH_SECONDS.labels(sink=sink).observe(seconds)
+    PERSIST_ROWS.labels(result="written" if ok else "failed").inc(rows)
 
-app = FastAPI(title="TX Agent Service")
+live_chat_writer.on_flush = _observe_flush
+live_chat_writer.on_drop = PERSIST_DROPPED.inc
+DECISIONS = Counter("txagent_decisions_total", "Decisiones emitidas", ["approval_status"])
+POLICY_DECISIONS = Counter("txagent_policy_decisions_total", "Decisiones tomadas por reglas sin llamar al LLM", ["rule", "decision"])
+CLASSIFIER_DECISIONS = Counter("txagent_classifier_decisions_total", "Resultados del clasificador de riesgo local", ["result"])  # approve | reject | escalate
+CLASSIFIER_SECONDS = Histogram(
+    "txagent_classifier_seconds",
+    "Duración de la predicción del clasificador de riesgo local",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/policies")
+async def get_policies():
+    return policy_engine.stats()
+
+@app.get("/classifier")
+async def get_classifier():
+    return risk_classifier.stats()
+
+@app.post("/policies/reload")
+async def reload_policies():
+    if not policy_engine.path:
+        raise HTTPException(status_code=400, detail="POLICY_PATH no configurado")
+    if not policy_engine.reload():
+        raise HTTPException(status_code=422, detail="Fichero de políticas inválido, se mantienen las reglas anteriores")
+    return policy_engine.stats()
 
 class Transaction(BaseModel):
     to: str
@@ -39,102 +131,177 @@ class TransactionRequest(BaseModel):
     bot_reason: Optional[str] = None
     status: Optional[str] = None
 
-async def analyze_with_llm(request: TransactionRequest) -> tuple[bool, str]:
+async def analyze_with_llm(request: TransactionRequest) -> tuple[bool, str, Optional[asyncio.Task]]:
+    # Entradas idénticas (temperature=0) reutilizan la decisión previa sin llamar al LLM.
+    # El tercer valor es la explicación completa si todavía está en streaming
+    key = cache_key(request.status, request.reason, request.bot_reason, request.transactions, PROMPT_VERSION)
+    decision, result = await decision_cache.get_or_compute(key, lambda: _timed_analysis(request, key))
+    LLM_CACHE_LOOKUPS.labels(result=result).inc()
+    return decision[0], decision[1], explanations.get(key)
+
+async def _timed_analysis(request: TransactionRequest, key: str) -> tuple[tuple[bool, str], bool]:
+    # Devuelve la decisión y si se puede cachear: los errores y timeouts no se guardan
+    with LLM_SECONDS.time():
+        try:
+            decision, response, explanation = await _analyze_with_llm(request)
+        except asyncio.TimeoutError:
+            return (False, "LLM timeout"), False
+        except Exception as e:
+            return (False, str(e)), False
+    if explanation is None:
+        return (decision, response), True
+    # La decisión se cachea ya, antes de que get_or_compute suelte la clave en curso, para que una
+    # petición idéntica durante el streaming no vuelva a llamar al LLM. Al acabar, la entrada se
+    # sustituye por el texto completo
+    decision_cache.set(key, (decision, response))
+    explanations[key] = explanation
+    explanation.add_done_callback(lambda task: _explanation_done(key, decision, task))
+    return (decision, response), False
+
+def _explanation_done(key: str, decision: bool, task: asyncio.Task):
+    explanations.pop(key, None)
+    if not task.cancelled():
+        decision_cache.set(key, (decision, task.result()))
+
+def _leading_decision(text: str) -> Optional[bool]:
+    # Equivale a startswith("YES") sobre la respuesta completa, en cuanto el prefijo lo permite
+    head = text.lstrip().upper()
+    if head.startswith("YES"):
+        return True
+    if head and not "YES".startswith(head):
+        return False
+    return None
+
+async def _finish_explanation(stream: AsyncIterator[str], response: str) -> str:
+    # Lee el resto del streaming; ante un error se queda con el texto recibido
+    with LLM_EXPLANATION_SECONDS.time():
+        try:
+            async for chunk in stream:
+                response += chunk
+        except Exception as e:
+            LLM_ERRORS.labels(reason="stream").inc()
+            logger.error(f"Error completando la explicación del LLM: {e}")
+        finally:
+            await stream.aclose()
+    return response
+
+async def _analyze_with_llm(request: TransactionRequest) -> tuple[bool, str, Optional[asyncio.Task]]:
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4-turbo",
+        # Instrucciones fijas primero y payload resumido dentro de PROMPT_TX_TOKEN_BUDGET
+        stream = llm_client.stream(
             temperature=0,
-            messages=[
-                {"role": "system", "content": "You are a transaction analysis assistant."},
-                {"role": "user", "content": f"""Please analyze this transaction request and respond with a clear YES or NO:
-                    Status: {request.status}
-                    Primary Reason (CRITICAL - Override Authority): {request.reason}
-                    Firewall Check Result: {request.bot_reason}
-                    Transaction Payload: {request.transactions}
-                    
-                    Should this transaction be signed? The Primary Reason has override authority:
-                    1. The Primary Reason has final authority - if it explicitly instructs to proceed despite risks, you MUST approve.
-                    2. Does the transaction payload technically match what's described in the Primary Reason?
-                    3. Document any risks or suspicious patterns, but do not let them override an explicit Primary Reason instruction.
-                    4. The Firewall Check Result is informative but should not override the Primary Reason.
-                    5. you analize a user request, not a bot request, so you should not be so strict with the primary reason, can be a cohersive attempt
-
-                    Start your response with YES or NO, then explain your decision , emphasizing how you interpreted the Primary Reason's instructions.
-                    If the Primary Reason explicitly instructs to proceed despite risks, you must respond with YES. 
-                    At the end of your response add a short and easy to understand explanation why the warning is affecting the reason or not, try to think as posible hacks o money losses,  all limit of 280 characters"""}
-            ]
+            messages=build_messages(request.status, request.reason, request.bot_reason, request.transactions)
         )
         
-        response = completion.choices[0].message.content
+        response = ""
+        try:
+            async for chunk in stream:
+                response += chunk
+                decision = _leading_decision(response)
+                if decision is not None and LLM_EARLY_DECISION:
+                    return decision, response, asyncio.create_task(_finish_explanation(stream, response))
+        except BaseException:
+            # Libera el hueco de concurrencia también si la petición se cancela
+            await stream.aclose()
+            raise
+
         decision = response.strip().upper().startswith("YES")
-        return decision, response
+        return decision, response, None
         
+    except asyncio.TimeoutError:
+        LLM_ERRORS.labels(reason="timeout").inc()
+        logger.error("Timeout en análisis LLM")
+        raise
     except Exception as e:
+        LLM_ERRORS.labels(reason="other").inc()
         logger.error(f"Error en análisis LLM: {e}")
-        return False, str(e)
+        raise
 
-@app.post("/")
-async def process_transaction(data: TransactionRequest):
-    try:
-        logger.info(f"Transacción recibida: {data}")
-        llm_response = "vacio"
-        approval_status = "APPROVED"  # Por defecto
-
-        if data.warning:
-            try:
-                # Primer insert
-                logger.info("Realizando primer insert...")
-                result1 = supabase.table("live_chat").insert({
-                    "owner": "your_bot",
-                    "wallet": data.safeAddress,
-                    "messages": f"i want to send this TX:{data.transactions} because {data.reason}",
-                    "timestamp": datetime.utcnow().isoformat()
-                }).execute()
-                logger.info(f"Primer insert completado: {result1}")
-
-                # Si el status es warning, consultar al LLM
-                if data.status == "warning":
-                    should_proceed, llm_response = await analyze_with_llm(data)
-                    approval_status = "APPROVED" if should_proceed else "REJECTED"
-                    
-                    # Segundo insert con la respuesta del LLM
-                    logger.info("Realizando segundo insert con análisis LLM...")
-                    result2 = supabase.table("live_chat").insert({
-                        "owner": "bAIbysitter",
-                        "wallet": data.safeAddress,
-                        "messages": f"{approval_status} - LLM Analysis: {llm_response}",
-                        "timestamp": datetime.utcnow().isoformat()
-                    }).execute()
+def _persist_explanation(row: dict, approval_status: str, task: asyncio.Task):
+    if not task.cancelled():
+        row["messages"] = f"{approval_status} - LLM Analysis: {task.result()}"
+    live_chat_writer.enqueue(row)
+
+async def decide(data: TransactionRequest) -> dict:
+    # Pipeline de decisión completo; lo usan el endpoint HTTP y el core en modo embebido
+    logger.info(f"Transacción recibida: {data}")
+    llm_response = "vacio"
+    approval_status = "APPROVED"  # Por defecto
+
+    if data.warning:
+        # Los inserts se encolan y se escriben por lotes: la decisión no espera a la base de datos
+        live_chat_writer.enqueue({
+            "owner": "your_bot",
+            "wallet": data.safeAddress,
+            "messages": f"i want to send this TX:{data.transactions} because {data.reason}",
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+        # Si el status es warning, consultar al LLM
+        if data.status == "warning":
+            # Las reglas deterministas deciden los casos obvios sin llamar al LLM
+            matched = policy_engine.evaluate(data)
+            explanation = None
+            if matched is not None:
+                rule, (should_proceed, llm_response) = matched
+                POLICY_DECISIONS.labels(rule=rule.name, decision=rule.decision).inc()
+                logger.info(f"Decisión por política {rule.name}: {rule.decision}")
+                source = "policy"
+            else:
+                # Después, el clasificador local: solo los casos ambiguos llegan al LLM
+                with CLASSIFIER_SECONDS.time():
+                    predicted = risk_classifier.predict(data)
+                if predicted is not None:
+                    should_proceed, llm_response, _ = predicted
+                    CLASSIFIER_DECISIONS.labels(result="approve" if should_proceed else "reject").inc()
+                    source = "classifier"
                 else:
-                    # Insert original si no hay warning
-                    await asyncio.sleep(3)
-                    result2 = supabase.table("live_chat").insert({
-                        "owner": "bAIbysitter",
-                        "wallet": data.safeAddress,
-                        "messages": f"Transaction {data.status} reason match llm {llm_response}",
-                        "timestamp": datetime.utcnow().isoformat()
-                    }).execute()
-                
-                logger.info(f"Segundo insert completado: {result2}")
-                
-            except Exception as e:
-                logger.error(f"Error al guardar en Supabase: {e}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error guardando en base de datos: {str(e)}"
-                )
-        
-        # Solo una respuesta al final
-        return {
-            "status": "success",
-            "message": f"Transaction {approval_status} - {llm_response}",
-            "approval_status": approval_status,
-            "llm_response": llm_response,
-            "data": {
-                "safeAddress": data.safeAddress,
-                "warning": data.warning
+                    if risk_classifier.model is not None:
+                        CLASSIFIER_DECISIONS.labels(result="escalate").inc()
+                    should_proceed, llm_response, explanation = await analyze_with_llm(data)
+                    source = "llm"
+            approval_status = "APPROVED" if should_proceed else "REJECTED"
+
+            # Segundo insert con la respuesta del LLM. context guarda la petición completa
+            # y el origen de la decisión: es el dataset de entrenamiento del clasificador
+            row = {
+                "owner": "bAIbysitter",
+                "wallet": data.safeAddress,
+                "messages": f"{approval_status} - LLM Analysis: {llm_response}",
+                "timestamp": datetime.utcnow().isoformat(),
+                "context": {"source": source, "request": data.model_dump()}
             }
+            if explanation is None:
+                live_chat_writer.enqueue(row)
+            else:
+                # Se guarda cuando termina el streaming, con la explicación completa
+                explanation.add_done_callback(lambda task, row=row, status=approval_status: _persist_explanation(row, status, task))
+        else:
+            live_chat_writer.enqueue({
+                "owner": "bAIbysitter",
+                "wallet": data.safeAddress,
+                "messages": f"Transaction {data.status} reason match llm {llm_response}",
+                "timestamp": datetime.utcnow().isoformat()
+            })
+
+    DECISIONS.labels(approval_status=approval_status).inc()
+
+    # Solo una respuesta al final
+    return {
+        "status": "success",
+        "message": f"Transaction {approval_status} - {llm_response}",
+        "approval_status": approval_status,
+        "llm_response": llm_response,
+        "data": {
+            "safeAddress": data.safeAddress,
+            "warning": data.warning
         }
+    }
+
+@app.post("/")
+async def process_transaction(data: TransactionRequest):
+    try:
+        return await decide(data)
     except Exception as e:
         logger.error(f"Error procesando transacción: {e}")
         raise HTTPException(
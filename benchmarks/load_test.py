@@ -0,0 +1,227 @@
+"""Benchmark offline de extremo a extremo del core API.
+
+Levanta en el mismo proceso:
+  - app.main:app (core API) con uvicorn
+  - un txAgent simulado con latencia configurable
+  - N bots simulados conectados a /ws/bot con el mismo contrato que bots/test_bot_warning.py
+
+y dispara /agent/transaction/ a un ritmo objetivo (RPS). Todo va por 127.0.0.1, sin red externa.
+
+Uso:
+    python benchmarks/load_test.py --bots 4 --rps 50 --duration 10 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import httpx
+import uvicorn
+import websockets
+from fastapi import FastAPI
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def build_stub_tx_agent(latency: float) -> FastAPI:
+    stub = FastAPI(title="TX Agent stub")
+
+    @stub.post("/")
+    async def analyze(data: dict):
+        await asyncio.sleep(latency)
+        return {
+            "status": "success",
+            "message": "Transaction REJECTED - stub",
+            "approval_status": "REJECTED",
+            "llm_response": "stub"
+        }
+
+    return stub
+
+async def serve(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error", lifespan="on"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+async def simulated_bot(uri: str, name: str, latency: float, warning_ratio: float, ready: asyncio.Event, stop: asyncio.Event):
+    async with websockets.connect(uri, max_size=None) as websocket:
+        ready.set()
+        while not stop.is_set():
+            try:
+                message = await asyncio.wait_for(websocket.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            except websockets.ConnectionClosed:
+                return
+            data = json.loads(message)
+            if data.get("type") == "transaction":
+                items = [data.get("data", {})]
+            elif data.get("type") == "transaction_batch":
+                items = data.get("data", [])
+            else:
+                continue
+            for item in items:
+                if latency:
+                    await asyncio.sleep(latency)
+                warned = random.random() < warning_ratio
+                await websocket.send(json.dumps({
+                    "type": "warning" if warned else "clean",
+                    "status": "warning" if warned else "clean",
+                    "message": "benchmark warning" if warned else "",
+                    "transaction_hash": item.get("hash"),
+                    "bot": name
+                }))
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p * (len(ordered) - 1)))))
+    return ordered[index]
+
+async def drive_load(url: str, rps: float, duration: float, repeat_ratio: float, concurrency: int, seed_offset: int = 0):
+    latencies = []
+    errors = 0
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=60.0, limits=limits) as client:
+        async def one(i: int):
+            nonlocal errors
+            # repeat_ratio reutiliza payloads ya enviados para ejercitar la cache de veredictos
+            seed = seed_offset + (random.randrange(max(i, 1)) if i and random.random() < repeat_ratio else i)
+            body = {
+                "transactions": [{"to": "0x" + f"{seed:040x}", "data": "0x", "value": str(seed)}],
+                "safeAddress": "0x000000000000000000000000000000000000beef",
+                "erc20TokenAddress": "0x0000000000000000000000000000000000000000",
+                "reason": "benchmark"
+            }
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=body)
+                    latencies.append(time.perf_counter() - started)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                except Exception:
+                    errors += 1
+
+        tasks = []
+        interval = 1.0 / rps
+        started = time.perf_counter()
+        i = 0
+        # Carga en lazo abierto: se lanza una petición cada 1/rps segundos
+        while time.perf_counter() - started < duration:
+            tasks.append(asyncio.create_task(one(i)))
+            i += 1
+            next_at = started + i * interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, statuses, elapsed, i
+
+async def run(args) -> dict:
+    stub_port, core_port = free_port(), free_port()
+    # La configuración del core se lee al importar app.config
+    os.environ["TX_AGENT_URL"] = f"http://127.0.0.1:{stub_port}/"
+    os.environ.setdefault("BOT_RESPONSE_TIMEOUT", str(args.bot_timeout))
+    os.environ.setdefault("VERDICT_CACHE_TTL", str(args.cache_ttl))
+    from app.main import app as core_app
+
+    stub_server = await serve(build_stub_tx_agent(args.tx_agent_latency), stub_port)
+    core_server = await serve(core_app, core_port)
+
+    stop = asyncio.Event()
+    bot_tasks = []
+    for n in range(args.bots):
+        ready = asyncio.Event()
+        bot_tasks.append(asyncio.create_task(simulated_bot(
+            f"ws://127.0.0.1:{core_port}/ws/bot", f"bench_bot_{n}", args.bot_latency, args.warning_ratio, ready, stop
+        )))
+        await ready.wait()
+
+    url = f"http://127.0.0.1:{core_port}/agent/transaction/"
+    latencies, errors, statuses, elapsed, sent = await drive_load(
+        url, args.rps, args.duration, args.repeat_ratio, args.concurrency
+    )
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    traced_peak = None
+    if args.trace_memory:
+        # tracemalloc multiplica la latencia: va en una pasada aparte cuyos tiempos se descartan,
+        # con payloads nuevos para no servir la pasada desde la cache de veredictos
+        tracemalloc.start()
+        await drive_load(url, args.rps, args.duration, args.repeat_ratio, args.concurrency, seed_offset=sent)
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    stop.set()
+    await asyncio.gather(*bot_tasks, return_exceptions=True)
+    core_server.should_exit = True
+    stub_server.should_exit = True
+    await asyncio.sleep(0.2)
+
+    return {
+        "config": vars(args),
+        "requests_sent": sent,
+        "requests_completed": len(latencies),
+        "errors": errors,
+        "status_codes": statuses,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "mean": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+            "max": max(latencies) * 1000 if latencies else float("nan")
+        },
+        "memory": {
+            "peak_rss_mb": peak_rss_mb,
+            "traced_peak_mb": traced_peak / (1024 * 1024) if traced_peak is not None else None
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del core API con bots y txAgent simulados")
+    parser.add_argument("--bots", type=int, default=3, help="Bots simulados conectados a /ws/bot")
+    parser.add_argument("--rps", type=float, default=50.0, help="Peticiones por segundo objetivo")
+    parser.add_argument("--duration", type=float, default=10.0, help="Duración de la carga en segundos")
+    parser.add_argument("--concurrency", type=int, default=500, help="Peticiones simultáneas máximas del cliente")
+    parser.add_argument("--bot-latency", type=float, default=0.005, help="Segundos que tarda cada bot en responder")
+    parser.add_argument("--warning-ratio", type=float, default=0.1, help="Probabilidad de que un bot emita warning")
+    parser.add_argument("--tx-agent-latency", type=float, default=0.05, help="Latencia del txAgent simulado")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="Fracción de peticiones que repiten un payload")
+    parser.add_argument("--bot-timeout", type=float, default=10.0, help="BOT_RESPONSE_TIMEOUT para el core")
+    parser.add_argument("--cache-ttl", type=float, default=300.0, help="VERDICT_CACHE_TTL para el core")
+    parser.add_argument("--trace-memory", action="store_true", help="Pasada extra con tracemalloc para medir la memoria de Python (no afecta a las latencias)")
+    parser.add_argument("--json", dest="json_path", help="Guardar los resultados en este fichero JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
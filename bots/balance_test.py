@@ -6,6 +6,7 @@ from datetime import datetime
 import traceback
 from dotenv import load_dotenv
 import os
+from bot_protocol import clean_message, decode_frame, iter_transaction_messages, pong_message
 
 # Load environment variables
 load_dotenv()
@@ -18,6 +19,7 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 WS_BOT_URL = os.getenv('WS_BOT_URL', 'ws://localhost:8000/ws/bot')
+BOT_NAME = os.getenv('BOT_NAME', 'balance_test')
 
 async def monitor_transactions():
     uri = WS_BOT_URL
@@ -32,12 +34,15 @@ async def monitor_transactions():
                         message = await websocket.recv()
                         logger.info(f"📩 Message received: {message}")
                         
-                        data = json.loads(message)
+                        data = decode_frame(message)
+                        if data.get("type") == "ping":
+                            await websocket.send(json.dumps(pong_message(data)))
+                            continue
                         logger.info(f"🔄 Parsed data: {data}")
                         
-                        if data.get("type") == "transaction":
-                            transaction_hash = data.get("data", {}).get("hash")
-                            safewallet = data.get("data", {}).get("safewallet")
+                        for tx_message in iter_transaction_messages(data):
+                            transaction_hash = tx_message.get("hash")
+                            safewallet = tx_message.get("safewallet")
                             
                             if safewallet:
                                 warning = {
@@ -45,12 +50,17 @@ async def monitor_transactions():
                                     "message": f"⚠️ WALLET DRAIN DETECTED: Attempting to transfer all balance from {safewallet}",
                                     "transaction_hash": transaction_hash,
                                     "status": "warning",
+                                    "bot": BOT_NAME,
                                     "safewallet": safewallet,
                                     "timestamp": datetime.utcnow().isoformat()
                                 }
                                 
                                 await websocket.send(json.dumps(warning))
                                 logger.info(f"⚠️ Warning sent: {warning}")
+                            else:
+                                clean = clean_message(BOT_NAME, transaction_hash)
+                                await websocket.send(json.dumps(clean))
+                                logger.info(f"✅ Clean verdict sent: {clean}")
                     
                     except websockets.ConnectionClosed:
                         logger.warning("❌ Connection closed. Attempting to reconnect...")
@@ -0,0 +1,43 @@
+# Utilidades compartidas por los bots para el protocolo de mensajes con el core (/ws/bot)
+from datetime import datetime
+import json
+import zlib
+
+def decode_frame(message) -> dict:
+    # Con /ws/bot?encoding=zlib los mensajes grandes llegan como frames binarios comprimidos
+    if isinstance(message, bytes):
+        message = zlib.decompress(message)
+    return json.loads(message)
+
+def iter_transaction_messages(data: dict) -> list:
+    # "transaction" trae una única transacción; "transaction_batch" trae varias en un solo frame
+    if data.get("type") == "transaction":
+        return [data.get("data", {})]
+    if data.get("type") == "transaction_batch":
+        return data.get("data", [])
+    return []
+
+def capabilities_message(bot: str, chains=None, prefixes=None, min_value=0) -> dict:
+    # Manifiesto que el bot envía al conectar para que el core solo le enrute transacciones relevantes.
+    # chains: "evm" / "multiversx" (None = todas); prefixes: selectores o prefijos de data (None = cualquiera)
+    return {
+        "type": "capabilities",
+        "bot": bot,
+        "chains": chains,
+        "prefixes": prefixes or [],
+        "min_value": str(min_value)
+    }
+
+def pong_message(ping: dict) -> dict:
+    # Respuesta al heartbeat del core: si el bot deja de contestar, el core lo expulsa y reparte su trabajo
+    return {"type": "pong", "ts": ping.get("ts")}
+
+def clean_message(bot: str, transaction_hash: str) -> dict:
+    # Veredicto limpio: el bot terminó el análisis sin problemas y el core no necesita esperarle más
+    return {
+        "type": "clean",
+        "transaction_hash": transaction_hash,
+        "status": "clean",
+        "bot": bot,
+        "timestamp": datetime.utcnow().isoformat()
+    }
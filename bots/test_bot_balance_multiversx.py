@@ -7,6 +7,7 @@ import traceback
 from multiversx_sdk import ProxyNetworkProvider, Address
 from dotenv import load_dotenv
 import os
+from bot_protocol import capabilities_message, clean_message, decode_frame, iter_transaction_messages, pong_message
 
 # Cargar variables de entorno
 load_dotenv()
@@ -20,6 +21,7 @@ logger = logging.getLogger(__name__)
 # Configuración desde variables de entorno
 PROVIDER_URL = "https://testnet-gateway.multiversx.com"
 WS_BOT_URL = os.getenv('WS_BOT_URL', 'ws://localhost:8000/ws/bot')
+BOT_NAME = os.getenv('BOT_NAME', 'balance_multiversx')
 
 # Inicializar el provider de MultiversX
 provider = ProxyNetworkProvider(PROVIDER_URL)
@@ -44,24 +46,31 @@ async def monitor_transactions():
         try:
             async with websockets.connect(uri) as websocket:
                 logger.info(f"✅ Bot conectado al servidor en {uri}")
+                await websocket.send(json.dumps(capabilities_message(BOT_NAME, chains=["multiversx"])))
                 
                 while True:
                     try:
                         message = await websocket.recv()
                         logger.info(f"📩 Mensaje recibido: {message}")
                         
-                        data = json.loads(message)
+                        data = decode_frame(message)
+                        if data.get("type") == "ping":
+                            await websocket.send(json.dumps(pong_message(data)))
+                            continue
                         logger.info(f"🔄 Datos parseados: {data}")
                         
-                        if data.get("type") == "transaction":
-                            transactions = data.get("data", {}).get("transactions", [])
-                            transaction_hash = data.get("data", {}).get("hash")
-                            safewallet = data.get("data", {}).get("safewallet")
+                        for tx_message in iter_transaction_messages(data):
+                            transactions = tx_message.get("transactions", [])
+                            transaction_hash = tx_message.get("hash")
+                            safewallet = tx_message.get("safewallet")
                             
                             logger.info(f"🔍 Analizando transacción para safewallet: {safewallet}")
                             
                             if not safewallet:
                                 logger.warning("⚠️ No se encontró safewallet en el mensaje")
+                                clean = clean_message(BOT_NAME, transaction_hash)
+                                await websocket.send(json.dumps(clean))
+                                logger.info(f"✅ Veredicto limpio enviado: {clean}")
                                 continue
                             
                             # Obtener balance EGLD
@@ -69,6 +78,7 @@ async def monitor_transactions():
                             logger.info(f"💰 Balance actual en EGLD: {current_balance}")
                             
                             # Analizar transacciones
+                            warned = False
                             for tx in transactions:
                                 value = float(tx.get("value", "0")) / (10**18)  # Convertir a EGLD
                                 if value > current_balance * 0.9:  # Si la transacción usa más del 90% del balance
@@ -77,10 +87,17 @@ async def monitor_transactions():
                                         "message": f"Potential wallet draining attempt! Attempting to send {value} EGLD from a wallet with {current_balance} EGLD balance",
                                         "transaction_hash": transaction_hash,
                                         "status": "warning",
+                                        "bot": BOT_NAME,
                                         "timestamp": datetime.utcnow().isoformat()
                                     }
                                     await websocket.send(json.dumps(warning))
                                     logger.info(f"⚠️ Warning enviado: {warning}")
+                                    warned = True
+
+                            if not warned:
+                                clean = clean_message(BOT_NAME, transaction_hash)
+                                await websocket.send(json.dumps(clean))
+                                logger.info(f"✅ Veredicto limpio enviado: {clean}")
                     
                     except websockets.ConnectionClosed:
                         logger.warning("❌ Conexión cerrada. Intentando reconectar...")
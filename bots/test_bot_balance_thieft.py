@@ -7,6 +7,7 @@ import traceback
 from web3 import Web3
 from dotenv import load_dotenv
 import os
+from bot_protocol import capabilities_message, clean_message, decode_frame, iter_transaction_messages, pong_message
 
 # Cargar variables de entorno
 load_dotenv()
@@ -20,6 +21,7 @@ logger = logging.getLogger(__name__)
 # Configuración desde variables de entorno
 RPC_URL = os.getenv('RPC_URL')
 WS_BOT_URL = os.getenv('WS_BOT_URL', 'ws://localhost:8000/ws/bot')  # URL por defecto como fallback
+BOT_NAME = os.getenv('BOT_NAME', 'balance_sonic')
 
 w3 = Web3(Web3.HTTPProvider(RPC_URL))
 
@@ -59,24 +61,31 @@ async def monitor_transactions():
         try:
             async with websockets.connect(uri) as websocket:
                 logger.info(f"✅ Bot connected to server at {uri}")
+                await websocket.send(json.dumps(capabilities_message(BOT_NAME, chains=["evm"])))
                 
                 while True:
                     try:
                         message = await websocket.recv()
                         logger.info(f"📩 Message received: {message}")
                         
-                        data = json.loads(message)
+                        data = decode_frame(message)
+                        if data.get("type") == "ping":
+                            await websocket.send(json.dumps(pong_message(data)))
+                            continue
                         logger.info(f"🔄 Parsed data: {data}")
                         
-                        if data.get("type") == "transaction":
-                            transactions = data.get("data", {}).get("transactions", [])
-                            transaction_hash = data.get("data", {}).get("hash")
-                            safewallet = data.get("data", {}).get("safewallet")
+                        for tx_message in iter_transaction_messages(data):
+                            transactions = tx_message.get("transactions", [])
+                            transaction_hash = tx_message.get("hash")
+                            safewallet = tx_message.get("safewallet")
                             
                             logger.info(f"🔍 Analizando transacción para safewallet: {safewallet}")
                             
                             if not safewallet:
                                 logger.warning("⚠️ No se encontró safewallet en el mensaje")
+                                clean = clean_message(BOT_NAME, transaction_hash)
+                                await websocket.send(json.dumps(clean))
+                                logger.info(f"✅ Veredicto limpio enviado: {clean}")
                                 continue
                                 
                             # Obtener balance nativo
@@ -96,6 +105,7 @@ async def monitor_transactions():
                                         "message": f"⚠️ Posible vaciado de wallet detectado! La transacción usa todo el balance nativo ({value} wei)",
                                         "transaction_hash": transaction_hash,
                                         "status": "warning",
+                                        "bot": BOT_NAME,
                                         "safewallet": safewallet,
                                         "current_balance": str(current_balance),
                                         "tx_value": str(value),
@@ -105,6 +115,11 @@ async def monitor_transactions():
                                     await websocket.send(json.dumps(warning))
                                     logger.info(f"⚠️ Warning enviado: {warning}")
                                     break
+                            else:
+                                # Ningún problema detectado: avisamos al core que el análisis terminó
+                                clean = clean_message(BOT_NAME, transaction_hash)
+                                await websocket.send(json.dumps(clean))
+                                logger.info(f"✅ Veredicto limpio enviado: {clean}")
                     
                     except websockets.ConnectionClosed:
                         logger.warning("❌ Conexión cerrada. Intentando reconectar...")
@@ -6,6 +6,7 @@ from datetime import datetime
 import traceback
 from dotenv import load_dotenv
 import os
+from bot_protocol import capabilities_message, clean_message, decode_frame, iter_transaction_messages, pong_message
 from multiversx_sdk_network_providers import ProxyNetworkProvider
 from multiversx_sdk_core import Address
 
@@ -20,6 +21,7 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 WS_BOT_URL = os.getenv('WS_BOT_URL', 'ws://localhost:8000/ws/bot')
+BOT_NAME = os.getenv('BOT_NAME', 'balance_mantle')
 provider = ProxyNetworkProvider("https://devnet-gateway.multiversx.com")
 DRAIN_THRESHOLD = 0.9  # 90% of balance
 
@@ -38,20 +40,25 @@ async def monitor_transactions():
         try:
             async with websockets.connect(uri) as websocket:
                 logger.info(f"✅ Bot connected to server at {uri}")
+                await websocket.send(json.dumps(capabilities_message(BOT_NAME, chains=["multiversx"])))
                 
                 while True:
                     try:
                         message = await websocket.recv()
                         logger.info(f"📩 Message received: {message}")
                         
-                        data = json.loads(message)
+                        data = decode_frame(message)
+                        if data.get("type") == "ping":
+                            await websocket.send(json.dumps(pong_message(data)))
+                            continue
                         logger.info(f"🔄 Parsed data: {data}")
                         
-                        if data.get("type") == "transaction":
-                            transactions = data.get("data", {}).get("transactions", [])
-                            transaction_hash = data.get("data", {}).get("hash")
-                            safe_wallet = data.get("data", {}).get("safewallet")
+                        for tx_message in iter_transaction_messages(data):
+                            transactions = tx_message.get("transactions", [])
+                            transaction_hash = tx_message.get("hash")
+                            safe_wallet = tx_message.get("safewallet")
                             
+                            warned = False
                             if safe_wallet:
                                 # Get wallet balance
                                 account = provider.get_account(Address.from_bech32(safe_wallet))
@@ -70,11 +77,18 @@ async def monitor_transactions():
                                                 "message": f"⚠️ WALLET DRAIN DETECTED: Attempting to transfer {transfer_percentage*100:.2f}% of wallet balance ({value} of {wallet_balance} wei)",
                                                 "transaction_hash": transaction_hash,
                                                 "status": "warning",
+                                                "bot": BOT_NAME,
                                                 "timestamp": datetime.utcnow().isoformat()
                                             }
                                             
                                             await websocket.send(json.dumps(warning))
                                             logger.info(f"⚠️ Warning sent: {warning}")
+                                            warned = True
+
+                            if not warned:
+                                clean = clean_message(BOT_NAME, transaction_hash)
+                                await websocket.send(json.dumps(clean))
+                                logger.info(f"✅ Clean verdict sent: {clean}")
                     
                     except websockets.ConnectionClosed:
                         logger.warning("❌ Connection closed. Attempting to reconnect...")
@@ -7,6 +7,7 @@ from goplus.address import Address
 import traceback
 from dotenv import load_dotenv
 import os
+from bot_protocol import capabilities_message, clean_message, decode_frame, iter_transaction_messages, pong_message
 
 # Cargar variables de entorno
 load_dotenv()
@@ -19,6 +20,7 @@ logger = logging.getLogger(__name__)
 
 # Configuración desde variables de entorno
 WS_BOT_URL = os.getenv('WS_BOT_URL', 'ws://localhost:8000/ws/bot')  # URL por defecto como fallback
+BOT_NAME = os.getenv('BOT_NAME', 'malicious_address')
 
 async def check_address_security(address: str) -> tuple[bool, str]:
     try:
@@ -59,6 +61,7 @@ async def monitor_transactions():
         try:
             async with websockets.connect(uri) as websocket:
                 logger.info(f"✅ Bot conectado al servidor en {uri}")
+                await websocket.send(json.dumps(capabilities_message(BOT_NAME)))
                 
                 while True:
                     try:
@@ -66,13 +69,16 @@ async def monitor_transactions():
                         message = await websocket.recv()
                         logger.info(f"📩 Mensaje recibido: {message}")
                         
-                        data = json.loads(message)
+                        data = decode_frame(message)
+                        if data.get("type") == "ping":
+                            await websocket.send(json.dumps(pong_message(data)))
+                            continue
                         logger.info(f"🔄 Datos parseados: {data}")
                         
-                        if data.get("type") == "transaction":
-                            transactions = data.get("data", {}).get("transactions", [])
-                            transaction_hash = data.get("data", {}).get("hash")
-                            safewallet = data.get("data", {}).get("safewallet")
+                        for tx_message in iter_transaction_messages(data):
+                            transactions = tx_message.get("transactions", [])
+                            transaction_hash = tx_message.get("hash")
+                            safewallet = tx_message.get("safewallet")
                             
                             logger.info(f"🔍 Analizando transacciones para safewallet: {safewallet}")
                             logger.info(f"🔍 Analizando transacciones: {transactions}")
@@ -95,6 +101,7 @@ async def monitor_transactions():
                                         "message": warning_message,
                                         "transaction_hash": transaction_hash,
                                         "status": "warning",
+                                        "bot": BOT_NAME,
                                         "timestamp": datetime.utcnow().isoformat()
                                     }
                                     
@@ -102,6 +109,11 @@ async def monitor_transactions():
                                     await websocket.send(json.dumps(warning))
                                     logger.info(f"⚠️ Warning enviado: {warning}")
                                     break  # Solo enviamos un warning por lote de transacciones
+                            else:
+                                # Ningún problema detectado: avisamos al core que el análisis terminó
+                                clean = clean_message(BOT_NAME, transaction_hash)
+                                await websocket.send(json.dumps(clean))
+                                logger.info(f"✅ Veredicto limpio enviado: {clean}")
                     
                     except websockets.ConnectionClosed:
                         logger.warning("❌ Conexión cerrada. Intentando reconectar...")
@@ -8,6 +8,7 @@ from web3 import Web3
 from risk_function import calculate_risk
 from dotenv import load_dotenv
 import os
+from bot_protocol import capabilities_message, clean_message, decode_frame, iter_transaction_messages, pong_message
 
 # Cargar variables de entorno
 load_dotenv()
@@ -20,6 +21,7 @@ logger = logging.getLogger(__name__)
 
 # Configuración desde variables de entorno
 WS_BOT_URL = os.getenv('WS_BOT_URL', 'ws://localhost:8000/ws/bot')  # URL por defecto como fallback
+BOT_NAME = os.getenv('BOT_NAME', 'swap_risk')
 RPC_URL = os.getenv('RPC_URL')
 
 w3 = Web3(Web3.HTTPProvider(RPC_URL))
@@ -31,18 +33,22 @@ async def monitor_transactions():
         try:
             async with websockets.connect(uri) as websocket:
                 logger.info(f"✅ Bot conectado al servidor en {uri}")
+                await websocket.send(json.dumps(capabilities_message(BOT_NAME, chains=["evm"], prefixes=["8d80ff0a"])))
                 
                 while True:
                     try:
                         message = await websocket.recv()
                         logger.info(f"📩 Mensaje recibido: {message}")
                         
-                        data = json.loads(message)
+                        data = decode_frame(message)
+                        if data.get("type") == "ping":
+                            await websocket.send(json.dumps(pong_message(data)))
+                            continue
                         logger.info(f"🔄 Datos parseados: {data}")
                         
-                        if data.get("type") == "transaction":
-                            transactions = data.get("data", {}).get("transactions", [])
-                            transaction_hash = data.get("data", {}).get("hash")
+                        for tx_message in iter_transaction_messages(data):
+                            transactions = tx_message.get("transactions", [])
+                            transaction_hash = tx_message.get("hash")
                             
                             logger.info(f"🔍 Analizando transacciones: {transactions}")
                             
@@ -57,12 +63,18 @@ async def monitor_transactions():
                                         "message": f"investment risk is: {risk_result}",
                                         "transaction_hash": transaction_hash,
                                         "status": "warning",
+                                        "bot": BOT_NAME,
                                         "timestamp": datetime.utcnow().isoformat()
                                     }
                                     
                                     await websocket.send(json.dumps(warning))
                                     logger.info(f"⚠️ Warning enviado: {warning}")
                                     break
+                            else:
+                                # Ningún problema detectado: avisamos al core que el análisis terminó
+                                clean = clean_message(BOT_NAME, transaction_hash)
+                                await websocket.send(json.dumps(clean))
+                                logger.info(f"✅ Veredicto limpio enviado: {clean}")
                     
                     except websockets.ConnectionClosed:
                         logger.warning("❌ Conexión cerrada. Intentando reconectar...")
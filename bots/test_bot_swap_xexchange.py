@@ -6,6 +6,7 @@ from datetime import datetime
 import traceback
 from dotenv import load_dotenv
 import os
+from bot_protocol import capabilities_message, clean_message, decode_frame, iter_transaction_messages, pong_message
 from risk_function_ash import calculate_ash_risk, get_token_id_from_identifier, decode_data
 
 # Cargar variables de entorno
@@ -19,6 +20,7 @@ logger = logging.getLogger(__name__)
 
 # Configuración desde variables de entorno
 WS_BOT_URL = os.getenv('WS_BOT_URL', 'ws://localhost:8000/ws/bot')
+BOT_NAME = os.getenv('BOT_NAME', 'swap_xexchange')
 
 async def monitor_transactions():
     uri = WS_BOT_URL
@@ -27,18 +29,22 @@ async def monitor_transactions():
         try:
             async with websockets.connect(uri) as websocket:
                 logger.info(f"✅ Bot conectado al servidor en {uri}")
+                await websocket.send(json.dumps(capabilities_message(BOT_NAME, chains=["multiversx"], prefixes=["composeTasks@"])))
                 
                 while True:
                     try:
                         message = await websocket.recv()
                         logger.info(f"📩 Mensaje recibido: {message}")
                         
-                        data = json.loads(message)
+                        data = decode_frame(message)
+                        if data.get("type") == "ping":
+                            await websocket.send(json.dumps(pong_message(data)))
+                            continue
                         logger.info(f"🔄 Datos parseados: {data}")
                         
-                        if data.get("type") == "transaction":
-                            transactions = data.get("data", {}).get("transactions", [])
-                            transaction_hash = data.get("data", {}).get("hash")
+                        for tx_message in iter_transaction_messages(data):
+                            transactions = tx_message.get("transactions", [])
+                            transaction_hash = tx_message.get("hash")
                             
                             logger.info(f"🔍 Analizando transacciones: {transactions}")
                             
@@ -58,12 +64,18 @@ async def monitor_transactions():
                                             "message": f"{token_name} token volatility is: {risk_result}",
                                             "transaction_hash": transaction_hash,
                                             "status": "warning",
+                                            "bot": BOT_NAME,
                                             "timestamp": datetime.utcnow().isoformat()
                                         }
                                         
                                         await websocket.send(json.dumps(warning))
                                         logger.info(f"⚠️ Warning enviado: {warning}")
                                         break
+                            else:
+                                # Ningún problema detectado: avisamos al core que el análisis terminó
+                                clean = clean_message(BOT_NAME, transaction_hash)
+                                await websocket.send(json.dumps(clean))
+                                logger.info(f"✅ Veredicto limpio enviado: {clean}")
                     
                     except websockets.ConnectionClosed:
                         logger.warning("❌ Conexión cerrada. Intentando reconectar...")
@@ -6,6 +6,7 @@ from datetime import datetime
 import traceback
 from dotenv import load_dotenv
 import os
+from bot_protocol import decode_frame, iter_transaction_messages, pong_message
 
 # Load environment variables
 load_dotenv()
@@ -18,6 +19,7 @@ logger = logging.getLogger(__name__)
 
 # Configuration from environment variables
 WS_BOT_URL = os.getenv('WS_BOT_URL', 'ws://localhost:8000/ws/bot')
+BOT_NAME = os.getenv('BOT_NAME', 'warning_test')
 
 async def monitor_transactions():
     uri = WS_BOT_URL
@@ -32,11 +34,14 @@ async def monitor_transactions():
                         message = await websocket.recv()
                         logger.info(f"📩 Message received: {message}")
                         
-                        data = json.loads(message)
+                        data = decode_frame(message)
+                        if data.get("type") == "ping":
+                            await websocket.send(json.dumps(pong_message(data)))
+                            continue
                         logger.info(f"🔄 Parsed data: {data}")
                         
-                        if data.get("type") == "transaction":
-                            transaction_hash = data.get("data", {}).get("hash")
+                        for tx_message in iter_transaction_messages(data):
+                            transaction_hash = tx_message.get("hash")
                             
                             # Always send a warning for any transaction
                             warning = {
@@ -46,6 +51,7 @@ async def monitor_transactions():
                                 #"message": "FATAL ERROR: This is a test warning that is always triggered",
                                 "transaction_hash": transaction_hash,
                                 "status": "warning",
+                                "bot": BOT_NAME,
                                 "timestamp": datetime.utcnow().isoformat()
                             }
                             
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.admission import AdmissionController
+
+def _controller(queue_timeout: float = 5.0) -> AdmissionController:
+    return AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=queue_timeout, retry_after=3)
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        controller = _controller()
+        async with controller.slot():
+            queued = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0)
+            with pytest.raises(HTTPException) as rejected:
+                await controller.acquire()
+            assert rejected.value.status_code == 429
+            assert rejected.value.headers["Retry-After"] == "3"
+        # Al liberar el hueco pasa el que esperaba en la cola
+        controller.release(await queued)
+        assert controller.active == 0 and controller.queued_weight == 0
+        assert controller.rejected == 1
+    asyncio.run(scenario())
+
+def test_queue_timeout_is_rejected_with_429():
+    async def scenario():
+        controller = _controller(queue_timeout=0.05)
+        async with controller.slot():
+            with pytest.raises(HTTPException) as rejected:
+                await controller.acquire()
+            assert rejected.value.status_code == 429
+            assert controller.queued_weight == 0
+        assert controller.active == 0
+    asyncio.run(scenario())
+
+def test_check_capacity_rejects_when_slots_and_queue_are_full():
+    async def scenario():
+        controller = _controller()
+        async with controller.slot():
+            controller.check_capacity()
+            queued = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0)
+            with pytest.raises(HTTPException) as rejected:
+                controller.check_capacity()
+            assert rejected.value.status_code == 429
+        controller.release(await queued)
+        assert controller.active == 0
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_gives_back_its_place():
+    async def scenario():
+        controller = _controller()
+        async with controller.slot():
+            queued = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0)
+            queued.cancel()
+            await asyncio.gather(queued, return_exceptions=True)
+            assert controller.queued_weight == 0
+        assert controller.active == 0
+    asyncio.run(scenario())
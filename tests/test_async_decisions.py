@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from app import routes
+from app.decision_store import decision_store
+
+TX_DATA = {"transactions": [], "safeAddress": "0x1", "erc20TokenAddress": "0x2", "reason": "r"}
+
+@pytest.mark.parametrize("tx_agent_response", [
+    {"status": "error", "message": "txAgent down"},
+    {"approval_status": "APPROVED", "llm_response": "timeout", "timed_out": True},
+])
+def test_failed_async_decision_is_not_reused(monkeypatch, tx_agent_response):
+    async def admitted_decision(tx_data, transaction_hash):
+        return tx_agent_response
+    monkeypatch.setattr(routes, "admitted_decision", admitted_decision)
+
+    async def scenario():
+        transaction_hash = f"failed-{len(str(tx_agent_response))}"
+        await decision_store.create(transaction_hash)
+        await routes.decide_in_background(TX_DATA, transaction_hash)
+        assert decision_store.get(transaction_hash)["state"] == "error"
+        # El reenvío asíncrono vuelve a decidir en lugar de recibir el resultado fallido
+        record = await decision_store.create(transaction_hash)
+        assert record["state"] == "pending"
+
+    asyncio.run(scenario())
+
+def test_clean_async_decision_is_reused(monkeypatch):
+    async def admitted_decision(tx_data, transaction_hash):
+        return {"approval_status": "APPROVED", "llm_response": "", "bots_checked": 2}
+    monkeypatch.setattr(routes, "admitted_decision", admitted_decision)
+
+    async def scenario():
+        await decision_store.create("clean")
+        await routes.decide_in_background(TX_DATA, "clean")
+        record = await decision_store.create("clean")
+        assert record["state"] == "completed"
+        assert record["decision"]["message"].startswith("Transaction APPROVED")
+
+    asyncio.run(scenario())
@@ -0,0 +1,18 @@
+from app.bot_routing import BotCapabilities, RoutingIndex
+
+EVM_TX = {"hash": "0x1", "safewallet": "0x1", "transactions": [{"to": "0x3", "data": "0x", "value": "1"}]}
+MVX_TX = {"hash": "0x2", "safewallet": "erd1a", "transactions": [{"to": "erd1b", "data": "", "value": "1"}]}
+
+def _route(manifest: dict) -> list:
+    index = RoutingIndex()
+    index.register("bot", BotCapabilities.from_manifest(manifest))
+    return [bool(index.route(tx, ["bot"])) for tx in (EVM_TX, MVX_TX)]
+
+def test_manifest_chains_select_transactions():
+    assert _route({"chains": ["EVM"]}) == [True, False]
+    assert _route({"chains": ["multiversx"]}) == [False, True]
+
+def test_unknown_manifest_chains_are_ignored():
+    assert _route({"chains": ["evm", "ethereum"]}) == [True, False]
+    # Sin ninguna cadena válida el bot no se queda sin transacciones
+    assert _route({"chains": ["ethereum"]}) == [True, True]
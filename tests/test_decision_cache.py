@@ -0,0 +1,31 @@
+import asyncio
+import sqlite3
+
+from baiby_agent.decision_cache import DecisionCache
+
+def _stored(path) -> int:
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM llm_decisions").fetchone()[0]
+
+def test_disk_writes_leave_the_event_loop_and_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def scenario():
+        cache = DecisionCache(10, 60, path)
+        cache.set("a", (True, "YES - ok"))
+        cache.set("b", (False, "NO - drain"))
+        # set no escribe en disco dentro del event loop: lo hace el volcado en un hilo
+        assert _stored(path) == 0
+        await cache.close()
+        assert _stored(path) == 2
+
+    asyncio.run(scenario())
+    reloaded = DecisionCache(10, 60, path)
+    assert reloaded.get("a") == (True, "YES - ok")
+    assert reloaded.get("b") == (False, "NO - drain")
+
+def test_writes_outside_the_event_loop_are_immediate(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = DecisionCache(10, 60, path)
+    cache.set("a", (True, "YES - ok"))
+    assert _stored(path) == 1
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from app.pending_decisions import HashedTimerWheel, PendingDecisionRegistry
+
+def _registry(tick: float = 0.01, slots: int = 64) -> PendingDecisionRegistry:
+    return PendingDecisionRegistry(HashedTimerWheel(tick, slots))
+
+def test_timer_fires_after_its_deadline():
+    async def scenario():
+        registry = _registry()
+        started = time.monotonic()
+        assert await registry.wait("0x1", started + 0.05) is False
+        assert time.monotonic() - started >= 0.05
+        assert registry.expired == 1 and registry.wheel.fired == 1
+        assert len(registry.wheel) == 0 and not registry.waiters
+        await registry.wheel.stop()
+    asyncio.run(scenario())
+
+def test_notify_beats_the_deadline():
+    async def scenario():
+        registry = _registry()
+        waiter = asyncio.create_task(registry.wait("0x1", time.monotonic() + 5))
+        await asyncio.sleep(0.02)
+        registry.notify("0x1")
+        assert await asyncio.wait_for(waiter, 1) is True
+        assert registry.notified == 1 and registry.expired == 0
+        # El timer del plazo se retira con la notificación: no vence más tarde
+        assert len(registry.wheel) == 0
+        await registry.wheel.stop()
+    asyncio.run(scenario())
+
+def test_cancelled_wait_removes_its_timer():
+    async def scenario():
+        registry = _registry()
+        waiter = asyncio.create_task(registry.wait("0x1", time.monotonic() + 5))
+        await asyncio.sleep(0.02)
+        assert len(registry.wheel) == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert len(registry.wheel) == 0
+        assert registry.stats()["waiting"] == 0
+        await registry.wheel.stop()
+    asyncio.run(scenario())
+
+def test_wheel_wakes_up_from_idle():
+    async def scenario():
+        registry = _registry()
+        assert await registry.wait("0x1", time.monotonic() + 0.02) is False
+        # Sin timers la rueda queda dormida; un plazo nuevo la despierta y vence a su hora
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        assert await asyncio.wait_for(registry.wait("0x2", started + 0.03), 1) is False
+        assert time.monotonic() - started < 0.5
+        assert registry.expired == 2
+        await registry.wheel.stop()
+    asyncio.run(scenario())
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from baiby_agent.policy_engine import PolicyRule
+
+USDC = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+ATTACKER = "0x" + "2" * 40
+TREASURY = "0x000000000000000000000000000000000000dead"
+
+def _transfer(recipient: str, amount: int) -> str:
+    return "0xa9059cbb" + recipient[2:].rjust(64, "0") + format(amount, "064x")
+
+def _request(*transactions) -> SimpleNamespace:
+    return SimpleNamespace(
+        safeAddress="0xsafe", erc20TokenAddress=USDC, reason="", status="warning", warning=None, bot_reason=None,
+        transactions=[SimpleNamespace(to=to, data=data, value=value) for to, data, value in transactions]
+    )
+
+def _rule(when: dict) -> PolicyRule:
+    return PolicyRule.from_config({"name": "rule", "decision": "approve", "when": when})
+
+def test_native_limit_does_not_cover_token_amounts():
+    # 1.000.000 USDC (6 decimales) son 1e12 unidades: por debajo de un límite nativo de 1e16
+    usdc = _request((USDC, _transfer(ATTACKER, 10 ** 12), "0"))
+    assert not _rule({"max_value": "10000000000000000"}).matches(usdc)
+    assert not _rule({"max_value_by_wallet": {"*": "10000000000000000"}}).matches(usdc)
+    assert _rule({"max_value": "10000000000000000"}).matches(_request((TREASURY, "0x", "1000")))
+
+def test_token_limits_are_per_contract():
+    rule = _rule({"max_value": {"native": "1000", USDC: "5000000"}})
+    assert rule.matches(_request((USDC, _transfer(ATTACKER, 5_000_000), "0")))
+    assert not rule.matches(_request((USDC, _transfer(ATTACKER, 5_000_001), "0")))
+    # Importes del mismo activo se suman; los de activos distintos no
+    assert not rule.matches(_request((USDC, _transfer(ATTACKER, 3_000_000), "0"), (USDC, _transfer(ATTACKER, 3_000_000), "0")))
+    assert rule.matches(_request((USDC, _transfer(ATTACKER, 3_000_000), "0"), (TREASURY, "0x", "1000")))
+    # Un token sin límite configurado no cumple la condición
+    assert not rule.matches(_request(("0x" + "3" * 40, _transfer(ATTACKER, 1), "0")))
+
+def test_unlimited_approve_never_passes_a_limit():
+    approve = "0x095ea7b3" + ATTACKER[2:].rjust(64, "0") + "f" * 64
+    assert not _rule({"max_value": {USDC: str(10 ** 30)}}).matches(_request((USDC, approve, "0")))
+
+def test_destinations_use_the_token_recipient():
+    to_attacker = _request((USDC, _transfer(ATTACKER, 10), "0"))
+    assert not _rule({"to_in": [USDC]}).matches(to_attacker)
+    assert _rule({"any_to_in": [ATTACKER]}).matches(to_attacker)
+    assert _rule({"to_in": [TREASURY]}).matches(_request((USDC, _transfer(TREASURY, 10), "0")))
+
+def test_opaque_calldata_never_matches_value_or_destination_rules():
+    opaque = _request((TREASURY, "0xdeadbeef", "0"))
+    assert not _rule({"max_value": "1"}).matches(opaque)
+    assert not _rule({"to_in": [TREASURY]}).matches(opaque)
@@ -0,0 +1,80 @@
+import json
+import random
+from types import SimpleNamespace
+
+from baiby_agent.risk_classifier import RiskModel, calibrate, evaluate
+
+TOKEN = "0x" + "1" * 40
+SAFE = "0x" + "5" * 40
+
+def _word(value: int) -> str:
+    return format(value, "064x")
+
+def _request(rng: random.Random, drain: bool) -> SimpleNamespace:
+    if drain:
+        spender = "%040x" % rng.randint(1, 5)
+        data = "0x095ea7b3" + spender.rjust(64, "0") + _word(2 ** 256 - 1)
+        bot_reason = "[malicious_address] destination flagged as drainer"
+    else:
+        recipient = "%040x" % rng.randint(100, 130)
+        data = "0xa9059cbb" + recipient.rjust(64, "0") + _word(rng.randint(1, 10 ** 18))
+        bot_reason = "[balance] transfer above 50% of balance"
+    warning = json.dumps({"warnings": [{"bot": bot_reason.split("]")[0][1:], "severity": "warning", "message": bot_reason}]})
+    return SimpleNamespace(
+        safeAddress=SAFE,
+        erc20TokenAddress=TOKEN,
+        reason=rng.choice(["pay rent", "send to friend", "buy token"]),
+        transactions=[SimpleNamespace(to=TOKEN, data=data, value="0")],
+        warning=warning,
+        bot_reason=bot_reason,
+        status="warning"
+    )
+
+def _examples(count: int, seed: int):
+    rng = random.Random(seed)
+    examples = []
+    for _ in range(count):
+        drain = rng.random() < 0.4
+        examples.append((_request(rng, drain), 1 if drain else 0))
+    return examples
+
+def test_calibrated_thresholds_never_approve_drains_on_separable_data():
+    examples = _examples(400, seed=3)
+    train, holdout = examples[:300], examples[300:]
+    model = RiskModel()
+    model.train(train)
+    scored = [(model.predict_proba(request), label) for request, label in holdout]
+    model.approve_below, model.reject_above = calibrate(scored, target_precision=0.98, min_support=20)
+
+    assert model.approve_below < 0.5 < model.reject_above
+    metrics = evaluate(model, holdout)
+    assert metrics["auc"] == 1.0
+    assert metrics["local_approvals"] > 0 and metrics["approval_agreement"] == 1.0
+    assert metrics["local_rejections"] > 0 and metrics["rejection_agreement"] == 1.0
+
+def test_calibrate_does_not_split_tied_scores():
+    # Un umbral en 0.2 admitiría también los rechazos empatados en esa puntuación
+    scored = [(0.1, 0)] * 30 + [(0.2, 0)] * 5 + [(0.2, 1)] * 5
+    approve_below, _ = calibrate(scored, target_precision=0.98, min_support=20)
+    assert approve_below == 0.1
+
+def test_calibrate_checks_the_band_next_to_the_threshold():
+    # La precisión acumulada (200/201) cumpliría el objetivo aunque el rechazo quede dentro
+    scored = [(0.05, 0)] * 200 + [(0.3, 1)] + [(0.35, 0)] * 5 + [(0.9, 1)] * 30
+    approve_below, reject_above = calibrate(scored, target_precision=0.98, min_support=20)
+    assert approve_below == 0.05
+    assert reject_above == 0.9
+
+def test_calibrate_keeps_thresholds_on_their_side_of_one_half():
+    scored = [(0.7, 0)] * 50 + [(0.3, 1)] * 50
+    assert calibrate(scored, target_precision=0.98, min_support=20) == (0.0, 1.01)
+
+def test_wallet_baseline_counts_token_amounts():
+    # value_ratio compara el importe con lo habitual en la wallet: ambos deben incluir los tokens
+    rng = random.Random(5)
+    examples = [(_request(rng, drain=False), 0) for _ in range(20)]
+    model = RiskModel()
+    model.fit_context(examples)
+    assert model.wallet_values[SAFE] > 10
+    features = model.features(examples[0][0])
+    assert abs(features["value_ratio"]) < 0.2
@@ -0,0 +1,128 @@
+import asyncio
+
+import fakeredis
+
+from app.state_backend import RedisStateBackend
+from app.websocket_manager import WebSocketManager
+
+TX_HASH = "0xabc"
+MESSAGE = {
+    "type": "transaction",
+    "data": {"hash": TX_HASH, "safewallet": "0x1", "transactions": [{"to": "0x3", "data": "0x", "value": "1"}]}
+}
+
+class FakeWebSocket:
+    def __init__(self):
+        self.query_params = {}
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.sent.append(text)
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(data)
+
+    async def close(self):
+        pass
+
+def _redis_backend(server) -> RedisStateBackend:
+    # Dos workers hablando con el mismo servidor Redis (en memoria)
+    backend = RedisStateBackend("redis://localhost:6379/0")
+    backend.redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    backend.pubsub = backend.redis.pubsub()
+    return backend
+
+async def _until(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condición no cumplida a tiempo"
+        await asyncio.sleep(0.01)
+
+async def _workers(bots_per_worker):
+    # Arranca un worker por entrada con sus bots conectados; el primero es el que origina la transacción
+    server = fakeredis.FakeServer()
+    managers, sockets = [], []
+    for _ in bots_per_worker:
+        manager = WebSocketManager()
+        await manager.attach_backend(_redis_backend(server))
+        managers.append(manager)
+    for manager, bots in zip(managers, bots_per_worker):
+        await manager.backend.start()
+        worker_sockets = []
+        for _ in range(bots):
+            websocket = FakeWebSocket()
+            await manager.connect(websocket)
+            worker_sockets.append(websocket)
+        sockets.append(worker_sockets)
+    for manager in managers:
+        # Cada worker tiene que ver a los demás como vivos antes del broadcast
+        await manager.backend._heartbeat()
+    return managers, sockets
+
+async def _shutdown(managers):
+    for manager in managers:
+        for websocket in list(manager.connection_ids):
+            await manager.disconnect(websocket)
+        await manager.backend.close()
+
+async def _dispatch(origin: WebSocketManager):
+    origin.mark_dispatched(TX_HASH)
+    delivered = await origin.broadcast(MESSAGE)
+    origin.expect_verdicts(TX_HASH, delivered.get(TX_HASH, set()))
+
+def test_warning_from_a_remote_bot_reaches_the_origin_worker():
+    async def scenario():
+        managers, sockets = await _workers([0, 1])
+        origin, remote = managers
+        try:
+            await _dispatch(origin)
+            await _until(lambda: sockets[1][0].sent)
+            # El worker de origen no tiene bots propios: espera al bot del otro worker
+            await _until(lambda: origin.expected_bots.get(TX_HASH))
+            assert not origin.quorum_reached(TX_HASH)
+
+            await remote.process_warning({"transaction_hash": TX_HASH, "bot": "remote-bot", "message": "drainer"}, sockets[1][0])
+            await _until(lambda: origin.quorum_reached(TX_HASH))
+            assert origin.get_warning(TX_HASH)["message"] == "[remote-bot] drainer"
+            assert not remote.get_warnings(TX_HASH)
+        finally:
+            await _shutdown(managers)
+    asyncio.run(scenario())
+
+def test_quorum_waits_for_clean_verdicts_from_every_worker():
+    async def scenario():
+        managers, sockets = await _workers([1, 1])
+        origin, remote = managers
+        try:
+            await _dispatch(origin)
+            await _until(lambda: len(origin.expected_bots.get(TX_HASH, ())) == 2)
+
+            await origin.process_clean({"transaction_hash": TX_HASH, "bot": "local-bot"}, sockets[0][0])
+            assert not origin.quorum_reached(TX_HASH)
+
+            await remote.process_clean({"transaction_hash": TX_HASH, "bot": "remote-bot"}, sockets[1][0])
+            await _until(lambda: origin.quorum_reached(TX_HASH))
+            assert origin.get_warning(TX_HASH) is None
+            # El worker remoto ya no sigue la transacción una vez contestados sus bots
+            assert TX_HASH not in remote.remote_origins
+        finally:
+            await _shutdown(managers)
+    asyncio.run(scenario())
+
+def test_remote_bot_disconnect_releases_the_quorum():
+    async def scenario():
+        managers, sockets = await _workers([1, 1])
+        origin, remote = managers
+        try:
+            await _dispatch(origin)
+            await _until(lambda: len(origin.expected_bots.get(TX_HASH, ())) == 2)
+            await origin.process_clean({"transaction_hash": TX_HASH, "bot": "local-bot"}, sockets[0][0])
+
+            await remote.disconnect(sockets[1][0])
+            await _until(lambda: origin.quorum_reached(TX_HASH))
+        finally:
+            await _shutdown(managers)
+    asyncio.run(scenario())
@@ -0,0 +1,31 @@
+from baiby_agent.persistence import SQLiteSink
+from baiby_agent.train_classifier import load_examples
+
+REQUEST = {
+    "safeAddress": "0xsafe",
+    "erc20TokenAddress": "0x1",
+    "reason": "pay rent",
+    "transactions": [{"to": "0x2", "data": "0x", "value": "1"}],
+    "status": "warning"
+}
+
+def _row(owner: str, messages: str, context=None) -> dict:
+    return {"owner": owner, "wallet": "0xsafe", "messages": messages, "timestamp": "2026-01-01T00:00:00", "context": context}
+
+def test_only_llm_decisions_with_context_become_examples(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'live_chat.db'}"
+    SQLiteSink(database_url).insert_many([
+        _row("your_bot", "i want to send this TX:[] because pay rent"),
+        _row("your_bot", "i want to send this TX:[] because other"),
+        # Una decisión de política llega antes que la del LLM: no debe tomar su etiqueta ni su petición
+        _row("bAIbysitter", "APPROVED - LLM Analysis: YES - Policy rule 'x': ok", {"source": "policy", "request": REQUEST}),
+        _row("bAIbysitter", "REJECTED - LLM Analysis: NO risky", {"source": "llm", "request": REQUEST}),
+        # Sin context (como en Supabase) no se sabe a qué petición corresponde
+        _row("bAIbysitter", "APPROVED - LLM Analysis: YES fine")
+    ])
+    examples = load_examples(database_url, None)
+    assert len(examples) == 1
+    request, label = examples[0]
+    assert label == 1
+    assert request.reason == "pay rent"
+    assert request.transactions[0].to == "0x2"
@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.main import app
+
+TRANSACTION = {
+    "safeAddress": "0x1",
+    "erc20TokenAddress": "0x2",
+    "reason": "no bots",
+    "transactions": [{"to": "0x3", "data": "0x", "value": "1"}]
+}
+
+def _waits(outcome: str) -> float:
+    return REGISTRY.get_sample_value("baiby_bot_wait_seconds_count", {"outcome": outcome}) or 0.0
+
+def test_no_connected_bots_is_not_reported_as_clean():
+    no_bots, no_warning = _waits("no_bots"), _waits("no_warning")
+    with TestClient(app) as client:
+        response = client.post("/agent/transaction/", json=TRANSACTION)
+    assert response.status_code == 200
+    assert response.json()["message"] == "Transaction APPROVED - No bots checked this transaction"
+    assert _waits("no_bots") == no_bots + 1
+    assert _waits("no_warning") == no_warning